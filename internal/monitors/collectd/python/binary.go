@@ -0,0 +1,129 @@
+package python
+
+import (
+	"encoding/json"
+	"fmt"
+	"math"
+	"strings"
+
+	collectdformat "github.com/signalfx/gateway/protocol/collectd/format"
+	"github.com/signalfx/golib/pointer"
+	"github.com/signalfx/signalfx-agent/internal/monitors/subproc"
+)
+
+// The dstypes in the order of their codes in the binary encoding (see
+// python/sfxcollectd/encoding.py)
+var dstypeNames = []string{"gauge", "derive", "counter", "absolute"}
+
+func floatOrNil(v float64) *float64 {
+	if math.IsNaN(v) {
+		return nil
+	}
+	return &v
+}
+
+// dataSetMessage is the announcement of the data set of a type by the Python
+// runner
+type dataSetMessage struct {
+	Type    string   `json:"type"`
+	Dsnames []string `json:"dsnames"`
+	Dstypes []string `json:"dstypes"`
+}
+
+// dataSet holds the dsnames and dstypes of a type in the form that they are
+// put into value lists
+type dataSet struct {
+	names []*string
+	types []*string
+}
+
+func newDataSet(msg *dataSetMessage) *dataSet {
+	ds := &dataSet{
+		names: make([]*string, len(msg.Dsnames)),
+		types: make([]*string, len(msg.Dstypes)),
+	}
+	for i := range msg.Dsnames {
+		ds.names[i] = pointer.String(msg.Dsnames[i])
+	}
+	for i := range msg.Dstypes {
+		ds.types[i] = pointer.String(strings.ToLower(msg.Dstypes[i]))
+	}
+	return ds
+}
+
+func decodeValueListHeader(d *subproc.BinaryDecoder) *collectdformat.JSONWriteFormat {
+	return &collectdformat.JSONWriteFormat{
+		Host:           pointer.String(d.Str()),
+		Plugin:         pointer.String(d.Str()),
+		PluginInstance: pointer.String(d.Str()),
+		TypeS:          pointer.String(d.Str()),
+		TypeInstance:   pointer.String(d.Str()),
+		Time:           floatOrNil(d.Float64()),
+		Interval:       floatOrNil(d.Float64()),
+	}
+}
+
+func decodeValueListMeta(d *subproc.BinaryDecoder, vl *collectdformat.JSONWriteFormat) error {
+	if meta := d.Bytes(int(d.Uint32())); len(meta) > 0 {
+		if err := json.Unmarshal(meta, &vl.Meta); err != nil {
+			return err
+		}
+	}
+	return d.Err()
+}
+
+// decodeBinaryValueList decodes a value list that was encoded with the binary
+// codec into the same struct that JSON value lists are decoded into.
+func decodeBinaryValueList(payload []byte) (*collectdformat.JSONWriteFormat, error) {
+	d := subproc.NewBinaryDecoder(payload)
+	vl := decodeValueListHeader(d)
+
+	count := int(d.Uint16())
+	vl.Dsnames = make([]*string, 0, count)
+	vl.Dstypes = make([]*string, 0, count)
+	vl.Values = make([]*float64, 0, count)
+
+	for i := 0; i < count; i++ {
+		name := d.Str()
+		code := int(d.Uint8())
+		value := d.Float64()
+		if d.Err() != nil {
+			return nil, d.Err()
+		}
+		if code >= len(dstypeNames) {
+			return nil, fmt.Errorf("unknown dstype code %d in value list", code)
+		}
+
+		vl.Dsnames = append(vl.Dsnames, pointer.String(name))
+		vl.Dstypes = append(vl.Dstypes, pointer.String(dstypeNames[code]))
+		vl.Values = append(vl.Values, floatOrNil(value))
+	}
+
+	if err := decodeValueListMeta(d, vl); err != nil {
+		return nil, err
+	}
+	return vl, nil
+}
+
+// decodeCompactValueList decodes a value list that was encoded with the
+// compact binary encoding.  Its dsnames and dstypes have to be filled in from
+// the data set of its type.
+func decodeCompactValueList(payload []byte) (*collectdformat.JSONWriteFormat, error) {
+	d := subproc.NewBinaryDecoder(payload)
+	vl := decodeValueListHeader(d)
+
+	count := int(d.Uint16())
+	vl.Values = make([]*float64, 0, count)
+	for i := 0; i < count; i++ {
+		value := d.Float64()
+		if d.Err() != nil {
+			return nil, d.Err()
+		}
+		vl.Values = append(vl.Values, floatOrNil(value))
+	}
+
+	if err := decodeValueListMeta(d, vl); err != nil {
+		return nil, err
+	}
+	return vl, nil
+}
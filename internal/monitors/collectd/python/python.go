@@ -7,12 +7,15 @@ package python
 import (
 	"bytes"
 	"context"
+	"encoding/json"
+	"errors"
 	"fmt"
 	"html/template"
 	"io"
 	"os"
 	"strconv"
 	"strings"
+	"sync"
 
 	"github.com/davecgh/go-spew/spew"
 	"github.com/mailru/easyjson"
@@ -31,6 +34,9 @@ import (
 )
 
 const messageTypeValueList subproc.MessageType = 100
+const messageTypeValueListBinary subproc.MessageType = 101
+const messageTypeDataSet subproc.MessageType = 102
+const messageTypeValueListCompact subproc.MessageType = 103
 
 func init() {
 	monitors.Register(&monitorMetadata, func() interface{} {
@@ -76,6 +82,81 @@ type Config struct {
 	// that are needed by your plugin.  If not specified, the runner will use
 	// the global collectd ../types.db file.
 	TypesDBPaths []string `yaml:"typesDBPaths" json:"typesDBPaths"`
+	// If greater than 0, value lists emitted by the plugin will be held in
+	// the Python runner for up to this many seconds and sent to the agent
+	// together in a single batch message, which greatly reduces the
+	// overhead of plugins that emit a lot of values.
+	BatchFlushIntervalSeconds float64 `yaml:"batchFlushIntervalSeconds" json:"batchFlushIntervalSeconds"`
+	// The number of bytes of pending value lists that will cause a batch to
+	// be sent before `batchFlushIntervalSeconds` has elapsed.  If not set,
+	// 64KiB will be used.
+	BatchMaxBytes int `yaml:"batchMaxBytes" json:"batchMaxBytes"`
+	// If greater than 0, the read callbacks registered by the plugin will be
+	// run on a fixed pool of this many threads instead of each callback
+	// getting its own thread.  This is useful for plugins that register a
+	// read callback per configured instance.
+	SchedulerWorkerCount int `yaml:"schedulerWorkerCount" json:"schedulerWorkerCount"`
+	// What to do when a read callback takes longer than its interval to run.
+	// `runLate` makes up every missed run back to back, `skip` drops the
+	// missed runs and waits for the next scheduled time, and `coalesce` does
+	// a single run right away in place of all the missed runs.  The number
+	// of overruns is reported in the agent's internal metrics.
+	OverrunPolicy string `yaml:"overrunPolicy" json:"overrunPolicy" default:"runLate"`
+	// If true, the read callbacks will first run at the next multiple of
+	// `intervalSeconds` on the wall clock (e.g. on the minute for an
+	// interval of 60), and every interval after that, so that datapoints
+	// from all hosts with synced clocks have lined up timestamps.
+	// Otherwise, they first run as soon as the monitor starts.
+	AlignToWallClock bool `yaml:"alignToWallClock" json:"alignToWallClock"`
+	// If true, the first run of each read callback is delayed by an offset
+	// within its interval that is derived from the monitor id and the
+	// host name, so that many monitors that start at the same time, such as
+	// when the agent restarts, don't all hit what they monitor at once.  The
+	// offset is the same every time the monitor starts.  If
+	// `alignToWallClock` is also set, the runs are aligned to the wall clock
+	// shifted by the offset.
+	SpreadStartTimes bool `yaml:"spreadStartTimes" json:"spreadStartTimes"`
+	// When a read callback raises an exception, the wait before its next run
+	// is doubled on each failure in a row, up to this many seconds, and goes
+	// back to the interval once it succeeds.  Only the first failure in a row
+	// is logged with a full traceback.  The current backoff is reported in
+	// the agent's internal metrics.  If not set, 300 (five minutes) will be
+	// used, so that it starts reporting again soon after whatever it reads
+	// from recovers.  Set it to the interval or less to run it on every
+	// interval even while it fails, without backing off.
+	MaxBackoffSeconds int `yaml:"maxBackoffSeconds" json:"maxBackoffSeconds"`
+	// If true, the time taken to import each module while the plugin module
+	// is imported is recorded, like `python -X importtime`, and the slowest
+	// imports are logged at the info level once it is loaded.  This is useful
+	// to find out why a plugin is slow to start.
+	ProfileImports bool `yaml:"profileImports" json:"profileImports"`
+	// If true, this monitor will run in a Python runner that is shared with
+	// all other monitors of this type that have this option set and the same
+	// `pythonBinary`, instead of getting its own runner process.  Each
+	// monitor imports its own copy of the plugin module, but anything the
+	// plugin does outside of its own modules is shared, so this should only
+	// be used with plugins that import `collectd` at the top of the module
+	// and don't keep global state elsewhere.  Value lists are not batched in
+	// a shared runner.  Log messages from the plugins in a shared runner are
+	// logged by the agent without the `monitorID` of the monitor that they
+	// came from, since logging is global to the runner.
+	SharedHost bool `yaml:"sharedHost" json:"-"`
+	// If true, the Python runner for this monitor will be forked from a
+	// long-running fork server that has already loaded the interpreter and
+	// the modules that runners commonly use, instead of being started from
+	// scratch.  This makes starting a monitor much cheaper, which matters
+	// when service discovery is creating and removing many of them.  There
+	// is one fork server per distinct Python runtime.  Not supported on
+	// Windows.
+	ForkServer bool `yaml:"forkServer" json:"-"`
+	// The payload codecs that the agent can decode, in order of preference.
+	// This is set by the agent and sent to the Python runner in the
+	// configure message.
+	Codecs []string `yaml:"-" json:"codecs"`
+	// Whether the agent keeps a table of the data sets that the Python runner
+	// announces so that value lists can be sent without their dsnames and
+	// dstypes.  This is set by the agent.
+	TypeTable bool `yaml:"-" json:"typeTable"`
 }
 
 // PythonConfig returns the embedded python.CoreConfig struct from the interface
@@ -88,6 +169,10 @@ type PyMonitor struct {
 	*subproc.MonitorCore
 
 	Output types.FilteringOutput
+
+	// The data sets announced by the Python runner, keyed by type.  This is
+	// only accessed by the goroutine that processes messages.
+	dataSets map[string]*dataSet
 }
 
 // Configure starts the subprocess and configures the plugin
@@ -131,6 +216,10 @@ func (m *PyMonitor) Configure(conf PyConfig) error {
 		}
 	}
 
+	pyconf.Codecs = []string{subproc.CodecBinary, subproc.CodecJSON}
+	pyconf.TypeTable = true
+	m.dataSets = make(map[string]*dataSet)
+
 	runtimeConf := subproc.DefaultPythonRuntimeConfig("sfxcollectd")
 	pyBin := conf.PythonConfig().PythonBinary
 	if pyBin != "" {
@@ -139,7 +228,13 @@ func (m *PyMonitor) Configure(conf PyConfig) error {
 		runtimeConf.Env = os.Environ()
 		runtimeConf.Args = append(runtimeConf.Args, args[1:]...)
 	}
+	runtimeConf.ForkServer = pyconf.ForkServer
 
+	if pyconf.SharedHost {
+		runtimeConf.Args = append(runtimeConf.Args, "--host")
+		runtimeConf.LogHandler = signalfx.HandleLogMessage
+		return m.MonitorCore.ConfigureInSharedSubproc(pyconf, runtimeConf, m)
+	}
 	return m.MonitorCore.ConfigureInSubproc(pyconf, runtimeConf, m)
 }
 
@@ -175,18 +270,53 @@ func (m *PyMonitor) handleMessage(msgType subproc.MessageType, payloadReader io.
 			return err
 		}
 
-		dps := make([]*datapoint.Datapoint, 0)
-		events := make([]*event.Event, 0)
+		if len(valueList.Dsnames) == 0 && valueList.Message == nil {
+			if err := m.fillDataSet(&valueList); err != nil {
+				return err
+			}
+		}
+		m.sendValueList(&valueList)
+
+	case messageTypeValueListBinary:
+		buf := buffs.Get().(*bytes.Buffer)
+		defer buffs.Put(buf)
+		buf.Reset()
+		if _, err := buf.ReadFrom(payloadReader); err != nil {
+			return err
+		}
+
+		valueList, err := decodeBinaryValueList(buf.Bytes())
+		if err != nil {
+			return err
+		}
 
-		collectdutil.ConvertWriteFormat((*mpCollectd.JSONWriteFormat)(&valueList), &dps, &events)
+		m.sendValueList(valueList)
+
+	case messageTypeDataSet:
+		var announced dataSetMessage
+		if err := json.NewDecoder(payloadReader).Decode(&announced); err != nil {
+			return err
+		}
+		m.dataSets[announced.Type] = newDataSet(&announced)
+
+	case messageTypeValueListCompact:
+		buf := buffs.Get().(*bytes.Buffer)
+		defer buffs.Put(buf)
+		buf.Reset()
+		if _, err := buf.ReadFrom(payloadReader); err != nil {
+			return err
+		}
 
-		for i := range dps {
-			m.Output.SendDatapoint(dps[i])
+		valueList, err := decodeCompactValueList(buf.Bytes())
+		if err != nil {
+			return err
 		}
-		for i := range events {
-			m.Output.SendEvent(events[i])
+		if err := m.fillDataSet(valueList); err != nil {
+			return err
 		}
 
+		m.sendValueList(valueList)
+
 	case subproc.MessageTypeLog:
 		return m.HandleLogMessage(payloadReader)
 	default:
@@ -196,6 +326,44 @@ func (m *PyMonitor) handleMessage(msgType subproc.MessageType, payloadReader io.
 	return nil
 }
 
+// fillDataSet sets the dsnames and dstypes of a value list that was sent
+// without them from the data set that was announced for its type
+func (m *PyMonitor) fillDataSet(valueList *collectdformat.JSONWriteFormat) error {
+	if valueList.TypeS == nil {
+		return errors.New("value list without dsnames has no type")
+	}
+	ds := m.dataSets[*valueList.TypeS]
+	if ds == nil {
+		return fmt.Errorf("no data set was announced for type %s", *valueList.TypeS)
+	}
+
+	// ConvertWriteFormat replaces the dstypes in place so the value list
+	// gets its own copy of them
+	valueList.Dsnames = ds.names
+	valueList.Dstypes = append(make([]*string, 0, len(ds.types)), ds.types...)
+	return nil
+}
+
+func (m *PyMonitor) sendValueList(valueList *collectdformat.JSONWriteFormat) {
+	dps := make([]*datapoint.Datapoint, 0)
+	events := make([]*event.Event, 0)
+
+	collectdutil.ConvertWriteFormat((*mpCollectd.JSONWriteFormat)(valueList), &dps, &events)
+
+	for i := range dps {
+		m.Output.SendDatapoint(dps[i])
+	}
+	for i := range events {
+		m.Output.SendEvent(events[i])
+	}
+}
+
+var buffs = sync.Pool{
+	New: func() interface{} {
+		return new(bytes.Buffer)
+	},
+}
+
 // HandleLogMessage just passes through the reader and logger to the main JSON
 // implementation
 func (m *PyMonitor) HandleLogMessage(logReader io.Reader) error {
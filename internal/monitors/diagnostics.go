@@ -138,10 +138,29 @@ func (mm *MonitorManager) BadConfigDiagnosticText() string {
 // InternalMetrics returns a list of datapoints about the internal status of
 // the monitors
 func (mm *MonitorManager) InternalMetrics() []*datapoint.Datapoint {
-	return []*datapoint.Datapoint{
+	out := []*datapoint.Datapoint{
 		sfxclient.Gauge("sfxagent.active_monitors", nil, int64(len(mm.activeMonitors))),
 		sfxclient.Gauge("sfxagent.configured_monitors", nil, int64(len(mm.monitorConfigs))),
 		sfxclient.Gauge("sfxagent.discovered_endpoints", nil, int64(len(mm.discoveredEndpoints))),
 		sfxclient.Gauge("sfxagent.k8s_leader", map[string]string{"leader_node": leadership.CurrentLeader()}, 1),
 	}
+
+	mm.lock.Lock()
+	defer mm.lock.Unlock()
+
+	for _, am := range mm.activeMonitors {
+		provider, ok := am.instance.(InternalMetricsProvider)
+		if !ok {
+			continue
+		}
+		for _, dp := range provider.InternalMetrics() {
+			if dp.Dimensions == nil {
+				dp.Dimensions = make(map[string]string)
+			}
+			dp.Dimensions["monitorType"] = am.config.MonitorConfigCore().Type
+			dp.Dimensions["monitorID"] = string(am.id)
+			out = append(out, dp)
+		}
+	}
+	return out
 }
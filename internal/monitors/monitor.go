@@ -146,6 +146,13 @@ type Shutdownable interface {
 	Shutdown()
 }
 
+// InternalMetricsProvider can be implemented by monitors that have metrics
+// about their own operation that should be included in the agent's internal
+// metrics.
+type InternalMetricsProvider interface {
+	InternalMetrics() []*datapoint.Datapoint
+}
+
 // Takes a generic MonitorConfig and pulls out monitor-specific config to
 // populate a clone of the config template that was registered for the monitor
 // type specified in conf.  This will also validate the config and return nil
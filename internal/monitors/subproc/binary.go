@@ -0,0 +1,106 @@
+package subproc
+
+import (
+	"encoding/binary"
+	"io"
+	"math"
+)
+
+// Payload codecs that subprocess runners can use to encode their messages.
+// The agent advertises the ones it supports to the subprocess in the
+// configure message, in order of preference.
+const (
+	CodecJSON   = "json"
+	CodecBinary = "binary"
+)
+
+// BinaryDecoder reads the primitive types of the binary payload codec (see
+// python/sfxrunner/codec.py).  Numbers are big-endian and strings are prefixed
+// by their length as a uint16.  The first error encountered is retained and
+// all subsequent reads return zero values, so callers only need to check Err
+// once they are done decoding.
+type BinaryDecoder struct {
+	buf []byte
+	err error
+}
+
+// NewBinaryDecoder returns a decoder that reads from the given payload.  The
+// payload must not be modified while the decoder is in use.
+func NewBinaryDecoder(payload []byte) *BinaryDecoder {
+	return &BinaryDecoder{buf: payload}
+}
+
+func (d *BinaryDecoder) next(n int) []byte {
+	if d.err != nil {
+		return nil
+	}
+	if len(d.buf) < n {
+		d.err = io.ErrUnexpectedEOF
+		d.buf = nil
+		return nil
+	}
+	b := d.buf[:n]
+	d.buf = d.buf[n:]
+	return b
+}
+
+// Uint8 reads a single byte
+func (d *BinaryDecoder) Uint8() uint8 {
+	if b := d.next(1); b != nil {
+		return b[0]
+	}
+	return 0
+}
+
+// Uint16 reads a 2 byte unsigned int
+func (d *BinaryDecoder) Uint16() uint16 {
+	if b := d.next(2); b != nil {
+		return binary.BigEndian.Uint16(b)
+	}
+	return 0
+}
+
+// Uint32 reads a 4 byte unsigned int
+func (d *BinaryDecoder) Uint32() uint32 {
+	if b := d.next(4); b != nil {
+		return binary.BigEndian.Uint32(b)
+	}
+	return 0
+}
+
+// Int64 reads an 8 byte signed int
+func (d *BinaryDecoder) Int64() int64 {
+	if b := d.next(8); b != nil {
+		return int64(binary.BigEndian.Uint64(b))
+	}
+	return 0
+}
+
+// Float64 reads an 8 byte IEEE 754 float
+func (d *BinaryDecoder) Float64() float64 {
+	if b := d.next(8); b != nil {
+		return math.Float64frombits(binary.BigEndian.Uint64(b))
+	}
+	return 0
+}
+
+// Bytes reads the next n bytes.  The returned slice references the payload so
+// it must be copied if it is to be retained.
+func (d *BinaryDecoder) Bytes(n int) []byte {
+	return d.next(n)
+}
+
+// Str reads a length-prefixed string
+func (d *BinaryDecoder) Str() string {
+	return string(d.next(int(d.Uint16())))
+}
+
+// Len returns the number of bytes that have not been read yet
+func (d *BinaryDecoder) Len() int {
+	return len(d.buf)
+}
+
+// Err returns the first error encountered while decoding
+func (d *BinaryDecoder) Err() error {
+	return d.err
+}
@@ -27,6 +27,20 @@ type RuntimeConfig struct {
 	Args   []string
 	// Envvars in the form "key=value".
 	Env []string
+	// If true, the subprocess is forked from a fork server that has already
+	// loaded the interpreter and common modules instead of being started
+	// from scratch.  This only works for Python runners that run a module
+	// with `-m`, and is ignored on Windows.
+	ForkServer bool
+	// If true, the agent's log level is sent to the subprocess as `logLevel`
+	// in the configure message, and in a MessageTypeSetLogLevel message
+	// whenever it changes if the subprocess says that it accepts them in its
+	// configure result.
+	ControlLogLevel bool
+	// Decodes a log message from the subprocess and logs it with the given
+	// logger.  Shared subprocesses use it for the logs that aren't from any
+	// monitor instance, which are otherwise logged as is.
+	LogHandler func(io.Reader, log.FieldLogger) error
 }
 
 // RuntimeCustomizable can be implemented by runners that use MonitorCore
@@ -60,6 +74,13 @@ type MonitorCore struct {
 	// Flag that should be set atomically to tell the goroutine that manages
 	// the subprocess whether the process is supposed to be alive or not.
 	shutdownCalled int32
+
+	// The latest counters and timings of the callbacks scheduled in the
+	// subprocess
+	statsLock       sync.Mutex
+	callbackStats   map[callbackKey]CallbackStats
+	callbackTimings map[callbackKey]CallbackTimings
+	timingBounds    []float64
 }
 
 // New returns a new uninitialized monitor core
@@ -83,6 +104,10 @@ func (mc *MonitorCore) Logger() log.FieldLogger {
 // run the subprocess and block until it returns.  Messages from stderr will be
 // logged as error logs in the agent.
 func (mc *MonitorCore) run(runtimeConf RuntimeConfig, stdin io.Reader, stdout io.Writer) error {
+	if runtimeConf.ForkServer && forkServerSupported() {
+		return mc.runForked(runtimeConf, stdin, stdout)
+	}
+
 	mc.logger.Debugf("Subprocess command: %s %v (env: %v)", runtimeConf.Binary, runtimeConf.Args, runtimeConf.Env)
 
 	cmd := exec.CommandContext(mc.ctx, runtimeConf.Binary, runtimeConf.Args...)
@@ -132,8 +157,15 @@ func (mc *MonitorCore) runWithRestart(runtimeConf RuntimeConfig, handler Message
 		}
 
 		go func() {
+			level := log.GetLevel()
+			msgBytes := configBytes
+			if runtimeConf.ControlLogLevel {
+				msgBytes = withLogLevel(configBytes, level)
+			}
+
 			mc.configCond.L.Lock()
-			mc.configResult = mc.doConfigure(messages, configBytes)
+			result, configErr := mc.doConfigure(messages, msgBytes)
+			mc.configResult = configErr
 			mc.configCond.L.Unlock()
 			// Tell the initial Configure method call that the subproc is done
 			// configuring.
@@ -145,7 +177,14 @@ func (mc *MonitorCore) runWithRestart(runtimeConf RuntimeConfig, handler Message
 				return
 			}
 
-			handler.ProcessMessages(mc.ctx, messages)
+			ctx, cancel := context.WithCancel(mc.ctx)
+			defer cancel()
+			if runtimeConf.ControlLogLevel && result.AcceptsLogLevel {
+				// Nothing else sends to the subprocess once it is configured
+				go watchLogLevel(ctx, level, messages.SendMessage)
+			}
+
+			handler.ProcessMessages(mc.ctx, &statsReceiver{MessageReceiver: messages, mc: mc})
 		}()
 
 		err = mc.run(runtimeConf, stdin, stdout)
@@ -226,21 +265,21 @@ func (mc *MonitorCore) ConfigureInSubproc(config config.MonitorCustomConfig,
 	return mc.configResult
 }
 
-func (mc *MonitorCore) doConfigure(messages *messageReadWriter, jsonBytes []byte) error {
+func (mc *MonitorCore) doConfigure(messages *messageReadWriter, jsonBytes []byte) (*configResult, error) {
 	if err := messages.SendMessage(MessageTypeConfigure, jsonBytes); err != nil {
-		return err
+		return nil, err
 	}
 
 	result, err := mc.waitForConfigure(messages)
 	if err != nil {
-		return err
+		return nil, err
 	}
 
 	if result.Error != nil {
-		return errors.New(*result.Error)
+		return result, errors.New(*result.Error)
 	}
 
-	return nil
+	return result, nil
 }
 
 func (mc *MonitorCore) waitForConfigure(messages MessageReceiver) (*configResult, error) {
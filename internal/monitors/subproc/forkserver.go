@@ -0,0 +1,273 @@
+package subproc
+
+import (
+	"bufio"
+	"encoding/binary"
+	"encoding/json"
+	"errors"
+	"fmt"
+	"io"
+	"io/ioutil"
+	"net"
+	"os"
+	"os/exec"
+	"path/filepath"
+	"runtime"
+	"strings"
+	"sync"
+	"time"
+
+	"github.com/signalfx/signalfx-agent/internal/utils"
+	log "github.com/sirupsen/logrus"
+)
+
+// The fork servers that have been started, keyed by the interpreter they run
+var forkServers = struct { //nolint: gochecknoglobals
+	sync.Mutex
+	servers map[string]*forkServer
+}{servers: map[string]*forkServer{}}
+
+// How long to wait for a fork server to start listening
+const forkServerStartTimeout = 30 * time.Second
+
+// forkServer is a Python process that has preloaded the modules that the
+// runners use and forks a new runner for each connection to its socket (see
+// python/sfxrunner/forkserver.py).  It is started the first time a runner
+// is needed and restarted if it has died by the next time one is needed.
+type forkServer struct {
+	lock        sync.Mutex
+	runtimeConf RuntimeConfig
+	socketPath  string
+	// Closed when the server process exits
+	exited chan struct{}
+}
+
+type forkRequest struct {
+	Module string   `json:"module,omitempty"`
+	Args   []string `json:"args,omitempty"`
+	// The pid of a runner forked by the server to kill instead of forking a
+	// new one
+	Kill int `json:"kill,omitempty"`
+}
+
+// How long to wait for the fork server to handle a kill request
+const forkServerKillTimeout = 5 * time.Second
+
+// splitModuleArgs splits the args of a runtime config that runs a module with
+// `-m` into the interpreter args, the module name, and the module args.
+func splitModuleArgs(args []string) ([]string, string, []string, error) {
+	for i := range args {
+		if args[i] == "-m" && i+1 < len(args) {
+			return args[:i], args[i+1], args[i+2:], nil
+		}
+	}
+	return nil, "", nil, errors.New("fork server can only be used with runtimes that run a module with -m")
+}
+
+func getForkServer(runtimeConf RuntimeConfig) (*forkServer, *forkRequest, error) {
+	interpreterArgs, module, moduleArgs, err := splitModuleArgs(runtimeConf.Args)
+	if err != nil {
+		return nil, nil, err
+	}
+
+	serverConf := RuntimeConfig{
+		Binary: runtimeConf.Binary,
+		Args:   append(append([]string{}, interpreterArgs...), "-m", "sfxrunner.forkserver"),
+		Env:    runtimeConf.Env,
+	}
+	key := runtimeConfigKey(serverConf)
+
+	forkServers.Lock()
+	defer forkServers.Unlock()
+
+	server := forkServers.servers[key]
+	if server == nil {
+		server = &forkServer{runtimeConf: serverConf}
+		forkServers.servers[key] = server
+	}
+	return server, &forkRequest{Module: module, Args: moduleArgs}, nil
+}
+
+// ensureRunning starts the server if it isn't running and returns the path
+// of the socket to connect to
+func (s *forkServer) ensureRunning(logger log.FieldLogger) (string, error) {
+	s.lock.Lock()
+	defer s.lock.Unlock()
+
+	if s.exited != nil {
+		select {
+		case <-s.exited:
+		default:
+			return s.socketPath, nil
+		}
+	}
+
+	dir, err := ioutil.TempDir("", "signalfx-forkserver")
+	if err != nil {
+		return "", err
+	}
+	socketPath := filepath.Join(dir, "runner.sock")
+
+	cmd := exec.Command(s.runtimeConf.Binary, append(append([]string{}, s.runtimeConf.Args...), socketPath)...)
+	cmd.SysProcAttr = procAttrs()
+	cmd.Env = s.runtimeConf.Env
+
+	stdout, err := cmd.StdoutPipe()
+	if err != nil {
+		return "", err
+	}
+	// The stderr of the forked runners also ends up here
+	stderr, err := cmd.StderrPipe()
+	if err != nil {
+		return "", err
+	}
+
+	if err := cmd.Start(); err != nil {
+		os.RemoveAll(dir)
+		return "", err
+	}
+
+	logger = logger.WithFields(log.Fields{"forkServerPID": cmd.Process.Pid})
+	logger.Info("Started subprocess fork server")
+
+	go func() {
+		scanner := utils.ChunkScanner(stderr)
+		for scanner.Scan() {
+			logger.Error(scanner.Text())
+		}
+	}()
+
+	ready := make(chan error, 1)
+	go func() {
+		line, err := bufio.NewReader(stdout).ReadString('\n')
+		if err == nil && strings.TrimSpace(line) != "ready" {
+			err = fmt.Errorf("unexpected output from fork server: %s", line)
+		}
+		ready <- err
+	}()
+
+	exited := make(chan struct{})
+	go func() {
+		if err := cmd.Wait(); err != nil {
+			logger.WithError(err).Error("Subprocess fork server shutdown with error")
+		}
+		os.RemoveAll(dir)
+		close(exited)
+	}()
+
+	select {
+	case err = <-ready:
+	case <-time.After(forkServerStartTimeout):
+		err = errors.New("timed out waiting for fork server to start")
+	}
+	if err != nil {
+		_ = cmd.Process.Kill()
+		return "", err
+	}
+
+	s.socketPath = socketPath
+	s.exited = exited
+	return socketPath, nil
+}
+
+// sendForkRequest sends a single request to the fork server listening on the
+// given socket and returns the connection to it
+func sendForkRequest(socketPath string, request *forkRequest) (net.Conn, error) {
+	conn, err := net.Dial("unix", socketPath)
+	if err != nil {
+		return nil, err
+	}
+
+	requestBytes, err := json.Marshal(request)
+	if err != nil {
+		conn.Close()
+		return nil, err
+	}
+	if _, err := conn.Write(append(requestBytes, '\n')); err != nil {
+		conn.Close()
+		return nil, err
+	}
+	return conn, nil
+}
+
+// killForked asks the fork server to kill a runner that it forked.  The
+// runner isn't a child of the agent, so it can't be safely signalled by pid
+// from here since the pid could have been reused once the runner exited.
+// The server only kills it if it is still one of its own unreaped children.
+func killForked(socketPath string, pid int) error {
+	conn, err := sendForkRequest(socketPath, &forkRequest{Kill: pid})
+	if err != nil {
+		return err
+	}
+	defer conn.Close()
+
+	// The server closes the connection once it has handled the request
+	if err := conn.SetReadDeadline(time.Now().Add(forkServerKillTimeout)); err != nil {
+		return err
+	}
+	_, err = io.Copy(ioutil.Discard, conn)
+	return err
+}
+
+// runForked forks a runner from the fork server for the given runtime config
+// and blocks until it exits.  It takes the place of running the subprocess
+// directly.
+func (mc *MonitorCore) runForked(runtimeConf RuntimeConfig, stdin io.Reader, stdout io.Writer) error {
+	server, request, err := getForkServer(runtimeConf)
+	if err != nil {
+		return err
+	}
+
+	socketPath, err := server.ensureRunning(mc.logger)
+	if err != nil {
+		return err
+	}
+
+	conn, err := sendForkRequest(socketPath, request)
+	if err != nil {
+		return err
+	}
+	defer conn.Close()
+
+	var pidBytes [4]byte
+	if _, err := io.ReadFull(conn, pidBytes[:]); err != nil {
+		return err
+	}
+	pid := int(binary.BigEndian.Uint32(pidBytes[:]))
+
+	mc.logger = mc.logger.WithFields(log.Fields{
+		"runnerPID": pid,
+	})
+	mc.logger.Info("Forked subprocess runner")
+
+	done := make(chan struct{})
+	defer close(done)
+
+	// The runner is not a child of the agent so it has to be killed through
+	// the fork server, like exec.CommandContext does for spawned runners.
+	// If that fails, closing the connection closes the runner's stdin, which
+	// makes it shut down on its own.
+	go func() {
+		select {
+		case <-mc.ctx.Done():
+			if err := killForked(socketPath, pid); err != nil {
+				mc.logger.WithError(err).Warn("Could not kill forked runner through the fork server, closing its connection")
+				conn.Close()
+			}
+		case <-done:
+		}
+	}()
+
+	go func() {
+		_, _ = io.Copy(conn, stdin)
+	}()
+
+	// The connection is closed once the runner exits
+	_, err = io.Copy(stdout, conn)
+	return err
+}
+
+// forkServerSupported returns whether runners can be forked on this platform
+func forkServerSupported() bool {
+	return runtime.GOOS != "windows"
+}
@@ -0,0 +1,63 @@
+package subproc
+
+import (
+	"bufio"
+	"io/ioutil"
+	"net"
+	"os"
+	"path/filepath"
+	"reflect"
+	"testing"
+)
+
+func TestSplitModuleArgs(t *testing.T) {
+	interpreterArgs, module, moduleArgs, err := splitModuleArgs([]string{"-u", "-m", "sfxcollectd", "--host"})
+	if err != nil {
+		t.Fatalf("unexpected error: %v", err)
+	}
+	if !reflect.DeepEqual(interpreterArgs, []string{"-u"}) || module != "sfxcollectd" ||
+		!reflect.DeepEqual(moduleArgs, []string{"--host"}) {
+		t.Errorf("got %v, %s, %v", interpreterArgs, module, moduleArgs)
+	}
+
+	if _, _, _, err := splitModuleArgs([]string{"-u", "script.py"}); err == nil {
+		t.Error("expected error for runtime without a module")
+	}
+}
+
+func TestKillForkedSendsKillRequest(t *testing.T) {
+	dir, err := ioutil.TempDir("", "forkserver-test")
+	if err != nil {
+		t.Fatal(err)
+	}
+	defer os.RemoveAll(dir)
+
+	socketPath := filepath.Join(dir, "runner.sock")
+	listener, err := net.Listen("unix", socketPath)
+	if err != nil {
+		t.Fatal(err)
+	}
+	defer listener.Close()
+
+	requests := make(chan string, 1)
+	go func() {
+		conn, err := listener.Accept()
+		if err != nil {
+			return
+		}
+		defer conn.Close()
+		line, _ := bufio.NewReader(conn).ReadString('\n')
+		requests <- line
+	}()
+
+	if err := killForked(socketPath, 1234); err != nil {
+		t.Fatalf("unexpected error: %v", err)
+	}
+	if req := <-requests; req != `{"kill":1234}`+"\n" {
+		t.Errorf("got request %q", req)
+	}
+
+	if err := killForked(filepath.Join(dir, "missing.sock"), 1234); err == nil {
+		t.Error("expected error when the fork server isn't listening")
+	}
+}
@@ -0,0 +1,520 @@
+package subproc
+
+import (
+	"bytes"
+	"context"
+	"encoding/binary"
+	"encoding/json"
+	"errors"
+	"fmt"
+	"io"
+	"io/ioutil"
+	"strings"
+	"sync"
+	"sync/atomic"
+	"time"
+
+	"github.com/signalfx/signalfx-agent/internal/core/config"
+	log "github.com/sirupsen/logrus"
+)
+
+// The shared hosts that are running, keyed by their runtime config
+var sharedHosts = struct { //nolint: gochecknoglobals
+	sync.Mutex
+	hosts map[string]*sharedHost
+}{hosts: map[string]*sharedHost{}}
+
+// The number of frames that are held for an instance that is slow to
+// process them before its new frames are dropped.  Frames are dropped
+// instead of waited on so that one slow instance doesn't hold up the frames
+// of all of the other instances.
+const instanceFrameBuffer = 100
+
+// sharedHost runs a single subprocess that hosts many monitor instances.
+// Frames to and from each instance are wrapped in MessageTypeInstance frames
+// that start with the id of the instance.  Log messages are not wrapped since
+// logging is global to the subprocess.
+type sharedHost struct {
+	key string
+	// The process management is the same as for a single monitor
+	core *MonitorCore
+
+	// Guards instances, nextID and pipe, and is held while the pipes are
+	// swapped so that instances that are added during a restart are
+	// configured once.  It is never held while writing to the pipes, since
+	// those writes block until the subprocess reads them.
+	lock      sync.Mutex
+	instances map[uint32]*hostInstance
+	nextID    uint32
+	// The pipes to the current subprocess, or nil while it is not running
+	pipe *hostPipe
+
+	// Whether the log level is sent to the subprocess (see
+	// RuntimeConfig.ControlLogLevel), and the level that it was last sent.
+	// The level is sent in the config of each instance, and changes to it
+	// are watched for once an instance says that it accepts them.  These
+	// are guarded by lock.
+	controlLogLevel  bool
+	logLevel         log.Level
+	watchingLogLevel bool
+	// Done when the current subprocess stops
+	processCtx context.Context
+	// Decodes and logs the log messages that aren't from any instance
+	logHandler func(io.Reader, log.FieldLogger) error
+}
+
+// hostInstance is a single monitor instance in a shared host.  It receives
+// the frames of that instance from the host.
+type hostInstance struct {
+	id          uint32
+	handler     MessageHandler
+	logger      log.FieldLogger
+	configBytes []byte
+	frames      chan instanceFrame
+	// The number of frames dropped because the instance was too slow
+	droppedFrames int64
+	// Gets the result of the first configure call to the instance, which
+	// the monitor waits on.  The results of reconfiguring it after the
+	// subprocess restarts are only logged.
+	configured chan error
+	// Whether the result in `configured` is still being waited on.  Guarded
+	// by the host's lock.
+	awaitingConfigure bool
+	// Closed when the instance is removed from the host
+	done chan struct{}
+}
+
+// hostPipe is the pipes to a single run of the subprocess
+type hostPipe struct {
+	// Held while writing a frame so that frames aren't interleaved.  When
+	// both are needed, this is locked before the host's lock.
+	writeLock sync.Mutex
+	messages  *messageReadWriter
+}
+
+type instanceFrame struct {
+	msgType MessageType
+	payload []byte
+}
+
+// RecvMessage blocks until the instance gets a frame from the host.  It
+// returns io.EOF once the instance has been removed from the host.
+func (i *hostInstance) RecvMessage() (MessageType, io.Reader, error) {
+	select {
+	case frame := <-i.frames:
+		return frame.msgType, bytes.NewReader(frame.payload), nil
+	case <-i.done:
+		return MessageTypeNone, nil, io.EOF
+	}
+}
+
+func runtimeConfigKey(runtimeConf RuntimeConfig) string {
+	return fmt.Sprintf("%s\x00%s\x00%s", runtimeConf.Binary, strings.Join(runtimeConf.Args, "\x00"),
+		strings.Join(runtimeConf.Env, "\x00"))
+}
+
+// addToSharedHost adds a new instance to the shared host for the given
+// runtime config, starting the host if it isn't running yet.
+func addToSharedHost(runtimeConf RuntimeConfig, handler MessageHandler, logger log.FieldLogger,
+	configBytes []byte) (*sharedHost, *hostInstance) {
+	sharedHosts.Lock()
+	defer sharedHosts.Unlock()
+
+	key := runtimeConfigKey(runtimeConf)
+	host := sharedHosts.hosts[key]
+	if host == nil {
+		host = &sharedHost{
+			key:             key,
+			core:            New(),
+			instances:       make(map[uint32]*hostInstance),
+			controlLogLevel: runtimeConf.ControlLogLevel,
+			logHandler:      runtimeConf.LogHandler,
+		}
+		sharedHosts.hosts[key] = host
+		go host.runWithRestart(runtimeConf)
+	}
+
+	return host, host.addInstance(handler, logger, configBytes)
+}
+
+func (h *sharedHost) addInstance(handler MessageHandler, logger log.FieldLogger, configBytes []byte) *hostInstance {
+	h.lock.Lock()
+
+	h.nextID++
+	inst := &hostInstance{
+		id:                h.nextID,
+		handler:           handler,
+		logger:            logger,
+		configBytes:       configBytes,
+		frames:            make(chan instanceFrame, instanceFrameBuffer),
+		configured:        make(chan error, 1),
+		awaitingConfigure: true,
+		done:              make(chan struct{}),
+	}
+	h.instances[inst.id] = inst
+	config := h.instanceConfig(inst)
+	pipe := h.pipe
+	h.lock.Unlock()
+
+	// If the subprocess isn't running yet, the instance will be configured
+	// once it is.  The config is sent in the background since the pipe might
+	// be full of configs that a subprocess that is starting hasn't read yet.
+	if pipe != nil {
+		go h.configureInstance(pipe, inst, config)
+	}
+	return inst
+}
+
+// removeInstance shuts down the instance in the subprocess.  The subprocess
+// itself is shut down along with the last instance.
+func (h *sharedHost) removeInstance(inst *hostInstance) {
+	if !h.deleteInstance(inst) {
+		return
+	}
+
+	if err := h.send(inst.id, MessageTypeShutdown, nil); err != nil && err != errHostNotRunning {
+		h.core.logger.WithError(err).Error("Could not shut down instance in shared subprocess")
+	}
+}
+
+// deleteInstance removes the instance from the host, and shuts down the host
+// if it was the last one.  It returns whether the instance still has to be
+// shut down in the subprocess.
+func (h *sharedHost) deleteInstance(inst *hostInstance) bool {
+	sharedHosts.Lock()
+	defer sharedHosts.Unlock()
+
+	h.lock.Lock()
+	defer h.lock.Unlock()
+
+	if _, ok := h.instances[inst.id]; !ok {
+		return false
+	}
+	delete(h.instances, inst.id)
+	close(inst.done)
+
+	if len(h.instances) == 0 {
+		delete(sharedHosts.hosts, h.key)
+		h.core.Shutdown()
+		return false
+	}
+	return true
+}
+
+var errHostNotRunning = errors.New("shared subprocess is not running")
+
+func (h *sharedHost) currentPipe() *hostPipe {
+	h.lock.Lock()
+	defer h.lock.Unlock()
+	return h.pipe
+}
+
+func (h *sharedHost) send(id uint32, msgType MessageType, payload []byte) error {
+	pipe := h.currentPipe()
+	if pipe == nil {
+		return errHostNotRunning
+	}
+
+	pipe.writeLock.Lock()
+	defer pipe.writeLock.Unlock()
+	return sendInstanceFrame(pipe.messages, id, msgType, payload)
+}
+
+func sendInstanceFrame(messages *messageReadWriter, id uint32, msgType MessageType, payload []byte) error {
+	frame := make([]byte, 12, 12+len(payload))
+	binary.BigEndian.PutUint32(frame[0:4], id)
+	binary.BigEndian.PutUint32(frame[4:8], uint32(msgType))
+	binary.BigEndian.PutUint32(frame[8:12], uint32(len(payload)))
+	return messages.SendMessage(MessageTypeInstance, append(frame, payload...))
+}
+
+// configureInstance sends the config of the instance through the given
+// pipes.  Nothing is sent if the subprocess has been restarted since, because
+// every instance is configured again in the new one, or if the instance has
+// been removed.  The check is made while holding the pipe's write lock so
+// that the shutdown frame of an instance that is removed right after is
+// written after its config.
+func (h *sharedHost) configureInstance(pipe *hostPipe, inst *hostInstance, config []byte) {
+	pipe.writeLock.Lock()
+	defer pipe.writeLock.Unlock()
+
+	if h.currentPipe() != pipe {
+		return
+	}
+	select {
+	case <-inst.done:
+		return
+	default:
+	}
+
+	if err := sendInstanceFrame(pipe.messages, inst.id, MessageTypeConfigure, config); err != nil {
+		// The instance is configured again once the subprocess restarts
+		inst.logger.WithError(err).Error("Could not configure instance in shared subprocess")
+	}
+}
+
+// sendToHost sends a message that is for the subprocess as a whole instead of
+// a single instance
+func (h *sharedHost) sendToHost(msgType MessageType, payload []byte) error {
+	pipe := h.currentPipe()
+	if pipe == nil {
+		return errHostNotRunning
+	}
+
+	pipe.writeLock.Lock()
+	defer pipe.writeLock.Unlock()
+	return pipe.messages.SendMessage(msgType, payload)
+}
+
+// instanceConfig returns the config to send to the subprocess for the given
+// instance.  It must be called with lock held.
+func (h *sharedHost) instanceConfig(inst *hostInstance) []byte {
+	if !h.controlLogLevel {
+		return inst.configBytes
+	}
+	// The log level applies to the whole subprocess, but every instance gets
+	// the same one
+	h.logLevel = log.GetLevel()
+	return withLogLevel(inst.configBytes, h.logLevel)
+}
+
+// watchLogLevel starts sending changes to the agent's log level to the
+// current subprocess, unless it is already doing so.  It is called once an
+// instance says that the subprocess accepts them.
+func (h *sharedHost) watchLogLevel() {
+	h.lock.Lock()
+	defer h.lock.Unlock()
+
+	if !h.controlLogLevel || h.watchingLogLevel || h.processCtx == nil {
+		return
+	}
+	h.watchingLogLevel = true
+	go watchLogLevel(h.processCtx, h.logLevel, h.sendToHost)
+}
+
+type pendingConfigure struct {
+	inst   *hostInstance
+	config []byte
+}
+
+// setPipe swaps in the pipes of a new subprocess and returns the configs of
+// all of the instances, including any that were configured in a previous
+// subprocess that has since died.  They have to be sent with
+// configureInstances once the subprocess is running, since nothing reads the
+// pipe before then.  Instances that are added after this are configured by
+// addInstance.
+func (h *sharedHost) setPipe(ctx context.Context, pipe *hostPipe) []pendingConfigure {
+	h.lock.Lock()
+	defer h.lock.Unlock()
+
+	h.pipe = pipe
+	h.processCtx = ctx
+	h.watchingLogLevel = false
+
+	if pipe == nil {
+		return nil
+	}
+
+	pending := make([]pendingConfigure, 0, len(h.instances))
+	for _, inst := range h.instances {
+		pending = append(pending, pendingConfigure{inst: inst, config: h.instanceConfig(inst)})
+	}
+	return pending
+}
+
+func (h *sharedHost) configureInstances(pipe *hostPipe, pending []pendingConfigure) {
+	for _, p := range pending {
+		h.configureInstance(pipe, p.inst, p.config)
+	}
+}
+
+// runWithRestart runs the subprocess, restarting it if it stops while there
+// are still instances in it.
+func (h *sharedHost) runWithRestart(runtimeConf RuntimeConfig) {
+	for {
+		messages, stdin, stdout, err := makePipes()
+		if err != nil {
+			h.core.logger.WithError(err).Error("Couldn't create pipes for shared subprocess")
+			return
+		}
+
+		ctx, cancel := context.WithCancel(h.core.ctx)
+		// The configs are sent as the subprocess reads them, like
+		// MonitorCore.runWithRestart does, since there can be more of them
+		// than fit in the pipe's buffer.
+		pipe := &hostPipe{messages: messages}
+		go h.configureInstances(pipe, h.setPipe(ctx, pipe))
+		go h.demux(messages)
+
+		err = h.core.run(runtimeConf, stdin, stdout)
+		cancel()
+		h.setPipe(ctx, nil)
+
+		stdin.Close()
+		stdout.Close()
+		messages.Close()
+
+		if err != nil {
+			h.core.logger.WithError(err).Error("Shared subprocess runner shutdown with error")
+		}
+		if h.core.ShutdownCalled() {
+			return
+		}
+		h.core.logger.Error("Restarting shared subprocess runner")
+
+		time.Sleep(2 * time.Second)
+	}
+}
+
+// demux routes the frames from the subprocess to their instance until the
+// pipe is closed.
+func (h *sharedHost) demux(messages MessageReceiver) {
+	for {
+		msgType, payloadReader, err := messages.RecvMessage()
+		if err != nil {
+			return
+		}
+
+		payload, err := ioutil.ReadAll(payloadReader)
+		if err != nil {
+			h.core.logger.WithError(err).Error("Could not read message from shared subprocess")
+			return
+		}
+
+		switch msgType {
+		case MessageTypeInstance:
+			id, frame, err := parseInstanceFrame(payload)
+			if err != nil {
+				h.core.logger.WithError(err).Error("Could not parse instance message from shared subprocess")
+				continue
+			}
+			h.route(id, frame)
+		case MessageTypeLog:
+			h.handleLog(payload)
+		default:
+			h.core.logger.Errorf("Got unexpected message code %d from shared subprocess", msgType)
+		}
+	}
+}
+
+func parseInstanceFrame(payload []byte) (uint32, instanceFrame, error) {
+	if len(payload) < 12 {
+		return 0, instanceFrame{}, fmt.Errorf("instance frame of %d bytes is too short", len(payload))
+	}
+
+	id := binary.BigEndian.Uint32(payload[0:4])
+	msgType := MessageType(binary.BigEndian.Uint32(payload[4:8]))
+	size := binary.BigEndian.Uint32(payload[8:12])
+	if int(size) != len(payload)-12 {
+		return 0, instanceFrame{}, fmt.Errorf("instance frame size %d does not match payload of %d bytes", size, len(payload)-12)
+	}
+	return id, instanceFrame{msgType: msgType, payload: payload[12:]}, nil
+}
+
+func (h *sharedHost) route(id uint32, frame instanceFrame) {
+	h.lock.Lock()
+	inst := h.instances[id]
+	h.lock.Unlock()
+
+	// The instance has already been removed
+	if inst == nil {
+		return
+	}
+
+	switch frame.msgType {
+	case MessageTypeConfigureResult:
+		var result configResult
+		var err error
+		if jsonErr := json.Unmarshal(frame.payload, &result); jsonErr != nil {
+			err = jsonErr
+		} else if result.Error != nil {
+			err = errors.New(*result.Error)
+		}
+		if result.AcceptsLogLevel {
+			h.watchLogLevel()
+		}
+
+		h.lock.Lock()
+		awaiting := inst.awaitingConfigure
+		inst.awaitingConfigure = false
+		h.lock.Unlock()
+
+		if awaiting {
+			inst.configured <- err
+		} else if err != nil {
+			// Nobody is waiting on a reconfigure after a restart
+			inst.logger.WithError(err).Error("Could not reconfigure instance in shared subprocess")
+		}
+	case MessageTypeLog:
+		if err := inst.handler.HandleLogMessage(bytes.NewReader(frame.payload)); err != nil {
+			inst.logger.WithError(err).Error("Could not read log message from shared subprocess")
+		}
+	default:
+		select {
+		case inst.frames <- frame:
+		default:
+			dropped := atomic.AddInt64(&inst.droppedFrames, 1)
+			if dropped&(dropped-1) == 0 {
+				// Only log when the count hits a power of two so that a
+				// stuck instance doesn't flood the log
+				inst.logger.Warnf("Dropped %d messages from shared subprocess since the monitor is too slow to process them",
+					dropped)
+			}
+		}
+	}
+}
+
+// handleLog logs the messages that aren't from any particular instance with
+// the host's own logger, since they aren't about any one monitor.
+func (h *sharedHost) handleLog(payload []byte) {
+	if h.logHandler == nil {
+		h.core.logger.Info(string(payload))
+		return
+	}
+	if err := h.logHandler(bytes.NewReader(payload), h.core.logger); err != nil {
+		h.core.logger.WithError(err).Error("Could not read log message from shared subprocess")
+	}
+}
+
+// ConfigureInSharedSubproc is like ConfigureInSubproc but configures the
+// monitor as one of many instances in a single subprocess that is shared by
+// all monitors with the same runtime config.  The subprocess runner must
+// support MessageTypeInstance frames.  Shutdown removes the instance from the
+// subprocess, which is shut down once it has no instances left.
+func (mc *MonitorCore) ConfigureInSharedSubproc(config config.MonitorCustomConfig,
+	runtimeConfig *RuntimeConfig, handler MessageHandler) error {
+	if mc.handler != nil {
+		panic("ConfigureInSharedSubproc should only be called once")
+	}
+
+	mc.handler = handler
+	mc.logger = mc.logger.WithFields(log.Fields{
+		"monitorID":   config.MonitorConfigCore().MonitorID,
+		"monitorType": config.MonitorConfigCore().Type,
+	})
+
+	jsonBytes, err := json.Marshal(config)
+	if err != nil {
+		return err
+	}
+
+	host, inst := addToSharedHost(*runtimeConfig, handler, mc.logger, jsonBytes)
+
+	select {
+	case err = <-inst.configured:
+	case <-mc.ctx.Done():
+		err = context.Canceled
+	}
+	if err != nil {
+		host.removeInstance(inst)
+		return err
+	}
+
+	go func() {
+		<-mc.ctx.Done()
+		host.removeInstance(inst)
+	}()
+
+	go handler.ProcessMessages(mc.ctx, &statsReceiver{MessageReceiver: inst, mc: mc})
+	return nil
+}
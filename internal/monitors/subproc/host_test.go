@@ -0,0 +1,185 @@
+package subproc
+
+import (
+	"bytes"
+	"context"
+	"encoding/binary"
+	"io"
+	"io/ioutil"
+	"testing"
+	"time"
+
+	log "github.com/sirupsen/logrus"
+)
+
+type logCountingHandler struct {
+	logs int
+}
+
+func (h *logCountingHandler) ProcessMessages(context.Context, MessageReceiver) {}
+
+func (h *logCountingHandler) HandleLogMessage(io.Reader) error {
+	h.logs++
+	return nil
+}
+
+func instanceFrameBytes(id uint32, msgType MessageType, payload []byte) []byte {
+	var header [4]byte
+	binary.BigEndian.PutUint32(header[:], id)
+	return frame(MessageTypeInstance, append(header[:], frame(msgType, payload)...))
+}
+
+func TestSharedHostRoutesInstanceFrames(t *testing.T) {
+	handler := &logCountingHandler{}
+	hostLogs := &logCountingHandler{}
+	host := &sharedHost{core: New(), instances: make(map[uint32]*hostInstance),
+		logHandler: func(r io.Reader, _ log.FieldLogger) error { return hostLogs.HandleLogMessage(r) }}
+	first := host.addInstance(handler, log.StandardLogger(), nil)
+	second := host.addInstance(handler, log.StandardLogger(), nil)
+
+	var stream []byte
+	stream = append(stream, instanceFrameBytes(first.id, MessageTypeConfigureResult, []byte(`{"error":null}`))...)
+	stream = append(stream, instanceFrameBytes(second.id, MessageTypeConfigureResult, []byte(`{"error":"bad"}`))...)
+	stream = append(stream, instanceFrameBytes(second.id, 100, []byte(`{"a":1}`))...)
+	stream = append(stream, instanceFrameBytes(first.id, MessageTypeLog, []byte(`{}`))...)
+	stream = append(stream, frame(MessageTypeLog, []byte(`{}`))...)
+	// Frames for instances that are gone are dropped
+	stream = append(stream, instanceFrameBytes(99, 100, []byte(`{"a":2}`))...)
+	stream = append(stream, frame(MessageTypeInstance, []byte{0, 0})...)
+
+	host.demux(&messageReadWriter{
+		Reader: ioutil.NopCloser(bytes.NewReader(stream)),
+	})
+
+	if err := <-first.configured; err != nil {
+		t.Errorf("got configure error %v for first instance", err)
+	}
+	if err := <-second.configured; err == nil || err.Error() != "bad" {
+		t.Errorf("got configure error %v for second instance, want bad", err)
+	}
+
+	msgType, payloadReader, err := second.RecvMessage()
+	if err != nil || msgType != 100 {
+		t.Fatalf("got type %d and error %v, want type 100", msgType, err)
+	}
+	payload, _ := ioutil.ReadAll(payloadReader)
+	if string(payload) != `{"a":1}` {
+		t.Errorf("got payload %s", payload)
+	}
+	if len(first.frames) != 0 || len(second.frames) != 0 {
+		t.Error("expected no more frames")
+	}
+
+	if handler.logs != 1 || hostLogs.logs != 1 {
+		t.Errorf("got %d instance logs and %d host logs, want 1 of each", handler.logs, hostLogs.logs)
+	}
+
+	// The result of reconfiguring an instance after a restart isn't waited on
+	host.route(first.id, instanceFrame{msgType: MessageTypeConfigureResult, payload: []byte(`{"error":"bad"}`)})
+	if len(first.configured) != 0 {
+		t.Error("got a configure result that nobody is waiting on")
+	}
+
+	// Frames for an instance that is too slow are dropped instead of holding
+	// up the other instances
+	for i := 0; i < instanceFrameBuffer+10; i++ {
+		host.route(first.id, instanceFrame{msgType: 100})
+	}
+	if len(first.frames) != instanceFrameBuffer || first.droppedFrames != 10 {
+		t.Errorf("got %d frames and %d dropped", len(first.frames), first.droppedFrames)
+	}
+
+	host.removeInstance(second)
+	if _, _, err := second.RecvMessage(); err != io.EOF {
+		t.Errorf("got error %v after removing instance, want EOF", err)
+	}
+}
+
+func TestSharedHostWatchesLogLevelOnlyWhenAccepted(t *testing.T) {
+	ctx, cancel := context.WithCancel(context.Background())
+	defer cancel()
+
+	host := &sharedHost{core: New(), instances: make(map[uint32]*hostInstance), controlLogLevel: true, processCtx: ctx}
+	old := host.addInstance(&logCountingHandler{}, log.StandardLogger(), nil)
+	current := host.addInstance(&logCountingHandler{}, log.StandardLogger(), nil)
+
+	// Older runners don't say anything about log levels
+	host.route(old.id, instanceFrame{msgType: MessageTypeConfigureResult, payload: []byte(`{"error":null}`)})
+	if host.watchingLogLevel {
+		t.Fatal("watching log level of a runner that doesn't accept it")
+	}
+
+	host.route(current.id, instanceFrame{msgType: MessageTypeConfigureResult,
+		payload: []byte(`{"error":null,"acceptsLogLevel":true}`)})
+	if !host.watchingLogLevel {
+		t.Fatal("not watching log level of a runner that accepts it")
+	}
+}
+
+func TestSharedHostConfiguresMoreInstancesThanFitInThePipe(t *testing.T) {
+	host := &sharedHost{core: New(), instances: make(map[uint32]*hostInstance)}
+	handler := &logCountingHandler{}
+
+	// Much more config than the 64KiB that a pipe buffers
+	config := bytes.Repeat([]byte("a"), 1024)
+	const instanceCount = 300
+	for i := 0; i < instanceCount; i++ {
+		host.addInstance(handler, log.StandardLogger(), config)
+	}
+
+	messages, stdin, stdout, err := makePipes()
+	if err != nil {
+		t.Fatal(err)
+	}
+	defer stdin.Close()
+	defer stdout.Close()
+	defer messages.Close()
+
+	// Like a restart, where nothing reads the pipe until the subprocess has
+	// started
+	pipe := &hostPipe{messages: messages}
+	go host.configureInstances(pipe, host.setPipe(context.Background(), pipe))
+
+	added := make(chan *hostInstance)
+	go func() {
+		inst := host.addInstance(handler, log.StandardLogger(), config)
+		host.route(inst.id, instanceFrame{msgType: 100, payload: []byte(`{}`)})
+		added <- inst
+	}()
+
+	var last *hostInstance
+	select {
+	case last = <-added:
+	case <-time.After(5 * time.Second):
+		t.Fatal("host is stuck writing to a pipe that isn't being read")
+	}
+
+	subproc := &messageReadWriter{Reader: stdin}
+	recvInstanceFrame := func() (uint32, instanceFrame) {
+		msgType, payloadReader, err := subproc.RecvMessage()
+		if err != nil || msgType != MessageTypeInstance {
+			t.Fatalf("got type %d and error %v, want an instance frame", msgType, err)
+		}
+		payload, _ := ioutil.ReadAll(payloadReader)
+		id, frame, err := parseInstanceFrame(payload)
+		if err != nil {
+			t.Fatal(err)
+		}
+		return id, frame
+	}
+
+	configured := map[uint32]bool{}
+	for len(configured) < instanceCount+1 {
+		id, frame := recvInstanceFrame()
+		if frame.msgType != MessageTypeConfigure || configured[id] {
+			t.Fatalf("got frame of type %d for instance %d, want a single configure frame", frame.msgType, id)
+		}
+		configured[id] = true
+	}
+
+	// Nothing else is in the pipe ahead of the shutdown of a removed instance
+	go host.removeInstance(last)
+	if id, frame := recvInstanceFrame(); id != last.id || frame.msgType != MessageTypeShutdown {
+		t.Errorf("got frame of type %d for instance %d, want shutdown of %d", frame.msgType, id, last.id)
+	}
+}
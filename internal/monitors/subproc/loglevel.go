@@ -0,0 +1,65 @@
+package subproc
+
+import (
+	"context"
+	"encoding/json"
+	"time"
+
+	log "github.com/sirupsen/logrus"
+)
+
+// How often the agent's log level is checked for changes that need to be sent
+// to the subprocesses
+const logLevelCheckInterval = 5 * time.Second
+
+type logLevelMessage struct {
+	Level string `json:"level"`
+}
+
+// withLogLevel adds the given log level to the JSON config of a monitor as
+// `logLevel`, so that the subprocess only constructs the log records that the
+// agent would actually log.  The config is returned as is if it isn't a JSON
+// object.
+func withLogLevel(configBytes []byte, level log.Level) []byte {
+	var fields map[string]json.RawMessage
+	if err := json.Unmarshal(configBytes, &fields); err != nil || fields == nil {
+		return configBytes
+	}
+	fields["logLevel"], _ = json.Marshal(level.String())
+
+	out, err := json.Marshal(fields)
+	if err != nil {
+		return configBytes
+	}
+	return out
+}
+
+func logLevelPayload(level log.Level) []byte {
+	payload, _ := json.Marshal(logLevelMessage{Level: level.String()})
+	return payload
+}
+
+// watchLogLevel sends a MessageTypeSetLogLevel message with the agent's log
+// level whenever it changes from `level`, which is the level the subprocess
+// already has, until ctx is done or a message can't be sent.
+func watchLogLevel(ctx context.Context, level log.Level, send func(MessageType, []byte) error) {
+	ticker := time.NewTicker(logLevelCheckInterval)
+	defer ticker.Stop()
+
+	for {
+		select {
+		case <-ctx.Done():
+			return
+		case <-ticker.C:
+		}
+
+		newLevel := log.GetLevel()
+		if newLevel == level {
+			continue
+		}
+		if err := send(MessageTypeSetLogLevel, logLevelPayload(newLevel)); err != nil {
+			return
+		}
+		level = newLevel
+	}
+}
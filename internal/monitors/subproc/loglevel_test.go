@@ -0,0 +1,24 @@
+package subproc
+
+import (
+	"encoding/json"
+	"testing"
+
+	log "github.com/sirupsen/logrus"
+)
+
+func TestWithLogLevel(t *testing.T) {
+	out := withLogLevel([]byte(`{"type":"python-monitor","intervalSeconds":10}`), log.WarnLevel)
+
+	var fields map[string]interface{}
+	if err := json.Unmarshal(out, &fields); err != nil {
+		t.Fatalf("unexpected error: %v", err)
+	}
+	if fields["logLevel"] != "warning" || fields["type"] != "python-monitor" || fields["intervalSeconds"] != 10.0 {
+		t.Errorf("got config %s", out)
+	}
+
+	if out := withLogLevel([]byte(`null`), log.WarnLevel); string(out) != "null" {
+		t.Errorf("got config %s, want it unchanged", out)
+	}
+}
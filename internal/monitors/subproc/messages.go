@@ -1,6 +1,7 @@
 package subproc
 
 import (
+	"bytes"
 	"encoding/binary"
 	"errors"
 	"io"
@@ -18,16 +19,40 @@ const (
 	MessageTypeConfigureResult MessageType = 2
 	MessageTypeShutdown        MessageType = 3
 	MessageTypeLog             MessageType = 4
+	// MessageTypeBatch frames contain a sequence of other complete frames and
+	// are transparently unpacked by RecvMessage.
+	MessageTypeBatch MessageType = 5
+	// MessageTypeCallbackStats messages hold counters about the callbacks
+	// scheduled in the subprocess and are handled by MonitorCore itself.
+	MessageTypeCallbackStats MessageType = 6
+	// MessageTypeCallbackTimings messages hold histograms of how long the
+	// callbacks scheduled in the subprocess take to run and are also handled
+	// by MonitorCore.
+	MessageTypeCallbackTimings MessageType = 7
+	// MessageTypeInstance frames wrap a frame to or from a single monitor
+	// instance in a subprocess that hosts many of them (see sharedHost).
+	MessageTypeInstance MessageType = 8
+	// MessageTypeSetLogLevel messages tell the subprocess the agent's new log
+	// level so that it doesn't send logs that the agent would drop.  They are
+	// only sent to runners that set RuntimeConfig.ControlLogLevel and that
+	// accept them according to their configure result.
+	MessageTypeSetLogLevel MessageType = 9
 )
 
 type configResult struct {
 	Error *string `json:"error"`
+	// Whether the runner understands MessageTypeSetLogLevel messages.  Older
+	// runners fail on any message they don't expect after being configured.
+	AcceptsLogLevel bool `json:"acceptsLogLevel"`
 }
 
 type messageReadWriter struct {
 	Reader            io.ReadCloser
 	Writer            io.WriteCloser
 	lastPayloadReader *io.LimitedReader
+	// Holds the frames of the last batch message that have not been received
+	// yet.  It is reused across batches to avoid reallocating.
+	batch bytes.Buffer
 }
 
 // MessageReceiver can get messages from subprocesses
@@ -36,28 +61,47 @@ type MessageReceiver interface {
 }
 
 // RecvMessage blocks until it receives a complete message from the Reader
-// pipe.  This is not thread-safe.
+// pipe.  Batch messages are unpacked and their contained messages are
+// returned one at a time.  This is not thread-safe.
 func (m *messageReadWriter) RecvMessage() (MessageType, io.Reader, error) {
 	if m.lastPayloadReader != nil && m.lastPayloadReader.N > 0 {
 		return MessageTypeNone, nil, errors.New("last payload was not fully read, cannot receive")
 	}
 
+	for {
+		if m.batch.Len() > 0 {
+			return m.recvFrame(&m.batch)
+		}
+
+		msgType, payloadReader, err := m.recvFrame(m.Reader)
+		if err != nil || msgType != MessageTypeBatch {
+			return msgType, payloadReader, err
+		}
+
+		m.batch.Reset()
+		if _, err := m.batch.ReadFrom(payloadReader); err != nil {
+			return MessageTypeNone, nil, err
+		}
+	}
+}
+
+func (m *messageReadWriter) recvFrame(r io.Reader) (MessageType, io.Reader, error) {
 	var buf [4]byte
 
-	if _, err := io.ReadFull(m.Reader, buf[:]); err != nil {
+	if _, err := io.ReadFull(r, buf[:]); err != nil {
 		return MessageTypeNone, nil, err
 	}
 
 	msgType := MessageType(binary.BigEndian.Uint32(buf[:]))
 
-	if _, err := io.ReadFull(m.Reader, buf[:]); err != nil {
+	if _, err := io.ReadFull(r, buf[:]); err != nil {
 		return MessageTypeNone, nil, err
 	}
 
 	size := binary.BigEndian.Uint32(buf[:])
 
 	payloadReader := &io.LimitedReader{
-		R: m.Reader,
+		R: r,
 		N: int64(size),
 	}
 	m.lastPayloadReader = payloadReader
@@ -0,0 +1,103 @@
+package subproc
+
+import (
+	"bytes"
+	"encoding/binary"
+	"io/ioutil"
+	"testing"
+)
+
+func frame(msgType MessageType, payload []byte) []byte {
+	var buf bytes.Buffer
+	var header [8]byte
+	binary.BigEndian.PutUint32(header[:4], uint32(msgType))
+	binary.BigEndian.PutUint32(header[4:], uint32(len(payload)))
+	buf.Write(header[:])
+	buf.Write(payload)
+	return buf.Bytes()
+}
+
+func TestRecvMessageUnpacksBatches(t *testing.T) {
+	var batch []byte
+	batch = append(batch, frame(100, []byte(`{"a":1}`))...)
+	batch = append(batch, frame(100, []byte(`{"a":2}`))...)
+
+	var stream []byte
+	stream = append(stream, frame(MessageTypeLog, []byte(`{"message":"hi"}`))...)
+	stream = append(stream, frame(MessageTypeBatch, batch)...)
+	stream = append(stream, frame(MessageTypeBatch, nil)...)
+	stream = append(stream, frame(200, []byte(`[]`))...)
+
+	m := &messageReadWriter{
+		Reader: ioutil.NopCloser(bytes.NewReader(stream)),
+	}
+
+	expected := []struct {
+		msgType MessageType
+		payload string
+	}{
+		{MessageTypeLog, `{"message":"hi"}`},
+		{100, `{"a":1}`},
+		{100, `{"a":2}`},
+		{200, `[]`},
+	}
+
+	for i, exp := range expected {
+		msgType, payloadReader, err := m.RecvMessage()
+		if err != nil {
+			t.Fatalf("message %d: unexpected error: %v", i, err)
+		}
+		if msgType != exp.msgType {
+			t.Errorf("message %d: got type %d, want %d", i, msgType, exp.msgType)
+		}
+		payload, _ := ioutil.ReadAll(payloadReader)
+		if string(payload) != exp.payload {
+			t.Errorf("message %d: got payload %s, want %s", i, payload, exp.payload)
+		}
+	}
+
+	if _, _, err := m.RecvMessage(); err == nil {
+		t.Error("expected error at end of stream")
+	}
+}
+
+func BenchmarkRecvMessage(b *testing.B) {
+	const messageCount = 1000
+	payload := []byte(`{"metric":"my.gauge","value":1,"dimensions":{"a":"test"}}`)
+
+	var unbatched []byte
+	for i := 0; i < messageCount; i++ {
+		unbatched = append(unbatched, frame(100, payload)...)
+	}
+	// Batches of 100 messages, like the Python runner would send
+	var batched []byte
+	for i := 0; i < messageCount; i += 100 {
+		batched = append(batched, frame(MessageTypeBatch, unbatched[:100*(8+len(payload))])...)
+	}
+
+	for _, bc := range []struct {
+		name   string
+		stream []byte
+	}{
+		{"unbatched", unbatched},
+		{"batched", batched},
+	} {
+		b.Run(bc.name, func(b *testing.B) {
+			b.SetBytes(int64(len(bc.stream)))
+			for i := 0; i < b.N; i++ {
+				m := &messageReadWriter{
+					Reader: ioutil.NopCloser(bytes.NewReader(bc.stream)),
+				}
+				for j := 0; j < messageCount; j++ {
+					_, payloadReader, err := m.RecvMessage()
+					if err != nil {
+						b.Fatal(err)
+					}
+					if _, err := ioutil.ReadAll(payloadReader); err != nil {
+						b.Fatal(err)
+					}
+				}
+			}
+		})
+	}
+}
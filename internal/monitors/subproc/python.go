@@ -17,5 +17,9 @@ func DefaultPythonRuntimeConfig(pkgName string) *RuntimeConfig {
 		Binary: defaultPythonBinaryExecutable(),
 		Args:   defaultPythonBinaryArgs(pkgName),
 		Env:    env,
+		// Only runners that say that they accept the log level messages get
+		// them, so this is safe with an older sfxpython in a custom
+		// pythonBinary
+		ControlLogLevel: true,
 	}
 }
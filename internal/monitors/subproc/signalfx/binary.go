@@ -0,0 +1,87 @@
+package signalfx
+
+import (
+	"fmt"
+
+	"github.com/signalfx/golib/datapoint"
+	"github.com/signalfx/signalfx-agent/internal/monitors/subproc"
+)
+
+// The metric types in the order of their codes in the binary encoding (see
+// python/sfxmonitor/encoding.py)
+var binaryMetricTypes = []datapoint.MetricType{datapoint.Gauge, datapoint.Count, datapoint.Counter}
+
+const (
+	binaryValueKindInt   = 0
+	binaryValueKindFloat = 1
+)
+
+// decodeBinaryDatapoints decodes a datapoint list that was encoded with the
+// binary codec.
+func decodeBinaryDatapoints(payload []byte) ([]*datapoint.Datapoint, error) {
+	d := subproc.NewBinaryDecoder(payload)
+
+	// Each dimension set takes at least 2 bytes, this guards against huge
+	// allocations from corrupted payloads.
+	numDimSets := int(d.Uint32())
+	if numDimSets > d.Len()/2 {
+		return nil, fmt.Errorf("dimension table size %d is larger than the payload", numDimSets)
+	}
+
+	dimSets := make([]map[string]string, numDimSets)
+	for i := range dimSets {
+		numDims := int(d.Uint16())
+		dimSets[i] = make(map[string]string, numDims)
+		for j := 0; j < numDims; j++ {
+			key := d.Str()
+			dimSets[i][key] = d.Str()
+		}
+	}
+
+	count := int(d.Uint32())
+	if d.Err() != nil {
+		return nil, d.Err()
+	}
+	if count > d.Len() {
+		return nil, fmt.Errorf("datapoint count %d is larger than the payload", count)
+	}
+
+	dps := make([]*datapoint.Datapoint, 0, count)
+	for i := 0; i < count; i++ {
+		typeCode := int(d.Uint8())
+		metric := d.Str()
+
+		var value datapoint.Value
+		switch kind := d.Uint8(); kind {
+		case binaryValueKindInt:
+			value = datapoint.NewIntValue(d.Int64())
+		case binaryValueKindFloat:
+			value = datapoint.NewFloatValue(d.Float64())
+		default:
+			return nil, fmt.Errorf("unknown value kind %d for datapoint %s", kind, metric)
+		}
+
+		timestamp := d.Int64()
+		dimSetIndex := int(d.Uint32())
+
+		if d.Err() != nil {
+			return nil, d.Err()
+		}
+		if typeCode >= len(binaryMetricTypes) {
+			return nil, fmt.Errorf("unknown metric type code %d for datapoint %s", typeCode, metric)
+		}
+		if dimSetIndex >= len(dimSets) {
+			return nil, fmt.Errorf("dimension set %d for datapoint %s is not in the table", dimSetIndex, metric)
+		}
+
+		// Each datapoint needs its own copy of the dimensions since they can
+		// be modified further down the pipeline.
+		dims := make(map[string]string, len(dimSets[dimSetIndex]))
+		for k, v := range dimSets[dimSetIndex] {
+			dims[k] = v
+		}
+
+		dps = append(dps, datapoint.New(metric, dims, value, binaryMetricTypes[typeCode], fromTs(timestamp)))
+	}
+	return dps, d.Err()
+}
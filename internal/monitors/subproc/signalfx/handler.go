@@ -23,6 +23,7 @@ import (
 
 const messageTypeDatapointJSONList subproc.MessageType = 200
 const messageTypeDatapointProtobufList subproc.MessageType = 201
+const messageTypeDatapointBinaryList subproc.MessageType = 202
 
 type JSONHandler struct {
 	Output types.Output
@@ -106,6 +107,21 @@ func (h *JSONHandler) handleMessage(msgType subproc.MessageType, payloadReader i
 			}
 		}
 
+	case messageTypeDatapointBinaryList:
+		jeff := buffs.Get().(*bytes.Buffer)
+		defer buffs.Put(jeff)
+		jeff.Reset()
+		if _, err := jeff.ReadFrom(payloadReader); err != nil {
+			return err
+		}
+		dps, err := decodeBinaryDatapoints(jeff.Bytes())
+		if err != nil {
+			return err
+		}
+		for i := range dps {
+			h.Output.SendDatapoint(dps[i])
+		}
+
 	case subproc.MessageTypeLog:
 		return h.HandleLogMessage(payloadReader)
 
@@ -152,6 +168,9 @@ type LogMessage struct {
 	SourcePath  string  `json:"source_path"`
 	LineNumber  int     `json:"lineno"`
 	CreatedTime float64 `json:"created"`
+	// The number of identical messages that were collapsed into this one by
+	// the subprocess
+	Repeated int `json:"repeated"`
 }
 
 // HandleLogMessage will decode a log message from the given logReader and log
@@ -169,6 +188,9 @@ func HandleLogMessage(logReader io.Reader, logger logrus.FieldLogger) error {
 		"lineno":      msg.LineNumber,
 		"createdTime": msg.CreatedTime,
 	}
+	if msg.Repeated > 0 {
+		fields["repeated"] = msg.Repeated
+	}
 
 	switch msg.Level {
 	case "DEBUG":
@@ -51,7 +51,66 @@ type Config struct {
 	// The PYTHONPATH that will be used when importing the script specified at
 	// `scriptFilePath`.  The directory of `scriptFilePath` will always be
 	// included in the path.
-	PythonPath   []string `yaml:"pythonPath" json:"pythonPath"`
+	PythonPath []string `yaml:"pythonPath" json:"pythonPath"`
+	// If greater than 0, datapoints sent by the monitor will be held in the
+	// Python runner for up to this many seconds and sent to the agent
+	// together in a single batch message, which greatly reduces the
+	// overhead of monitors that send a lot of datapoints.
+	BatchFlushIntervalSeconds float64 `yaml:"batchFlushIntervalSeconds" json:"batchFlushIntervalSeconds"`
+	// The number of bytes of pending datapoints that will cause a batch to
+	// be sent before `batchFlushIntervalSeconds` has elapsed.  If not set,
+	// 64KiB will be used.
+	BatchMaxBytes int `yaml:"batchMaxBytes" json:"batchMaxBytes"`
+	// If greater than 0, the `run` function of a simple monitor will be
+	// scheduled on a fixed pool of this many threads instead of on a
+	// dedicated thread.
+	SchedulerWorkerCount int `yaml:"schedulerWorkerCount" json:"schedulerWorkerCount"`
+	// What to do when the `run` function of a simple monitor takes longer than its interval to run.
+	// `runLate` makes up every missed run back to back, `skip` drops the
+	// missed runs and waits for the next scheduled time, and `coalesce` does
+	// a single run right away in place of all the missed runs.  The number
+	// of overruns is reported in the agent's internal metrics.
+	OverrunPolicy string `yaml:"overrunPolicy" json:"overrunPolicy" default:"runLate"`
+	// If true, the `run` function of a simple monitor will first run at the next multiple of
+	// `intervalSeconds` on the wall clock (e.g. on the minute for an
+	// interval of 60), and every interval after that, so that datapoints
+	// from all hosts with synced clocks have lined up timestamps.
+	// Otherwise, it first runs as soon as the monitor starts.
+	AlignToWallClock bool `yaml:"alignToWallClock" json:"alignToWallClock"`
+	// If true, the first run of the `run` function of a simple monitor is delayed by an offset
+	// within its interval that is derived from the monitor id and the
+	// host name, so that many monitors that start at the same time, such as
+	// when the agent restarts, don't all hit what they monitor at once.  The
+	// offset is the same every time the monitor starts.  If
+	// `alignToWallClock` is also set, the runs are aligned to the wall clock
+	// shifted by the offset.
+	SpreadStartTimes bool `yaml:"spreadStartTimes" json:"spreadStartTimes"`
+	// When the `run` function of a simple monitor raises an exception, the wait before its next run
+	// is doubled on each failure in a row, up to this many seconds, and goes
+	// back to the interval once it succeeds.  Only the first failure in a row
+	// is logged with a full traceback.  The current backoff is reported in
+	// the agent's internal metrics.  If not set, 300 (five minutes) will be
+	// used, so that it starts reporting again soon after whatever it reads
+	// from recovers.  Set it to the interval or less to run it on every
+	// interval even while it fails, without backing off.
+	MaxBackoffSeconds int `yaml:"maxBackoffSeconds" json:"maxBackoffSeconds"`
+	// If true, the time taken to import each module while the script is
+	// imported is recorded, like `python -X importtime`, and the slowest
+	// imports are logged at the info level once it is loaded.  This is useful
+	// to find out why a monitor is slow to start.
+	ProfileImports bool `yaml:"profileImports" json:"profileImports"`
+	// If true, the Python runner for this monitor will be forked from a
+	// long-running fork server that has already loaded the interpreter and
+	// the modules that runners commonly use, instead of being started from
+	// scratch.  This makes starting a monitor much cheaper, which matters
+	// when service discovery is creating and removing many of them.  There
+	// is one fork server per distinct Python runtime.  Not supported on
+	// Windows.
+	ForkServer bool `yaml:"forkServer" json:"-"`
+	// The payload codecs that the agent can decode, in order of preference.
+	// This is set by the agent and sent to the Python runner in the
+	// configure message.
+	Codecs       []string `yaml:"-" json:"codecs"`
 	CustomConfig `yaml:",inline" json:"-" neverLog:"true"`
 }
 
@@ -102,6 +161,9 @@ func (m *PyMonitor) Configure(conf *Config) error {
 	if len(conf.PythonPath) > 0 {
 		runtimeConf.Env = append(runtimeConf.Env, "PYTHONPATH="+strings.Join(conf.PythonPath, ":"))
 	}
+	runtimeConf.ForkServer = conf.ForkServer
+
+	conf.Codecs = []string{subproc.CodecBinary, subproc.CodecJSON}
 
 	handler := &signalfx.JSONHandler{
 		Output: m.Output,
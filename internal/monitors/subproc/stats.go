@@ -0,0 +1,191 @@
+package subproc
+
+import (
+	"encoding/json"
+	"io"
+	"strconv"
+
+	"github.com/signalfx/golib/datapoint"
+	"github.com/signalfx/golib/sfxclient"
+	"github.com/signalfx/signalfx-agent/internal/utils"
+)
+
+// CallbackStats are the counters about a single callback that is scheduled
+// in the subprocess (see python/sfxrunner/scheduler/stats.py)
+type CallbackStats struct {
+	Name string `json:"name"`
+	// Distinguishes callbacks that have the same name, in the order they were
+	// scheduled, so that their stats aren't merged.  It is 0 for the first
+	// one, and for all callbacks from older runners.
+	Index int `json:"index"`
+	// The number of times the callback has run
+	Runs int64 `json:"runs"`
+	// The number of runs that took longer than the callback's interval
+	Overruns int64 `json:"overruns"`
+	// The number of runs that were dropped due to overruns
+	SkippedRuns int64 `json:"skippedRuns"`
+	// The number of runs that raised an exception
+	Failures int64 `json:"failures"`
+	// How long the callback is waiting before its next run because it has
+	// been failing, or 0 if its last run succeeded
+	BackoffSeconds float64 `json:"backoffSeconds"`
+}
+
+type callbackStatsMessage struct {
+	Callbacks []CallbackStats `json:"callbacks"`
+}
+
+// Histogram of durations in seconds.  Buckets holds the cumulative count of
+// durations that are less than or equal to each bucket bound.
+type Histogram struct {
+	Sum     float64 `json:"sum"`
+	Count   int64   `json:"count"`
+	Buckets []int64 `json:"buckets"`
+}
+
+// CallbackTimings are the histograms of how long a single callback that is
+// scheduled in the subprocess takes to run
+type CallbackTimings struct {
+	Name  string     `json:"name"`
+	Index int        `json:"index"`
+	Wall  *Histogram `json:"wall"`
+	// CPU time is only available on some platforms so this can be nil
+	CPU *Histogram `json:"cpu"`
+}
+
+// callbackKey identifies a single callback in the subprocess
+type callbackKey struct {
+	name  string
+	index int
+}
+
+// dimensions returns the dimensions of the internal metrics about the
+// callback.  The index is only included for callbacks that share their name
+// with another one, so that the first one has the same dimensions as when
+// callbacks were only identified by name.
+func (k callbackKey) dimensions() map[string]string {
+	dims := map[string]string{"callback": k.name}
+	if k.index > 0 {
+		dims["callback_index"] = strconv.Itoa(k.index)
+	}
+	return dims
+}
+
+type callbackTimingsMessage struct {
+	// The upper bounds of the histogram buckets, in seconds
+	Bounds    []float64         `json:"bounds"`
+	Callbacks []CallbackTimings `json:"callbacks"`
+}
+
+// statsReceiver handles the callback stats and timings messages from the
+// subprocess and passes all other messages through to the monitor's handler.
+type statsReceiver struct {
+	MessageReceiver
+	mc *MonitorCore
+}
+
+func (r *statsReceiver) RecvMessage() (MessageType, io.Reader, error) {
+	for {
+		msgType, payloadReader, err := r.MessageReceiver.RecvMessage()
+		if err != nil {
+			return msgType, payloadReader, err
+		}
+
+		switch msgType {
+		case MessageTypeCallbackStats:
+			if err := r.mc.handleCallbackStats(payloadReader); err != nil {
+				r.mc.logger.WithError(err).Error("Could not read callback stats from subprocess monitor")
+			}
+		case MessageTypeCallbackTimings:
+			if err := r.mc.handleCallbackTimings(payloadReader); err != nil {
+				r.mc.logger.WithError(err).Error("Could not read callback timings from subprocess monitor")
+			}
+		default:
+			return msgType, payloadReader, err
+		}
+	}
+}
+
+func (mc *MonitorCore) handleCallbackStats(payloadReader io.Reader) error {
+	var msg callbackStatsMessage
+	if err := json.NewDecoder(payloadReader).Decode(&msg); err != nil {
+		return err
+	}
+
+	mc.statsLock.Lock()
+	defer mc.statsLock.Unlock()
+
+	if mc.callbackStats == nil {
+		mc.callbackStats = make(map[callbackKey]CallbackStats, len(msg.Callbacks))
+	}
+	for i := range msg.Callbacks {
+		mc.callbackStats[callbackKey{msg.Callbacks[i].Name, msg.Callbacks[i].Index}] = msg.Callbacks[i]
+	}
+	return nil
+}
+
+func (mc *MonitorCore) handleCallbackTimings(payloadReader io.Reader) error {
+	var msg callbackTimingsMessage
+	if err := json.NewDecoder(payloadReader).Decode(&msg); err != nil {
+		return err
+	}
+
+	mc.statsLock.Lock()
+	defer mc.statsLock.Unlock()
+
+	if mc.callbackTimings == nil {
+		mc.callbackTimings = make(map[callbackKey]CallbackTimings, len(msg.Callbacks))
+	}
+	mc.timingBounds = msg.Bounds
+	for i := range msg.Callbacks {
+		mc.callbackTimings[callbackKey{msg.Callbacks[i].Name, msg.Callbacks[i].Index}] = msg.Callbacks[i]
+	}
+	return nil
+}
+
+func histogramDatapoints(name string, dims map[string]string, h *Histogram, bounds []float64) []*datapoint.Datapoint {
+	dps := []*datapoint.Datapoint{
+		sfxclient.CumulativeF(name, utils.CloneStringMap(dims), h.Sum),
+		sfxclient.Cumulative(name+"_count", utils.CloneStringMap(dims), h.Count),
+	}
+	for i := range h.Buckets {
+		if i >= len(bounds) {
+			break
+		}
+		bucketDims := utils.MergeStringMaps(dims, map[string]string{
+			"upper_bound": strconv.FormatFloat(bounds[i], 'f', 6, 64),
+		})
+		dps = append(dps, sfxclient.Cumulative(name+"_bucket", bucketDims, h.Buckets[i]))
+	}
+	return dps
+}
+
+// InternalMetrics returns the latest counters and timing histograms of the
+// callbacks scheduled in the subprocess.  They start over if the subprocess
+// is restarted.
+func (mc *MonitorCore) InternalMetrics() []*datapoint.Datapoint {
+	mc.statsLock.Lock()
+	defer mc.statsLock.Unlock()
+
+	out := make([]*datapoint.Datapoint, 0, 5*len(mc.callbackStats))
+	for key, stats := range mc.callbackStats {
+		out = append(out,
+			sfxclient.Cumulative("sfxagent.subproc_callback_runs", key.dimensions(), stats.Runs),
+			sfxclient.Cumulative("sfxagent.subproc_callback_overruns", key.dimensions(), stats.Overruns),
+			sfxclient.Cumulative("sfxagent.subproc_callback_skipped_runs", key.dimensions(), stats.SkippedRuns),
+			sfxclient.Cumulative("sfxagent.subproc_callback_failures", key.dimensions(), stats.Failures),
+			sfxclient.GaugeF("sfxagent.subproc_callback_backoff_seconds", key.dimensions(), stats.BackoffSeconds),
+		)
+	}
+
+	for key, timings := range mc.callbackTimings {
+		dims := key.dimensions()
+		if timings.Wall != nil {
+			out = append(out, histogramDatapoints("sfxagent.subproc_callback_wall_seconds", dims, timings.Wall, mc.timingBounds)...)
+		}
+		if timings.CPU != nil {
+			out = append(out, histogramDatapoints("sfxagent.subproc_callback_cpu_seconds", dims, timings.CPU, mc.timingBounds)...)
+		}
+	}
+	return out
+}
@@ -0,0 +1,83 @@
+package subproc
+
+import (
+	"bytes"
+	"io/ioutil"
+	"strconv"
+	"testing"
+)
+
+func TestStatsReceiverConsumesCallbackStatsAndTimings(t *testing.T) {
+	var stream []byte
+	stream = append(stream, frame(MessageTypeCallbackStats,
+		[]byte(`{"callbacks":[{"name":"redis.read","runs":10,"overruns":2,"skippedRuns":3}]}`))...)
+	stream = append(stream, frame(100, []byte(`{"a":1}`))...)
+	stream = append(stream, frame(MessageTypeCallbackStats,
+		[]byte(`{"callbacks":[{"name":"redis.read","runs":11,"overruns":2,"skippedRuns":3,"failures":4,"backoffSeconds":80}]}`))...)
+	stream = append(stream, frame(MessageTypeCallbackTimings,
+		[]byte(`{"bounds":[0.1,1],"callbacks":[{"name":"redis.read","wall":{"sum":2.5,"count":11,"buckets":[9,10]},"cpu":null}]}`))...)
+
+	mc := &MonitorCore{}
+	r := &statsReceiver{
+		MessageReceiver: &messageReadWriter{
+			Reader: ioutil.NopCloser(bytes.NewReader(stream)),
+		},
+		mc: mc,
+	}
+
+	msgType, payloadReader, err := r.RecvMessage()
+	if err != nil {
+		t.Fatalf("unexpected error: %v", err)
+	}
+	if msgType != 100 {
+		t.Errorf("got type %d, want 100", msgType)
+	}
+	payload, _ := ioutil.ReadAll(payloadReader)
+	if string(payload) != `{"a":1}` {
+		t.Errorf("got payload %s", payload)
+	}
+
+	if _, _, err := r.RecvMessage(); err == nil {
+		t.Error("expected error at end of stream")
+	}
+
+	expected := CallbackStats{Name: "redis.read", Runs: 11, Overruns: 2, SkippedRuns: 3, Failures: 4, BackoffSeconds: 80}
+	if stats := mc.callbackStats[callbackKey{"redis.read", 0}]; stats != expected {
+		t.Errorf("got stats %+v, want %+v", stats, expected)
+	}
+
+	timings := mc.callbackTimings[callbackKey{"redis.read", 0}]
+	if timings.Wall == nil || timings.Wall.Count != 11 || len(timings.Wall.Buckets) != 2 || timings.CPU != nil {
+		t.Errorf("got timings %+v", timings)
+	}
+
+	// 4 counters and the backoff gauge plus the sum, count and 2 buckets of
+	// the wall time histogram
+	if dps := mc.InternalMetrics(); len(dps) != 9 {
+		t.Errorf("got %d internal metrics, want 9", len(dps))
+	}
+}
+
+func TestCallbackStatsWithTheSameNameAreKeptApart(t *testing.T) {
+	mc := &MonitorCore{}
+	err := mc.handleCallbackStats(bytes.NewReader([]byte(`{"callbacks":[` +
+		`{"name":"read","runs":1},{"name":"read","index":1,"runs":2}]}`)))
+	if err != nil {
+		t.Fatalf("unexpected error: %v", err)
+	}
+
+	runs := map[string]float64{}
+	for _, dp := range mc.InternalMetrics() {
+		if dp.Metric != "sfxagent.subproc_callback_runs" {
+			continue
+		}
+		if dp.Dimensions["callback"] != "read" {
+			t.Errorf("got callback dimension %q", dp.Dimensions["callback"])
+		}
+		v, _ := strconv.ParseFloat(dp.Value.String(), 64)
+		runs[dp.Dimensions["callback_index"]] = v
+	}
+	if len(runs) != 2 || runs[""] != 1 || runs["1"] != 2 {
+		t.Errorf("got runs by index %v", runs)
+	}
+}
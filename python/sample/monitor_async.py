@@ -0,0 +1,64 @@
+import asyncio
+import logging
+import time
+
+# Optional logger that you can use if you want to log messages back to the
+# agent.  You can also use plain `print` statements, but they will go to the
+# agent's ERROR log level, so logger is better for non-error messages.
+logger = logging.getLogger(__name__)
+
+# This is an async version of a simple monitor.  It requires Python 3.5+, so
+# you have to set the `pythonBinary` config option to a Python 3 interpreter.
+#
+# Because `run` is a coroutine, it is run on an asyncio event loop instead of
+# in a thread, and it will be called every `intervalSeconds`, just like the
+# `run` function of a simple monitor.  A single event loop can wait on
+# hundreds of connections at once, which would otherwise need hundreds of
+# threads.  Don't call blocking functions in coroutines though, since they
+# hold up everything else that is running on the loop.
+#
+# An example config for this monitor would be:
+#
+#  - type: python-monitor
+#    pythonBinary: /usr/bin/python3
+#    scriptFilePath: /usr/src/signalfx-agent/python/sample/monitor_async.py
+#    endpoints:
+#     - host: 10.0.0.1
+#       port: 8080
+#     - host: 10.0.0.2
+#       port: 8080
+
+
+async def check_endpoint(host, port, timeout):
+    """
+    Returns how long it takes to open a TCP connection to the endpoint, or None
+    if it can't be connected to
+    """
+    start = time.time()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    elapsed = time.time() - start
+    writer.close()
+    return elapsed
+
+
+# `config` is a dict of the configuration provided to the agent, including any
+# custom config options that are useful in this function.
+# `output` is how you get datapoints back to the main agent process.
+async def run(config, output):
+    endpoints = config.get("endpoints") or []
+    timeout = config.get("intervalSeconds", 10) / 2
+
+    # All of the endpoints are checked concurrently on the event loop
+    results = await asyncio.gather(*[check_endpoint(e["host"], e["port"], timeout) for e in endpoints])
+
+    for endpoint, elapsed in zip(endpoints, results):
+        dims = {"host": endpoint["host"], "port": str(endpoint["port"])}
+        output.send_gauge("endpoint.up", 0 if elapsed is None else 1, dims)
+        if elapsed is not None:
+            # The send methods return a future that you can await if you
+            # want to wait for the datapoints to be written to the agent.
+            # Either way, they never block the event loop.
+            await output.send_gauge("endpoint.connect_time_ms", elapsed * 1000, dims)
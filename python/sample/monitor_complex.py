@@ -62,9 +62,12 @@ class Monitor(object):
 
         This method should return quickly (i.e. not block on I/O), and any real
         work should be done in separate threads.  As a convenience, there are
-        two convenience scheduler classes available for you to use:
+        four convenience scheduler classes available for you to use:
          - sfxrunner.scheduler.simple.SimpleScheduler (one thread per task)
          - sfxrunner.scheduler.interval.IntervalScheduler (shared threadpool)
+         - sfxrunner.scheduler.pool.PoolScheduler (fixed threadpool)
+         - sfxrunner.scheduler.aio.AsyncIntervalScheduler (coroutines on a
+           single asyncio event loop, Python 3 only)
 
         You are free to schedule tasks however you want, including using async
         event loops.  The main thing to consider is that you should not use the
@@ -1,18 +1,21 @@
 """
-Runs a collectd runner that can run a single collectd plugin instance.
+Runs a collectd runner that can run a single collectd plugin instance, or many
+instances in the same interpreter if the `--host` flag is given.
 """
 from __future__ import absolute_import
 
 import logging
-import logging.config
+import sys
 
 from sfxrunner.logs import PipeLogHandler, log_exc_traceback_as_error
 from sfxrunner.messages import setup_io_pipes
 
+from .host import Host
 from .runner import Runner
 
 logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
+# The agent sends its own log level with the configure message
+logger.setLevel(logging.INFO)
 
 
 def run():
@@ -22,10 +25,14 @@ def run():
     """
     input_reader, output_writer = setup_io_pipes()
 
-    # Logs go through our stdout pipe back to the agent.
+    # Logs go through our stdout pipe back to the agent from a background
+    # thread.
     logger.addHandler(PipeLogHandler(output_writer))
 
-    runner = Runner(input_reader, output_writer)
+    if "--host" in sys.argv[1:]:
+        runner = Host(input_reader, output_writer)
+    else:
+        runner = Runner(input_reader, output_writer)
     logger.info("Starting up Collectd Python runner")
     runner.process()
 
@@ -35,3 +42,7 @@ try:
 except Exception as e:  # pylint: disable=broad-except
     # runner.stop()
     log_exc_traceback_as_error()
+finally:
+    # Forked runners exit without running atexit hooks, so the log handler has
+    # to be flushed explicitly to send the last records
+    logging.shutdown()
@@ -22,37 +22,58 @@ ever gets made a standard and we move to Python 3 since it would allow for
 loading modules multiple times with totally isolated configurations of the same
 plugin.  If a monitor associated with a particular config shutdown, then the
 subinterpreter could just be destroyed.
+
+Until then, plugins that are known to behave can be run in "isolated" mode,
+where each instance imports its own copy of the plugin module along with its
+own collectd module, so that many instances can share one interpreter (see
+sfxcollectd.host).  This relies on the plugin only importing collectd at the
+module level and not keeping state anywhere outside of its own modules.
 """
 from __future__ import absolute_import
 
 import logging
 from collections import namedtuple
 
-from sfxrunner.imports import load_python_module
-from sfxrunner.scheduler.simple import SimpleScheduler
+from sfxrunner.imports import lazy_import, load_isolated_python_module, load_python_module
+from sfxrunner.scheduler.clock import monitor_spread_key
+from sfxrunner.scheduler.pool import new_scheduler
+from sfxrunner.scheduler.stats import CALLBACK_STATS, CallbackStats
 
 from .config import Config
-from .interface import CollectdInterface, inject_collectd_module
-from .typesdb import parse_types_db
+from .interface import CollectdInterface, inject_collectd_module, make_collectd_module
+
+# The typesdb index cache pulls in tempfile and hashlib, which aren't needed
+# until a plugin is configured
+typesdb = lazy_import("sfxcollectd.typesdb")  # pylint: disable=invalid-name
 
 logger = logging.getLogger(__name__)
 
 DataSetCache = namedtuple("DataSetCache", "sources names types")
 
 
-class CollectdMonitorProxy(object):
+class CollectdMonitorProxy(object):  # pylint: disable=too-many-instance-attributes
     """
     This is roughly analogous to a Monitor struct in the agent
     """
 
-    def __init__(self, send_values_func):
+    def __init__(self, send_values_func, isolated=False):
         self.send_values_func = send_values_func
+        # Whether this instance shares the interpreter with other instances
+        self.isolated = isolated
+        # The counters of the scheduled callbacks, which have to be kept
+        # separately for each instance in the same interpreter
+        self.stats = CallbackStats() if isolated else CALLBACK_STATS
+        # The copies of the plugin's modules that are private to this instance
+        # when isolated
+        self.private_modules = {}
 
         # Our implementation of the collectd Python interface
         self.interface = None
         # The config that comes from the agent
         self.config = None
-        self.scheduler = SimpleScheduler()
+        self.scheduler = None
+        self.types_db = None
+        # The data sets that have been looked up so far, keyed by type
         self.datasets = {}
 
     def configure(self, monitor_config):
@@ -65,16 +86,30 @@ class CollectdMonitorProxy(object):
         ), "Monitor config for collectd python should have a field called 'pluginConfig'"
 
         self.config = monitor_config
+        self.scheduler = new_scheduler(
+            monitor_config.get("schedulerWorkerCount"),
+            monitor_config.get("overrunPolicy"),
+            self.stats,
+            monitor_config.get("alignToWallClock"),
+            monitor_spread_key(monitor_config),
+            monitor_config.get("maxBackoffSeconds"),
+        )
         self.interface = CollectdInterface(self.scheduler, monitor_config["intervalSeconds"])
 
         self.init_types_db_data_sets(monitor_config.get("typesDBPaths", []))
 
-        inject_collectd_module(self.interface, self.send_value_list_with_dataset)
-
         module_paths = monitor_config.get("modulePaths", [])
         import_name = monitor_config["moduleName"]
+        profile_imports = bool(monitor_config.get("profileImports"))
 
-        load_python_module(module_paths, import_name)
+        if self.isolated:
+            collectd_module = make_collectd_module(self.interface, self.send_value_list_with_dataset)
+            _, self.private_modules = load_isolated_python_module(
+                module_paths, import_name, {"collectd": collectd_module}, profile=profile_imports
+            )
+        else:
+            inject_collectd_module(self.interface, self.send_value_list_with_dataset)
+            load_python_module(module_paths, import_name, profile=profile_imports)
 
         if not self.interface.config_callback:
             raise RuntimeError("No config callback was registered, cannot configure")
@@ -95,28 +130,40 @@ class CollectdMonitorProxy(object):
 
     def init_types_db_data_sets(self, paths):
         """
-        Parse out the typesdb files and populate a set that can be used to
-        quickly look them up to attach them to value lists
+        Load the indexes of the typesdb files, from which data sets are looked
+        up as value lists of each type are sent
         """
         logger.info("Loading types.db files: %s", paths)
 
-        for types_db_path in paths:
-            with open(types_db_path, "r") as fd:
-                for dataset in parse_types_db(fd.read()):
-                    self.datasets[dataset.name] = DataSetCache(
-                        sources=dataset.sources,
-                        names=[s.name for s in dataset.sources],
-                        types=[s.type for s in dataset.sources],
-                    )
+        self.types_db = typesdb.TypesDB(paths)
 
-        logger.debug("Registered data sets: %s", self.datasets)
+        logger.debug("Registered %d data sets", len(self.types_db))
+
+    def get_data_set(self, type_name):
+        """
+        Returns the cached names and types of the data sources of the given
+        type, or None if the type isn't in any of the typesdb files
+        """
+        ds_cache = self.datasets.get(type_name)
+        if ds_cache is None:
+            dataset = self.types_db.get(type_name)
+            if dataset is None:
+                return None
+            # These are shared by every value list of the type so they are
+            # tuples to keep plugins from modifying them
+            ds_cache = self.datasets[type_name] = DataSetCache(
+                sources=dataset.sources,
+                names=tuple(s.name for s in dataset.sources),
+                types=tuple(s.type for s in dataset.sources),
+            )
+        return ds_cache
 
     def send_value_list_with_dataset(self, value_list):
         """
         Sets the dsnames and dstypes fields on the value list from the cache of
         data sets configured on the monitor
         """
-        ds_cache = self.datasets.get(value_list.type)
+        ds_cache = self.datasets.get(value_list.type) or self.get_data_set(value_list.type)
         if not ds_cache:
             logger.error(
                 "Type %s was not found in the types.db files configured (%s)",
@@ -125,6 +172,15 @@ class CollectdMonitorProxy(object):
             )
             return
 
+        if len(value_list.values) != len(ds_cache.names):
+            logger.error(
+                "Dropping value list for type %s, which needs %d values, but got %d",
+                value_list.type,
+                len(ds_cache.names),
+                len(value_list.values),
+            )
+            return
+
         value_list.dsnames = ds_cache.names
         value_list.dstypes = ds_cache.types
 
@@ -0,0 +1,169 @@
+"""
+Binary encoding of collectd value lists.  See `sfxrunner.codec` for the
+primitive encodings.  A value list is encoded as:
+
+ - host, plugin, plugin_instance, type, and type_instance strings
+ - time and interval as float64 (NaN if not set)
+ - the number of values as a uint16, followed by a dsname string, a dstype
+   uint8, and the value as a float64 (NaN if None) for each value
+ - the JSON encoded meta dict prefixed by its length as a uint32, or just a
+   zero length if there is no meta
+
+Once the data set of a type has been announced to the agent (see
+`sfxcollectd.runner`), value lists of that type can instead be encoded in the
+compact form, which is the same except that the values are just float64s
+without a dsname and dstype before each of them.
+
+Notifications (value lists with a message and severity) are not supported and
+must be sent as JSON.  See `value_list_to_dict` for the JSON form.
+"""
+from __future__ import absolute_import
+
+import struct
+
+import ujson
+from sfxrunner.codec import FLOAT64, NAN, UINT8, UINT16, UINT32, encode_float, encode_str
+
+DSTYPE_CODES = {"GAUGE": 0, "DERIVE": 1, "COUNTER": 2, "ABSOLUTE": 3}
+
+
+def is_notification(value_list):
+    """
+    Whether the value list represents a notification instead of metric values
+    """
+    return value_list.message is not None and value_list.severity is not None
+
+
+# The encoded dsname and dstype of each data source of the data sets seen so
+# far.  They only depend on the data set, which comes from the types.db files,
+# so there are only ever as many of these as there are types.
+_SOURCE_HEADERS = {}
+
+
+def encode_source_headers(dsnames, dstypes):
+    """
+    Returns the encoded dsname and dstype of each data source, which are the
+    same for every value list of a data set
+    """
+    try:
+        key = (dsnames, dstypes)
+        headers = _SOURCE_HEADERS.get(key)
+    except TypeError:
+        # Lists can't be cached
+        key = headers = None
+
+    if headers is None:
+        headers = tuple(encode_str(name) + UINT8.pack(DSTYPE_CODES[typ]) for name, typ in zip(dsnames, dstypes))
+        if key is not None:
+            _SOURCE_HEADERS[key] = headers
+    return headers
+
+
+# The fields of a value list that are sent as JSON if they are set
+_JSON_FIELDS = ("host", "plugin", "plugin_instance", "type", "type_instance", "time", "interval")
+
+
+def value_list_to_dict(value_list, include_data_set=True):
+    """
+    Returns the JSON representation of a value list, which only has the fields
+    that are set.  The dsnames and dstypes are left out if `include_data_set`
+    is False, in which case the agent fills them in from the data set that
+    was announced for the type.
+    """
+    out = {"values": value_list.values}
+    for field in _JSON_FIELDS:
+        value = getattr(value_list, field)
+        if value is not None:
+            out[field] = value
+
+    if include_data_set and value_list.dsnames is not None:
+        out["dsnames"] = value_list.dsnames
+        out["dstypes"] = value_list.dstypes
+    if value_list.meta:
+        out["meta"] = value_list.meta
+    if value_list.message is not None:
+        out["message"] = value_list.message
+    if value_list.severity is not None:
+        out["severity"] = value_list.severity
+    return out
+
+
+def data_set_to_dict(value_list):
+    """
+    Returns the announcement of the data set of the value list's type
+    """
+    return {"type": value_list.type, "dsnames": value_list.dsnames, "dstypes": value_list.dstypes}
+
+
+def _encode_meta(meta):
+    if meta:
+        meta = ujson.dumps(meta).encode("utf-8")
+        return UINT32.pack(len(meta)) + meta
+    return b"\x00\x00\x00\x00"
+
+
+def encode_value_list(value_list):
+    """
+    Returns the binary encoding of a value list that has its dsnames and
+    dstypes populated.  Raises ValueError if the number of values doesn't
+    match the data set, like collectd does when such a value list is
+    dispatched.
+    """
+    values = value_list.values
+    headers = encode_source_headers(value_list.dsnames, value_list.dstypes)
+    count = len(values)
+    if count != len(headers):
+        raise ValueError("Type %s needs %d values, got %d" % (value_list.type, len(headers), count))
+
+    parts = [
+        encode_str(value_list.host),
+        encode_str(value_list.plugin),
+        encode_str(value_list.plugin_instance),
+        encode_str(value_list.type),
+        encode_str(value_list.type_instance),
+        encode_float(value_list.time),
+        encode_float(value_list.interval),
+        UINT16.pack(count),
+    ]
+
+    for i in range(count):
+        value = values[i]
+        parts.append(headers[i])
+        parts.append(FLOAT64.pack(NAN if value is None else value))
+
+    parts.append(_encode_meta(value_list.meta))
+    return b"".join(parts)
+
+
+# Structs that pack a count followed by that many float64s, keyed by the count
+_COMPACT_VALUES = {}
+
+
+def encode_compact_value_list(value_list):
+    """
+    Returns the compact binary encoding of a value list, which leaves out the
+    dsnames and dstypes.  The data set of the value list's type must already
+    have been announced to the agent.
+    """
+    values = value_list.values
+    count = len(values)
+    packer = _COMPACT_VALUES.get(count)
+    if packer is None:
+        packer = _COMPACT_VALUES[count] = struct.Struct(">H%dd" % count)
+
+    if None in values:
+        values = [NAN if v is None else v for v in values]
+
+    return b"".join(
+        (
+            encode_str(value_list.host),
+            encode_str(value_list.plugin),
+            encode_str(value_list.plugin_instance),
+            encode_str(value_list.type),
+            encode_str(value_list.type_instance),
+            encode_float(value_list.time),
+            encode_float(value_list.interval),
+            packer.pack(count, *values),
+            _encode_meta(value_list.meta),
+        )
+    )
@@ -0,0 +1,82 @@
+"""
+A runner that hosts many instances of collectd plugins in a single Python
+interpreter, instead of one interpreter per instance.  Each instance is
+configured in isolated mode (see sfxcollectd.collectd) and all of the messages
+to and from it are wrapped in MSG_TYPE_INSTANCE frames that carry the id the
+agent assigned to it.
+"""
+import logging
+
+from sfxrunner.logs import log_exc_traceback_as_error, set_log_level
+from sfxrunner.messages import MSG_TYPE_CONFIGURE, MSG_TYPE_SET_LOG_LEVEL, MSG_TYPE_SHUTDOWN, InstanceMessageWriter
+
+from .runner import Runner
+
+logger = logging.getLogger(__name__)
+
+
+class Host(object):
+    """
+    Creates and shuts down a Runner for each instance as the agent asks for
+    them.  Logs are not wrapped in instance frames since the logging config is
+    global to the interpreter.
+    """
+
+    def __init__(self, input_reader, output_writer):
+        self.input_reader = input_reader
+        self.output_writer = output_writer
+        self.runners = {}
+
+    def process(self):
+        """
+        Handles messages from the agent until it sends a shutdown message that
+        isn't for a particular instance, or the pipe is closed, at which point
+        all remaining instances are shut down and this method returns.
+        """
+        logger.info("Waiting for instances to be configured")
+
+        for msg in self.input_reader.iter_messages():
+            if msg.instance_id is None:
+                # The log level is global to the interpreter so the agent sets
+                # it for the host as a whole
+                if msg.type == MSG_TYPE_SET_LOG_LEVEL:
+                    set_log_level(msg.payload.get("level"))
+                    continue
+                assert msg.type == MSG_TYPE_SHUTDOWN, "Expected shutdown message, got %d" % msg.type
+                break
+
+            if msg.type == MSG_TYPE_CONFIGURE:
+                self.configure_instance(msg.instance_id, msg.payload)
+            elif msg.type == MSG_TYPE_SHUTDOWN:
+                self.shutdown_instance(msg.instance_id)
+            else:
+                logger.error("Unexpected message type %d for instance %d", msg.type, msg.instance_id)
+
+        for instance_id in list(self.runners):
+            self.shutdown_instance(instance_id)
+        self.output_writer.flush()
+
+    def configure_instance(self, instance_id, config):
+        """
+        Configures a new plugin instance
+        """
+        if instance_id in self.runners:
+            logger.warning("Instance %d is being reconfigured, shutting down the old one", instance_id)
+            self.shutdown_instance(instance_id)
+
+        runner = Runner(None, InstanceMessageWriter(self.output_writer, instance_id), isolated=True)
+        if runner.configure(config):
+            self.runners[instance_id] = runner
+
+    def shutdown_instance(self, instance_id):
+        """
+        Shuts down a single plugin instance.  This depends on the plugin's
+        shutdown callbacks to release whatever it was holding on to.
+        """
+        runner = self.runners.pop(instance_id, None)
+        if not runner:
+            return
+        try:
+            runner.shutdown()
+        except Exception:  # pylint: disable=broad-except
+            log_exc_traceback_as_error()
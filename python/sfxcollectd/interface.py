@@ -51,7 +51,13 @@ class CollectdInterface(object):
             func = callback
 
         self.read_initializers.append(
-            partial(self.scheduler.run_on_interval, interval or self.default_interval, func, immediately=True)
+            partial(
+                self.scheduler.run_on_interval,
+                interval or self.default_interval,
+                func,
+                immediately=True,
+                name=final_name,
+            )
         )
 
     @staticmethod
@@ -132,11 +138,16 @@ class Values(object):  # pylint: disable=too-many-instance-attributes
         """
         if not self.time:
             self.time = time.time()
-        logger.debug("Dispatching value %s", repr(self))
+        # The value list is only formatted if debug logging is enabled
+        logger.debug("Dispatching value %r", self)
         # convert boolean values to their integer type
-        # because that is what collectd does
-        self.values = [int(value) if isinstance(value, bool) else value for value in self.values]
-        Values._dispatcher_func(self)
+        # because that is what collectd does, but only copy the values if
+        # there are any since there usually aren't
+        for value in self.values:
+            if value.__class__ is bool:
+                self.values = [int(v) if v.__class__ is bool else v for v in self.values]
+                break
+        type(self)._dispatcher_func(self)
 
     @classmethod
     def set_dispatcher_func(cls, func):
@@ -168,13 +179,12 @@ class Values(object):  # pylint: disable=too-many-instance-attributes
         )
 
 
-def inject_collectd_module(interface, send_values_func):
+def make_collectd_module(interface, send_values_func):
     """
-    Creates and registers the collectd python module so that plugins can import
-    it properly.  This should only be called once per python interpreter.
+    Creates a collectd python module that is bound to the given interface.
+    Each module gets its own Values class so that values dispatched by the
+    plugin that imported it go to `send_values_func`.
     """
-    assert "collectd" not in sys.modules, "collectd module should only be created once"
-
     mod = types.ModuleType("collectd")
     mod.register_config = interface.register_config
     mod.register_init = interface.register_init
@@ -187,6 +197,16 @@ def inject_collectd_module(interface, send_values_func):
     mod.info = logger.info
     mod.debug = logger.debug
 
-    Values.set_dispatcher_func(send_values_func)
-    mod.Values = Values
-    sys.modules["collectd"] = mod
+    mod.Values = type("Values", (Values,), {"__slots__": ()})
+    mod.Values.set_dispatcher_func(send_values_func)
+    return mod
+
+
+def inject_collectd_module(interface, send_values_func):
+    """
+    Creates and registers the collectd python module so that plugins can import
+    it properly.  This should only be called once per python interpreter.
+    """
+    assert "collectd" not in sys.modules, "collectd module should only be created once"
+
+    sys.modules["collectd"] = make_collectd_module(interface, send_values_func)
@@ -2,27 +2,62 @@
 Logic around the actual runner that manages the lifecycle of the plugin.
 """
 import logging
-
-from sfxrunner.logs import log_exc_traceback_as_error
-from sfxrunner.messages import MSG_TYPE_CONFIGURE, MSG_TYPE_CONFIGURE_RESULT, MSG_TYPE_SHUTDOWN
+import threading
+
+from sfxrunner.codec import CODEC_BINARY, CODEC_JSON, choose_codec
+from sfxrunner.logs import log_exc_traceback_as_error, set_log_level
+from sfxrunner.messages import (
+    MSG_TYPE_CONFIGURE,
+    MSG_TYPE_CONFIGURE_RESULT,
+    MSG_TYPE_SET_LOG_LEVEL,
+    MSG_TYPE_SHUTDOWN,
+    configure_result,
+)
+from sfxrunner.scheduler.stats import StatsReporter
 
 from .collectd import CollectdMonitorProxy
+from .encoding import (
+    data_set_to_dict,
+    encode_compact_value_list,
+    encode_value_list,
+    is_notification,
+    value_list_to_dict,
+)
 
 logger = logging.getLogger(__name__)
 
 # Message type for a value list from the collectd plugin.  This encapsulates
 # both metrics and events (notifications).
 MSG_TYPE_VALUE_LIST = 100
-
-
-class Runner(object):
+# The same as above but encoded with the binary codec.  Notifications are
+# always sent as JSON.
+MSG_TYPE_VALUE_LIST_BINARY = 101
+# The dsnames and dstypes of a type, which are sent once before the first value
+# list of that type if the agent supports the type table.  Value lists of
+# announced types are sent without them.
+MSG_TYPE_DATA_SET = 102
+# A value list of an announced type encoded with the compact binary encoding
+MSG_TYPE_VALUE_LIST_COMPACT = 103
+
+
+class Runner(object):  # pylint: disable=too-many-instance-attributes
     """
     Manages the creation and shutdown of the collectd plugin.  This acts as the
     mediator between the agent and the monitor proxy in Python.
     """
 
-    def __init__(self, input_reader, output_writer):
+    def __init__(self, input_reader, output_writer, isolated=False):
         self._monitor_proxy = None
+        self._stats_reporter = None
+        self.codec = CODEC_JSON
+        # Whether the agent keeps a table of the data sets of the types that
+        # have been announced to it
+        self.type_table = False
+        self._announced_types = set()
+        self._announce_lock = threading.Lock()
+        # Whether the plugin shares this interpreter with other runners (see
+        # sfxcollectd.host)
+        self.isolated = isolated
 
         self.input_reader = input_reader
         self.output_writer = output_writer
@@ -31,40 +66,116 @@ class Runner(object):
         """
         This is a fairly simple state machine.  It waits for a configure
         message that gives it the configuration and then it waits for a
-        shutdown message, at which point this method returns.
+        shutdown message, at which point this method returns.  The log level
+        can be changed at any point after configuring.
         """
         logger.info("Waiting for configure message")
 
         msg = self.input_reader.recv_msg()
         assert msg.type == MSG_TYPE_CONFIGURE, "Expected first message to be configure message"
 
-        self._monitor_proxy = CollectdMonitorProxy(self.send_value_list)
+        if not self.configure(msg.payload):
+            return
+
+        for msg in self.input_reader.iter_messages():
+            if msg.type == MSG_TYPE_SET_LOG_LEVEL:
+                set_log_level(msg.payload.get("level"))
+                continue
+            assert msg.type == MSG_TYPE_SHUTDOWN, "Expected shutdown message, got %d" % msg.type
+            break
+
+        self.shutdown()
+
+    def configure(self, config):
+        """
+        Configures the plugin and starts reading from it, and sends the result
+        back to the agent.  Returns whether the plugin was configured
+        successfully.
+        """
+        # The log level is global to the interpreter, but every instance in a
+        # shared host is given the agent's level so they all set the same one.
+        set_log_level(config.get("logLevel"))
+        self.codec = choose_codec(config)
+        self.type_table = bool(config.get("typeTable"))
+        logger.info("Using %s codec for value lists", self.codec)
+
+        self._monitor_proxy = CollectdMonitorProxy(self.send_value_list, isolated=self.isolated)
         err = None
         try:
             # This should fire off a separate thread that runs the various
             # callbacks for the collectd plugin code.
-            self._monitor_proxy.configure(msg.payload)
+            self._monitor_proxy.configure(config)
         except Exception as e:  # pylint: disable=broad-except
             log_exc_traceback_as_error()
             err = e
 
-        self.output_writer.send_msg(MSG_TYPE_CONFIGURE_RESULT, {"error": repr(err) if err else None})
+        self.output_writer.send_msg(MSG_TYPE_CONFIGURE_RESULT, configure_result(err))
 
         if err:
-            return
+            return False
+
+        batch_interval = config.get("batchFlushIntervalSeconds")
+        if batch_interval:
+            self.output_writer.enable_batching(
+                (MSG_TYPE_VALUE_LIST, MSG_TYPE_VALUE_LIST_BINARY, MSG_TYPE_DATA_SET, MSG_TYPE_VALUE_LIST_COMPACT),
+                batch_interval,
+                config.get("batchMaxBytes"),
+            )
 
         self._monitor_proxy.start_reading()
 
-        msg = self.input_reader.recv_msg()
-        assert msg.type == MSG_TYPE_SHUTDOWN, "Expected shutdown message, got %d" % msg.type
+        self._stats_reporter = StatsReporter(self.output_writer, config["intervalSeconds"], self._monitor_proxy.stats)
+        self._stats_reporter.start()
+        return True
 
-        self._monitor_proxy.shutdown()
+    def shutdown(self):
+        """
+        Shuts down the plugin and sends anything that is still pending
+        """
+        if self._monitor_proxy:
+            self._monitor_proxy.shutdown()
+        if self._stats_reporter:
+            self._stats_reporter.stop()
+        self.output_writer.flush()
 
     def send_value_list(self, value_list):
         """
-        Sends a value list from collectd to the agent by json encoding it
+        Sends a value list from collectd to the agent, encoded with the codec
+        negotiated with the agent
         """
         # output_writer is thread-safe, which is necessary since plugins can
         # register multiple read callbacks which could emit value lists
         # simultaneously.
-        self.output_writer.send_msg(MSG_TYPE_VALUE_LIST, value_list)
+        if is_notification(value_list):
+            self.output_writer.send_msg(MSG_TYPE_VALUE_LIST, value_list_to_dict(value_list))
+            return
+
+        announced = self.type_table and self._announce_data_set(value_list)
+        if self.codec == CODEC_BINARY:
+            if announced:
+                self.output_writer.send_bytes(MSG_TYPE_VALUE_LIST_COMPACT, encode_compact_value_list(value_list))
+            else:
+                self.output_writer.send_bytes(MSG_TYPE_VALUE_LIST_BINARY, encode_value_list(value_list))
+        else:
+            self.output_writer.send_msg(MSG_TYPE_VALUE_LIST, value_list_to_dict(value_list, not announced))
+
+    def _announce_data_set(self, value_list):
+        """
+        Sends the data set of the value list's type to the agent if it hasn't
+        been sent yet.  Returns whether the agent knows the data set, and so
+        whether the value list can be sent without it.
+        """
+        type_name = value_list.type
+        if type_name in self._announced_types:
+            return True
+        if not value_list.dsnames:
+            return False
+
+        with self._announce_lock:
+            # The type is only marked as announced once the announcement has
+            # been written so that no other thread can send a value list of
+            # the type ahead of it.
+            if type_name not in self._announced_types:
+                self.output_writer.send_msg(MSG_TYPE_DATA_SET, data_set_to_dict(value_list))
+                self._announced_types.add(type_name)
+        return True
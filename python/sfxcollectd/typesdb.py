@@ -1,14 +1,40 @@
 """
 Logic dealing with types.db files
+
+Parsing the larger types.db files in every runner is relatively expensive, so
+each file is compiled once into an index of the raw data source specs of each
+type, which is cached on disk with marshal.  The data sets themselves are only
+parsed out of the index when a plugin actually uses their type.
 """
 
+import errno
+import hashlib
+import logging
+import marshal
+import os
+import stat
+import sys
+import tempfile
 from collections import namedtuple
 
+logger = logging.getLogger(__name__)
+
 DataSet = namedtuple("DataSet", "name sources")
 DataSource = namedtuple("DataSource", "name type min max")
 
 ACCEPTABLE_TYPES = ["GAUGE", "ABSOLUTE", "COUNTER", "DERIVE"]
 
+# Bump this whenever the format of the cached indexes changes
+INDEX_VERSION = 1
+
+# Where the compiled indexes are cached, unless overridden by the
+# SFX_TYPESDB_CACHE_DIR envvar.  The cached indexes are loaded as is, so each
+# user gets their own dir, which is only used if nobody else can write to it.
+if hasattr(os, "geteuid"):
+    DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "signalfx-agent-typesdb-%d" % os.geteuid())
+else:
+    DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "signalfx-agent-typesdb")
+
 
 def parse_types_db(content):
     """
@@ -23,22 +49,152 @@ def parse_types_db(content):
         if not entry or entry.startswith("#"):
             continue
 
-        name, source_specs = entry.split()[0], entry.split()[1:]
-        if not source_specs:
-            raise ValueError("types.db entry has no data source specs: '%s'" % entry)
+        fields = entry.split()
+        data_sets.append(parse_data_set(fields[0], fields[1:], entry))
 
-        dataset = DataSet(name=name.strip(), sources=[])
-        for source in source_specs:
-            parts = source.rstrip(",").split(":")
-            if len(parts) != 4:
-                raise ValueError("types.db data source '%s' is not a quadruple" % source)
+    return data_sets
 
-            name, source_type, min_val, max_val = parts
-            if source_type.upper() not in ACCEPTABLE_TYPES:
-                raise ValueError("Bad type '%s' in data source spec '%s'" % (source_type, entry))
 
-            dataset.sources.append(DataSource(name=name, type=source_type.upper(), min=min_val, max=max_val))
+def parse_data_set(name, source_specs, entry):
+    """
+    Parses the data source specs of a single types.db entry
+    """
+    if not source_specs:
+        raise ValueError("types.db entry has no data source specs: '%s'" % entry)
 
-        data_sets.append(dataset)
+    dataset = DataSet(name=name, sources=[])
+    for source in source_specs:
+        parts = source.rstrip(",").split(":")
+        if len(parts) != 4:
+            raise ValueError("types.db data source '%s' is not a quadruple" % source)
 
-    return data_sets
+        source_name, source_type, min_val, max_val = parts
+        if source_type.upper() not in ACCEPTABLE_TYPES:
+            raise ValueError("Bad type '%s' in data source spec '%s'" % (source_type, entry))
+
+        dataset.sources.append(DataSource(name=source_name, type=source_type.upper(), min=min_val, max=max_val))
+
+    return dataset
+
+
+def compile_types_db(content):
+    """
+    Validates the given types.db file content and returns an index of the data
+    source specs of each type, as a single space-separated string
+    """
+    return dict((ds.name, " ".join(":".join(s) for s in ds.sources)) for ds in parse_types_db(content))
+
+
+def _index_cache_path(cache_dir, path, file_stat):
+    # Changing the file or the Python version (which can change the marshal
+    # format) invalidates the cached index
+    key = "%s|%s|%s|%s|%s" % (
+        INDEX_VERSION,
+        os.path.abspath(path),
+        file_stat.st_mtime,
+        file_stat.st_size,
+        sys.version_info[:2],
+    )
+    return os.path.join(cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".marshal")
+
+
+def _ensure_private_dir(cache_dir):
+    """
+    Creates the cache dir, readable only by the current user, if it doesn't
+    exist yet.  Raises OSError if the dir is a symlink or anyone but the
+    current user could have written to it, since the indexes in it are
+    trusted.
+    """
+    try:
+        os.makedirs(cache_dir, 0o700)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+    dir_stat = os.lstat(cache_dir)
+    if not stat.S_ISDIR(dir_stat.st_mode):
+        raise OSError("%s is not a directory" % cache_dir)
+    if hasattr(os, "geteuid"):
+        if dir_stat.st_uid != os.geteuid():
+            raise OSError("%s is owned by uid %d instead of %d" % (cache_dir, dir_stat.st_uid, os.geteuid()))
+        if dir_stat.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            raise OSError("%s is writable by other users" % cache_dir)
+
+
+def _write_index(cache_path, index):
+    cache_dir = os.path.dirname(cache_path)
+    # Write to a temp file first so that other runners never see a partially
+    # written index
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir)
+    try:
+        with os.fdopen(fd, "wb") as fd_file:
+            fd_file.write(marshal.dumps(index))
+        os.rename(tmp_path, cache_path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+def load_types_db_index(path, cache_dir=None):
+    """
+    Returns the compiled index of the given types.db file, from the cache if
+    the file hasn't changed since it was cached
+    """
+    cache_dir = cache_dir or os.environ.get("SFX_TYPESDB_CACHE_DIR") or DEFAULT_CACHE_DIR
+    try:
+        _ensure_private_dir(cache_dir)
+    except OSError as e:
+        logger.warning("Not caching types.db indexes in %s: %s", cache_dir, e)
+        return _compile_types_db_file(path)
+
+    cache_path = _index_cache_path(cache_dir, path, os.stat(path))
+
+    try:
+        with open(cache_path, "rb") as fd:
+            return marshal.loads(fd.read())
+    except (IOError, OSError, EOFError, ValueError, TypeError):
+        pass
+
+    index = _compile_types_db_file(path)
+
+    try:
+        _write_index(cache_path, index)
+    except (IOError, OSError) as e:
+        logger.debug("Could not cache types.db index for %s: %s", path, e)
+
+    return index
+
+
+def _compile_types_db_file(path):
+    with open(path, "r") as fd:
+        return compile_types_db(fd.read())
+
+
+class TypesDB(object):
+    """
+    The data sets of one or more types.db files, which are only parsed when
+    they are looked up.  Types in later files override those in earlier ones.
+    """
+
+    def __init__(self, paths, cache_dir=None):
+        self.paths = paths
+        self.specs = {}
+        for path in paths:
+            self.specs.update(load_types_db_index(path, cache_dir))
+        self.datasets = {}
+
+    def __len__(self):
+        return len(self.specs)
+
+    def get(self, name):
+        """
+        Returns the data set with the given type name, or None if none of the
+        types.db files has it
+        """
+        dataset = self.datasets.get(name)
+        if dataset is None:
+            spec = self.specs.get(name)
+            if spec is None:
+                return None
+            dataset = self.datasets[name] = parse_data_set(name, spec.split(), spec)
+        return dataset
@@ -5,7 +5,6 @@ monitor
 from __future__ import absolute_import
 
 import logging
-import logging.config
 import sys
 
 from sfxrunner.logs import PipeLogHandler, log_exc_traceback_as_error
@@ -14,7 +13,8 @@ from sfxrunner.messages import setup_io_pipes
 from .runner import Runner
 
 logger = logging.getLogger()
-logger.setLevel(logging.DEBUG)
+# The agent sends its own log level with the configure message
+logger.setLevel(logging.INFO)
 
 
 def run():
@@ -24,7 +24,8 @@ def run():
     """
     input_reader, output_writer = setup_io_pipes()
 
-    # Logs go through our stdout pipe back to the agent.
+    # Logs go through our stdout pipe back to the agent from a background
+    # thread.
     logger.addHandler(PipeLogHandler(output_writer))
 
     runner = Runner(input_reader, output_writer)
@@ -37,3 +38,7 @@ try:
 except Exception as e:  # pylint: disable=broad-except
     # runner.stop()
     log_exc_traceback_as_error()
+finally:
+    # Forked runners exit without running atexit hooks, so the log handler has
+    # to be flushed explicitly to send the last records
+    logging.shutdown()
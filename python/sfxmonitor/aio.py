@@ -0,0 +1,197 @@
+"""
+Support for monitors that are written as asyncio coroutines.  This requires
+Python 3.5+, so it is only imported by `sfxmonitor.runner` when the monitor
+being loaded is async.
+
+A monitor can either be an `async def run(config, output)` function, which is
+run every `intervalSeconds`, or a `Monitor` class whose `configure` method
+is a coroutine.  A `shutdown` method can be either a coroutine or a regular
+method.  Either way, all of the
+coroutines of the monitor run on a single event loop in a dedicated thread.
+"""
+from __future__ import absolute_import
+
+import asyncio
+import logging
+import threading
+from concurrent import futures
+from functools import partial
+
+from sfxrunner.scheduler.aio import AsyncIntervalScheduler
+from sfxrunner.scheduler.clock import monitor_spread_key
+from sfxrunner.scheduler.stats import DEFAULT_MAX_BACKOFF_SECONDS, validate_overrun_policy
+
+from .output import Output
+
+logger = logging.getLogger(__name__)
+
+# How long to wait for the monitor's coroutines to finish when shutting down
+SHUTDOWN_TIMEOUT_SECONDS = 5.0
+# How long to wait for the `configure` coroutine of a Monitor class to finish
+CONFIGURE_TIMEOUT_SECONDS = 60.0
+
+
+class AsyncOutput(Output):
+    """
+    An Output whose `send_datapoints` can be called from the event loop
+    without blocking it.  The datapoints are encoded and written to the pipe
+    by a single writer thread, in the order that they were sent, and
+    `send_datapoints` returns a future that completes once they are written.
+    The future can be awaited but doesn't have to be.
+    """
+
+    def __init__(self, output_writer, ready_event, codec, loop):
+        super(AsyncOutput, self).__init__(output_writer, ready_event, codec)
+        self.loop = loop
+        self.executor = futures.ThreadPoolExecutor(max_workers=1)
+        # The task of the monitor's `configure` coroutine, if it has one
+        self.configure_task = None
+
+    def send_datapoints(self, datapoints):
+        """
+        Sends a set of datapoints back up to the agent from the event loop
+        thread and returns an awaitable future.  `datapoints` should be a list
+        of `sfxmonitor.datapoint.Datapoint` instances or a
+        `sfxmonitor.datapoint.DatapointBatch`.
+        """
+        # Sends wait until the configure result has been sent to the agent,
+        # which would never happen if `configure` itself waited on them
+        if (
+            self.configure_task is not None
+            and not self.ready_event.is_set()
+            and _current_task(self.loop) is self.configure_task
+        ):
+            raise RuntimeError("You should not send datapoints from the 'configure' coroutine of your monitor")
+        return self.loop.run_in_executor(self.executor, super(AsyncOutput, self).send_datapoints, datapoints)
+
+    def close(self):
+        """
+        Waits for all of the pending datapoints to be written
+        """
+        self.executor.shutdown(wait=True)
+
+
+def _current_task(loop):
+    # Task.current_task was moved to the asyncio module in Python 3.7
+    current_task = getattr(asyncio, "current_task", None) or asyncio.Task.current_task
+    return current_task(loop)
+
+
+def _all_tasks(loop):
+    # Task.all_tasks was moved to the asyncio module in Python 3.7
+    all_tasks = getattr(asyncio, "all_tasks", None) or asyncio.Task.all_tasks
+    return all_tasks(loop)
+
+
+class AsyncMonitor(object):
+    """
+    Drives an async monitor on an event loop that runs in its own thread.  It
+    has the same `configure` and `shutdown` methods as a regular monitor, which
+    are called from the runner thread.
+    """
+
+    def __init__(self, output_writer, ready_event, codec, mon_cls=None, run_func=None):
+        self.loop = asyncio.new_event_loop()
+        self.output = AsyncOutput(output_writer, ready_event, codec, self.loop)
+        self.thread = threading.Thread(target=self._run_loop, name="asyncio-monitor")
+        self.thread.daemon = True
+
+        self.run_func = run_func
+        self.inst = mon_cls(self.output) if mon_cls else None
+        self.scheduler = None
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def _call(self, func, *args, **kwargs):
+        """
+        Calls `func` on the event loop thread and blocks until the awaitable
+        that it returns, if any, is done.  Returns the result of the awaitable
+        or raises its exception.
+        """
+        result = futures.Future()
+        tasks = []
+
+        def copy_result(fut):
+            if fut.cancelled():
+                result.cancel()
+            elif fut.exception() is not None:
+                result.set_exception(fut.exception())
+            else:
+                result.set_result(fut.result())
+
+        def call():
+            try:
+                awaitable = func(*args)
+                if awaitable is None:
+                    result.set_result(None)
+                    return
+                task = asyncio.ensure_future(awaitable, loop=self.loop)
+                tasks.append(task)
+                task.add_done_callback(copy_result)
+            except Exception as e:  # pylint: disable=broad-except
+                result.set_exception(e)
+
+        self.loop.call_soon_threadsafe(call)
+        try:
+            return result.result(kwargs.get("timeout"))
+        except futures.TimeoutError:
+            for task in tasks:
+                self.loop.call_soon_threadsafe(task.cancel)
+            raise
+
+    def _start_configure(self, config):
+        awaitable = self.inst.configure(config)
+        if awaitable is None:
+            return None
+        self.output.configure_task = asyncio.ensure_future(awaitable, loop=self.loop)
+        return self.output.configure_task
+
+    def configure(self, config):
+        """
+        Starts the event loop and configures the monitor on it
+        """
+        self.thread.start()
+
+        if self.inst is not None:
+            try:
+                self._call(self._start_configure, config, timeout=CONFIGURE_TIMEOUT_SECONDS)
+            except futures.TimeoutError:
+                raise RuntimeError("Monitor did not finish configuring within %s seconds" % CONFIGURE_TIMEOUT_SECONDS)
+            return
+
+        self.scheduler = AsyncIntervalScheduler(
+            validate_overrun_policy(config.get("overrunPolicy")),
+            loop=self.loop,
+            align_to_wall_clock=bool(config.get("alignToWallClock")),
+            spread_key=monitor_spread_key(config),
+            max_backoff=config.get("maxBackoffSeconds") or DEFAULT_MAX_BACKOFF_SECONDS,
+        )
+        self.scheduler.run_on_interval(config["intervalSeconds"], partial(self.run_func, config, self.output))
+
+    def _cancel_tasks(self):
+        tasks = list(_all_tasks(self.loop))
+        for task in tasks:
+            task.cancel()
+        return asyncio.gather(*tasks, return_exceptions=True)
+
+    def shutdown(self):
+        """
+        Shuts down the monitor, cancels any of its tasks that are still
+        running, and stops the event loop
+        """
+        if not self.thread.is_alive():
+            return
+        try:
+            if self.scheduler is not None:
+                self.scheduler.stop()
+            if self.inst is not None and hasattr(self.inst, "shutdown"):
+                self._call(self.inst.shutdown, timeout=SHUTDOWN_TIMEOUT_SECONDS)
+            self._call(self._cancel_tasks, timeout=SHUTDOWN_TIMEOUT_SECONDS)
+        except Exception:  # pylint: disable=broad-except
+            logger.exception("Error shutting down async monitor")
+
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(SHUTDOWN_TIMEOUT_SECONDS)
+        self.output.close()
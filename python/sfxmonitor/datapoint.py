@@ -27,3 +27,98 @@ def cumulative(name, value, dimensions=None, timestamp=None):
     Creates a cumulative counter datapoint.
     """
     return Datapoint(name, TYPE_CUMULATIVE, value, dimensions, timestamp)
+
+
+class DatapointBatch(object):
+    """
+    A columnar collection of datapoints that is much cheaper to build up and
+    send than a list of `Datapoint` instances when a monitor emits a lot of
+    datapoints at once.  Each datapoint is stored across parallel lists and
+    its dimensions are referenced by the id of a distinct dimension set, so a
+    dimension dict that is shared by many datapoints is only stored and
+    encoded once.
+
+    Dimension sets can be interned up front with `intern_dimensions` and the
+    returned id passed to `add`, which avoids hashing the dimensions for every
+    datapoint.  An instance can be passed anywhere a list of datapoints is
+    accepted by `sfxmonitor.output.Output`.
+    """
+
+    __slots__ = ["types", "names", "values", "timestamps", "dimensions_ids", "dimension_sets", "_dimension_set_ids"]
+
+    def __init__(self):
+        self.types = []
+        self.names = []
+        self.values = []
+        # Timestamps in milliseconds, or None to use the current time
+        self.timestamps = []
+        self.dimensions_ids = []
+
+        # The distinct dimension dicts, indexed by the ids in dimensions_ids.
+        # Id 0 is always the empty set of dimensions.
+        self.dimension_sets = [{}]
+        self._dimension_set_ids = {frozenset(): 0}
+
+    def intern_dimensions(self, dimensions):
+        """
+        Returns the id of the given dimension dict in this batch, adding it if
+        it hasn't been seen before.
+        """
+        if not dimensions:
+            return 0
+
+        try:
+            key = frozenset(dimensions.items())
+        except TypeError:
+            # Values that can't be hashed, like lists, are sent as strings,
+            # but the dimension set can't be shared with other datapoints
+            self.dimension_sets.append(dict(dimensions))
+            return len(self.dimension_sets) - 1
+
+        dimensions_id = self._dimension_set_ids.get(key)
+        if dimensions_id is None:
+            dimensions_id = len(self.dimension_sets)
+            self.dimension_sets.append(dict(dimensions))
+            self._dimension_set_ids[key] = dimensions_id
+        return dimensions_id
+
+    def add(self, metric_type, name, value, dimensions_id=0, timestamp=None):
+        """
+        Adds a datapoint with dimensions that were already interned with
+        `intern_dimensions`.  `timestamp` is in seconds like the rest of the
+        datapoint helpers.
+        """
+        self.types.append(metric_type)
+        self.names.append(name)
+        self.values.append(value)
+        self.timestamps.append(int(timestamp * 1000) if timestamp else None)
+        self.dimensions_ids.append(dimensions_id)
+
+    def add_gauge(self, name, value, dimensions=None, timestamp=None):
+        """
+        Adds a gauge datapoint with the given dimension dict
+        """
+        self.add(TYPE_GAUGE, name, value, self.intern_dimensions(dimensions), timestamp)
+
+    def add_cumulative(self, name, value, dimensions=None, timestamp=None):
+        """
+        Adds a cumulative counter datapoint with the given dimension dict
+        """
+        self.add(TYPE_CUMULATIVE, name, value, self.intern_dimensions(dimensions), timestamp)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __iter__(self):
+        """
+        Yields each datapoint in the batch as a `Datapoint` instance
+        """
+        for i, name in enumerate(self.names):
+            timestamp = self.timestamps[i]
+            yield Datapoint(
+                name,
+                self.types[i],
+                self.values[i],
+                self.dimension_sets[self.dimensions_ids[i]] or None,
+                timestamp / 1000.0 if timestamp else None,
+            )
@@ -0,0 +1,204 @@
+"""
+Binary encoding of datapoint lists.  See `sfxrunner.codec` for the primitive
+encodings.
+
+Most datapoints sent together share a small number of distinct dimension sets,
+so a datapoint list starts with a table of the dimension sets used in it, which
+is the number of sets as a uint32 followed by each set, encoded as the number
+of dimensions as a uint16 and the key and value strings of each dimension.
+
+That is followed by the number of datapoints as a uint32 and then each
+datapoint, which is encoded as:
+
+ - the metric type as a uint8
+ - the metric name string
+ - the value kind as a uint8 (0 for int64, 1 for float64) and the value
+ - the timestamp in milliseconds as an int64, or 0 if not set
+ - the index of its dimension set in the table as a uint32
+
+Datapoints that can't be encoded (e.g. because their value isn't a number, or
+a string is too long) are left out and logged instead of failing the whole
+list.
+"""
+from __future__ import absolute_import
+
+import logging
+import struct
+
+from sfxrunner.codec import FLOAT64, INT64, MAX_INT64, MIN_INT64, UINT16, UINT32, encode_str
+
+from .datapoint import TYPE_COUNTER, TYPE_CUMULATIVE, TYPE_GAUGE
+
+logger = logging.getLogger(__name__)
+
+# The errors that the encoders raise for values they can't encode
+_ENCODING_ERRORS = (TypeError, ValueError, KeyError, struct.error)
+
+METRIC_TYPE_CODES = {TYPE_GAUGE: b"\x00", TYPE_COUNTER: b"\x01", TYPE_CUMULATIVE: b"\x02"}
+
+VALUE_KIND_INT = b"\x00"
+VALUE_KIND_FLOAT = b"\x01"
+
+
+def encode_value(value):
+    """
+    Returns the value kind and binary encoding of a datapoint value
+    """
+    if isinstance(value, float):
+        return VALUE_KIND_FLOAT + FLOAT64.pack(value)
+    # Bools and ints that are too big for an int64 get sent as floats.
+    if MIN_INT64 <= value <= MAX_INT64:
+        return VALUE_KIND_INT + INT64.pack(int(value))
+    return VALUE_KIND_FLOAT + FLOAT64.pack(value)
+
+
+def encode_dimensions(dimensions):
+    """
+    Returns the binary encoding of a dimension dict, which can be None
+    """
+    if not dimensions:
+        return b"\x00\x00"
+    parts = [UINT16.pack(len(dimensions))]
+    for key, value in dimensions.items():
+        parts.append(encode_str(key))
+        parts.append(encode_str(value))
+    return b"".join(parts)
+
+
+def encode_dimension_table(dimension_sets):
+    """
+    Returns the binary encoding of a list of dimension dicts
+    """
+    return UINT32.pack(len(dimension_sets)) + b"".join(encode_dimensions(dims) for dims in dimension_sets)
+
+
+def _is_encodable(metric_type, name, value, timestamp_ms, failures):
+    try:
+        if metric_type not in METRIC_TYPE_CODES:
+            raise ValueError("Unknown metric type %r" % (metric_type,))
+        encode_str(name)
+        encode_value(value)
+        INT64.pack(int(timestamp_ms or 0))
+    except _ENCODING_ERRORS as e:
+        failures.append(((metric_type, name, value), e))
+        return False
+    return True
+
+
+def _is_encodable_dimensions(dimensions, failures):
+    try:
+        encode_dimensions(dimensions)
+    except _ENCODING_ERRORS as e:
+        failures.append((dimensions, e))
+        return False
+    return True
+
+
+def _log_failures(dropped, failures):
+    if not dropped:
+        return
+    example, err = failures[0]
+    logger.error("Dropped %d datapoint(s) that could not be encoded, e.g. %.200r: %s", dropped, example, err)
+
+
+def encode_datapoints(datapoints):
+    """
+    Returns the binary encoding of a list of `sfxmonitor.datapoint.Datapoint`
+    instances.  Unlike the JSON encoding, this does not require grouping the
+    datapoints by metric type.
+    """
+    try:
+        return _encode_datapoints(datapoints)
+    except _ENCODING_ERRORS:
+        pass
+
+    # The datapoints are only checked one by one once the list as a whole has
+    # failed, so that the common case doesn't pay for it.
+    failures = []
+    encodable_dimensions = {}
+    valid = []
+    for dp in datapoints:
+        dims_ok = encodable_dimensions.get(id(dp.dimensions))
+        if dims_ok is None:
+            dims_ok = encodable_dimensions[id(dp.dimensions)] = _is_encodable_dimensions(dp.dimensions, failures)
+        if dims_ok and _is_encodable(dp.type, dp.name, dp.value, dp.timestamp and dp.timestamp * 1000, failures):
+            valid.append(dp)
+    _log_failures(len(datapoints) - len(valid), failures)
+    return _encode_datapoints(valid)
+
+
+def _encode_datapoints(datapoints):
+    dimension_sets = []
+    # Monitors commonly reuse the same dimension dict for many datapoints, so
+    # look them up by object first to avoid hashing their contents.  The ids
+    # are stable since the datapoints hold references to the dicts.
+    indexes_by_object = {}
+    indexes_by_content = {}
+
+    parts = [UINT32.pack(len(datapoints))]
+    for dp in datapoints:
+        index = indexes_by_object.get(id(dp.dimensions))
+        if index is None:
+            try:
+                key = frozenset(dp.dimensions.items()) if dp.dimensions else frozenset()
+            except TypeError:
+                # Values that can't be hashed, like lists, are still encoded
+                # as strings, but the dict can only be shared by object
+                key = id(dp.dimensions)
+            index = indexes_by_content.get(key)
+            if index is None:
+                index = indexes_by_content[key] = len(dimension_sets)
+                dimension_sets.append(dp.dimensions)
+            indexes_by_object[id(dp.dimensions)] = index
+
+        parts.append(METRIC_TYPE_CODES[dp.type])
+        parts.append(encode_str(dp.name))
+        parts.append(encode_value(dp.value))
+        parts.append(INT64.pack(int(dp.timestamp * 1000) if dp.timestamp else 0))
+        parts.append(UINT32.pack(index))
+
+    return encode_dimension_table(dimension_sets) + b"".join(parts)
+
+
+def encode_datapoint_batch(batch):
+    """
+    Returns the binary encoding of a `sfxmonitor.datapoint.DatapointBatch`,
+    which is the same as the encoding of the equivalent list of datapoints.
+    The dimension sets that were interned in the batch are used as the
+    dimension table as is.
+    """
+    rows = zip(batch.types, batch.names, batch.values, batch.timestamps, batch.dimensions_ids)
+    try:
+        return _encode_batch(batch.dimension_sets, len(batch), rows)
+    except _ENCODING_ERRORS:
+        pass
+
+    # Dimension sets that can't be encoded are replaced with empty ones so
+    # that the ids of the others stay the same.
+    failures = []
+    dimension_sets = []
+    invalid_ids = set()
+    for dimensions_id, dimensions in enumerate(batch.dimension_sets):
+        if _is_encodable_dimensions(dimensions, failures):
+            dimension_sets.append(dimensions)
+        else:
+            dimension_sets.append({})
+            invalid_ids.add(dimensions_id)
+    rows = [
+        row
+        for row in zip(batch.types, batch.names, batch.values, batch.timestamps, batch.dimensions_ids)
+        if row[4] not in invalid_ids and _is_encodable(row[0], row[1], row[2], row[3], failures)
+    ]
+    _log_failures(len(batch) - len(rows), failures)
+    return _encode_batch(dimension_sets, len(rows), rows)
+
+
+def _encode_batch(dimension_sets, count, rows):
+    parts = [encode_dimension_table(dimension_sets), UINT32.pack(count)]
+    for metric_type, name, value, timestamp, dimensions_id in rows:
+        parts.append(METRIC_TYPE_CODES[metric_type])
+        parts.append(encode_str(name))
+        parts.append(encode_value(value))
+        parts.append(INT64.pack(timestamp or 0))
+        parts.append(UINT32.pack(dimensions_id))
+    return b"".join(parts)
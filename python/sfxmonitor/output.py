@@ -2,18 +2,24 @@ import threading
 from itertools import groupby
 from operator import attrgetter
 
-from .datapoint import cumulative, gauge
+from sfxrunner.codec import CODEC_BINARY, CODEC_JSON
+
+from .datapoint import DatapointBatch, cumulative, gauge
+from .encoding import encode_datapoint_batch, encode_datapoints
 
 # Message type for a datapoint list.
 MSG_TYPE_DATAPOINT_LIST = 200
+# Message type for a datapoint list encoded with the binary codec.
+MSG_TYPE_DATAPOINT_BINARY_LIST = 202
 
 
 class Output(object):
     _datapoint_key_func = attrgetter("type")
 
-    def __init__(self, output_writer, ready_event):
+    def __init__(self, output_writer, ready_event, codec=CODEC_JSON):
         self.output_writer = output_writer
         self.ready_event = ready_event
+        self.codec = codec
         self.creator_tid = threading.current_thread().ident
 
     def send_gauge(self, name, value, dimensions=None, timestamp=None):
@@ -38,12 +44,13 @@ class Output(object):
         Convenince function that calls `send_datapoints` with the given
         `datapoint` wrapped in a list.
         """
-        self.send_datapoints([datapoint])
+        return self.send_datapoints([datapoint])
 
     def send_datapoints(self, datapoints):
         """
         Sends a set of datapoints back up to the agent.  `datapoints` should be
-        a list of `sfxmonitor.datapoint.Datapoint` instances.
+        a list of `sfxmonitor.datapoint.Datapoint` instances or a
+        `sfxmonitor.datapoint.DatapointBatch`.
         """
         # This prevents deadlock with the ready_event flag.
         if threading.current_thread().ident == self.creator_tid:
@@ -56,8 +63,34 @@ class Output(object):
         # to the agent.
         self.ready_event.wait()
 
+        if isinstance(datapoints, DatapointBatch):
+            self._send_batch(datapoints)
+            return
+
+        if self.codec == CODEC_BINARY:
+            self.output_writer.send_bytes(MSG_TYPE_DATAPOINT_BINARY_LIST, encode_datapoints(datapoints))
+            return
+
         out = {}
         for typ, group in groupby(sorted(datapoints, key=self._datapoint_key_func), self._datapoint_key_func):
             out[typ] = [dp.as_dict() for dp in group]
 
         self.output_writer.send_msg(MSG_TYPE_DATAPOINT_LIST, out)
+
+    def _send_batch(self, batch):
+        if self.codec == CODEC_BINARY:
+            self.output_writer.send_bytes(MSG_TYPE_DATAPOINT_BINARY_LIST, encode_datapoint_batch(batch))
+            return
+
+        # The batch can be grouped by type in a single pass since it doesn't
+        # have to be sorted first like a list of datapoints.
+        out = {}
+        dimension_sets = batch.dimension_sets
+        for metric_type, name, value, timestamp, dimensions_id in zip(
+            batch.types, batch.names, batch.values, batch.timestamps, batch.dimensions_ids
+        ):
+            out.setdefault(metric_type, []).append(
+                {"metric": name, "value": value, "dimensions": dimension_sets[dimensions_id], "timestamp": timestamp}
+            )
+
+        self.output_writer.send_msg(MSG_TYPE_DATAPOINT_LIST, out)
@@ -5,16 +5,33 @@ import logging
 import os
 import threading
 
-from sfxrunner.imports import load_python_module
-from sfxrunner.logs import log_exc_traceback_as_error
-from sfxrunner.messages import MSG_TYPE_CONFIGURE, MSG_TYPE_CONFIGURE_RESULT, MSG_TYPE_SHUTDOWN
-
-from .output import Output
+from sfxrunner.codec import choose_codec
+from sfxrunner.imports import lazy_import, load_python_module
+from sfxrunner.logs import log_exc_traceback_as_error, set_log_level
+from sfxrunner.messages import (
+    MSG_TYPE_CONFIGURE,
+    MSG_TYPE_CONFIGURE_RESULT,
+    MSG_TYPE_SET_LOG_LEVEL,
+    MSG_TYPE_SHUTDOWN,
+    configure_result,
+)
+from sfxrunner.scheduler.stats import StatsReporter
+
+from .output import MSG_TYPE_DATAPOINT_BINARY_LIST, MSG_TYPE_DATAPOINT_LIST, Output
 from .simple import SimpleMonitor
 
+# inspect is slow to import and is only needed once a monitor is loaded
+inspect = lazy_import("inspect")  # pylint: disable=invalid-name
+
 logger = logging.getLogger(__name__)
 
 
+def _is_coroutine_function(func):
+    # Python 2 has no coroutines, and so no async monitors
+    iscoroutinefunction = getattr(inspect, "iscoroutinefunction", None)
+    return bool(iscoroutinefunction and iscoroutinefunction(func))
+
+
 class Runner(object):  # pylint: disable=too-few-public-methods
     """
     Manages the creation and shutdown of the collectd plugin.  This acts as the
@@ -29,37 +46,65 @@ class Runner(object):  # pylint: disable=too-few-public-methods
         """
         This is a fairly simple state machine.  It waits for a configure
         message that gives it the configuration and then it waits for a
-        shutdown message, at which point this method returns.
+        shutdown message, at which point this method returns.  The log level
+        can be changed at any point after configuring.
         """
         logger.info("Waiting for configure message from agent")
 
         msg = self.input_reader.recv_msg()
         assert msg.type == MSG_TYPE_CONFIGURE, "Expected first message to be configure message"
 
+        set_log_level(msg.payload.get("logLevel"))
+        codec = choose_codec(msg.payload)
+        logger.info("Using %s codec for datapoints", codec)
+
         ready_event = threading.Event()
-        output = Output(self.output_writer, ready_event)
         err = None
         try:
-            config_func, shutdown_func = load_monitor(msg.payload, output)
+            config_func, shutdown_func = load_monitor(msg.payload, self.output_writer, ready_event, codec)
             config_func(msg.payload)
         except Exception as e:  # pylint: disable=broad-except
             log_exc_traceback_as_error()
             err = e
 
-        self.output_writer.send_msg(MSG_TYPE_CONFIGURE_RESULT, {"error": repr(err) if err else None})
+        self.output_writer.send_msg(MSG_TYPE_CONFIGURE_RESULT, configure_result(err))
 
         if err:
             return
 
+        batch_interval = msg.payload.get("batchFlushIntervalSeconds")
+        if batch_interval:
+            self.output_writer.enable_batching(
+                (MSG_TYPE_DATAPOINT_LIST, MSG_TYPE_DATAPOINT_BINARY_LIST),
+                batch_interval,
+                msg.payload.get("batchMaxBytes"),
+            )
+
         ready_event.set()
-        msg = self.input_reader.recv_msg()
-        assert msg.type == MSG_TYPE_SHUTDOWN, "Expected shutdown message, got %d" % msg.type
 
-        if shutdown_func:
+        stats_reporter = StatsReporter(self.output_writer, msg.payload["intervalSeconds"])
+        stats_reporter.start()
+
+        for msg in self.input_reader.iter_messages():
+            if msg.type == MSG_TYPE_SET_LOG_LEVEL:
+                set_log_level(msg.payload.get("level"))
+                continue
+            assert msg.type == MSG_TYPE_SHUTDOWN, "Expected shutdown message, got %d" % msg.type
+            break
+
+        if shutdown_func is not None:
             shutdown_func()
+        stats_reporter.stop()
+        self.output_writer.flush()
 
 
-def load_monitor(config, output):
+def load_monitor(config, output_writer, ready_event, codec):
+    """
+    Loads the monitor from the script configured on the monitor and returns its
+    configure and shutdown functions.  The monitor can either be a `Monitor`
+    class or a `run` function, and either of them can be async (see
+    `sfxmonitor.aio`).
+    """
     python_path = config.get("pythonPath") or []
     script_file_path = config.get("scriptFilePath")
     module_dir, module_file = os.path.split(script_file_path)
@@ -67,11 +112,11 @@ def load_monitor(config, output):
         python_path.insert(0, module_dir)
 
     logger.debug("Appending %s to Python path", python_path)
-    mod = load_python_module(python_path, os.path.splitext(module_file)[0])
+    mod = load_python_module(python_path, os.path.splitext(module_file)[0], profile=bool(config.get("profileImports")))
     mon_cls = getattr(mod, "Monitor", None)
+    run_func = None
     if mon_cls:
         logger.info("Loaded class Monitor from %s", script_file_path)
-        inst = mon_cls(output)
     else:
         logger.info("Loaded 'run' function from %s", script_file_path)
         run_func = getattr(mod, "run", None)
@@ -79,7 +124,17 @@ def load_monitor(config, output):
             raise ValueError(
                 "Could not fine either a 'run' function or 'Montior' class in Python script '%s'" % (script_file_path,)
             )
-        inst = SimpleMonitor(run_func, output)
+
+    if _is_coroutine_function(getattr(mon_cls, "configure", None) if mon_cls else run_func):
+        # Only async monitors pay for importing asyncio
+        from .aio import AsyncMonitor
+
+        logger.info("Running async monitor on an event loop")
+        inst = AsyncMonitor(output_writer, ready_event, codec, mon_cls=mon_cls, run_func=run_func)
+    elif mon_cls:
+        inst = mon_cls(Output(output_writer, ready_event, codec))
+    else:
+        inst = SimpleMonitor(run_func, Output(output_writer, ready_event, codec))
 
     if not hasattr(inst, "configure"):
         raise ValueError("Monitor class in %s doesn't have a configure method" % script_file_path)
@@ -1,16 +1,25 @@
 from functools import partial as p
 
-from sfxrunner.scheduler.simple import SimpleScheduler
+from sfxrunner.scheduler.clock import monitor_spread_key
+from sfxrunner.scheduler.pool import new_scheduler
 
 
 class SimpleMonitor(object):
     def __init__(self, run_func, output):
         self.run_func = run_func
         self.output = output
-        self.scheduler = SimpleScheduler()
+        self.scheduler = None
 
     def configure(self, config):
+        self.scheduler = new_scheduler(
+            config.get("schedulerWorkerCount"),
+            config.get("overrunPolicy"),
+            align_to_wall_clock=config.get("alignToWallClock"),
+            spread_key=monitor_spread_key(config),
+            max_backoff=config.get("maxBackoffSeconds"),
+        )
         self.scheduler.run_on_interval(config["intervalSeconds"], p(self.run_func, config, self.output))
 
     def shutdown(self):
-        self.scheduler.stop()
+        if self.scheduler:
+            self.scheduler.stop()
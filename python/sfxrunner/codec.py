@@ -0,0 +1,77 @@
+"""
+Payload codecs for the messages that the runners send to the agent.  JSON is
+always understood by the agent, but the agent can also advertise support for a
+compact binary encoding in the configure message.  The binary encoding is much
+cheaper to produce for high volume messages like value lists and datapoints
+since they can be written out directly without building intermediate dicts.
+
+The binary encoding uses big-endian numbers, like the frame header.  Strings are
+a 2 byte length followed by that many bytes of UTF-8, so they can be at most
+MAX_STR_BYTES long.
+"""
+from __future__ import absolute_import
+
+import struct
+
+CODEC_JSON = "json"
+CODEC_BINARY = "binary"
+
+# The codecs this runner can produce, in order of preference
+SUPPORTED_CODECS = (CODEC_BINARY, CODEC_JSON)
+
+UINT8 = struct.Struct(">B")
+UINT16 = struct.Struct(">H")
+UINT32 = struct.Struct(">I")
+INT64 = struct.Struct(">q")
+FLOAT64 = struct.Struct(">d")
+
+MIN_INT64 = -(2 ** 63)
+MAX_INT64 = 2 ** 63 - 1
+
+NAN = float("nan")
+
+MAX_STR_BYTES = 2 ** 16 - 1
+
+try:
+    TEXT_TYPE = unicode  # pylint: disable=undefined-variable,invalid-name
+except NameError:
+    TEXT_TYPE = str  # pylint: disable=invalid-name
+
+
+def choose_codec(monitor_config):
+    """
+    Returns the first codec that the agent listed in the `codecs` field of the
+    configure message that this runner also supports.  Agents that don't
+    advertise any codecs only understand JSON.
+    """
+    for codec in monitor_config.get("codecs") or ():
+        if codec in SUPPORTED_CODECS:
+            return codec
+    return CODEC_JSON
+
+
+def encode_str(value):
+    """
+    Returns the binary encoding of the given string.  None is encoded as an
+    empty string and non-string values are converted with `str`.  Raises
+    ValueError if the string is longer than MAX_STR_BYTES once encoded.
+    """
+    if value is None:
+        return b"\x00\x00"
+    if not isinstance(value, bytes):
+        if not isinstance(value, TEXT_TYPE):
+            value = str(value)
+        value = value.encode("utf-8")
+    if len(value) > MAX_STR_BYTES:
+        raise ValueError(
+            "String of %d bytes is too long for the binary codec, which allows at most %d: %r..."
+            % (len(value), MAX_STR_BYTES, value[:40])
+        )
+    return UINT16.pack(len(value)) + value
+
+
+def encode_float(value):
+    """
+    Returns the binary encoding of a float64, with None encoded as NaN.
+    """
+    return FLOAT64.pack(NAN if value is None else value)
@@ -0,0 +1,247 @@
+"""
+A fork server that imports the modules that the runners commonly use once and
+then forks a child for each runner that the agent starts, so that runners
+don't each pay for interpreter startup and those imports.
+
+The agent connects to the server's unix socket and sends a single line of JSON
+with the `module` to run (e.g. `sfxcollectd`) and its `args`.  The server forks
+a child that writes its pid as a 4 byte big-endian int to the connection and
+then runs the module as if it had been started with `python -m`, with the
+connection as its stdin and stdout.  The connection is closed when the child
+exits.  The child's stderr is the same as the server's.
+
+Since the children aren't children of the agent, the agent can't safely signal
+them by pid itself.  Instead it connects again and sends `{"kill": <pid>}`,
+and the server kills the child only if it is one of its own that it hasn't
+reaped yet, so the pid can't have been reused by another process.  The server
+closes that connection once the request has been handled.
+
+Usage: python -m sfxrunner.forkserver <socket path> [<module to preload>...]
+"""
+from __future__ import absolute_import
+
+import errno
+import importlib
+import logging
+import os
+import random
+import runpy
+import select
+import signal
+import socket
+import struct
+import sys
+import traceback
+
+import ujson
+
+logger = logging.getLogger(__name__)
+
+# Modules that are imported before forking.  Ones that can't be imported are
+# skipped.
+PRELOAD_MODULES = (
+    "ujson",
+    "json",
+    "logging",
+    "threading",
+    "ssl",
+    # The runners import these lazily, but forked runners might as well share
+    # them
+    "hashlib",
+    "inspect",
+    "sfxrunner.codec",
+    "sfxrunner.imports",
+    "sfxrunner.logs",
+    "sfxrunner.messages",
+    "sfxrunner.scheduler.pool",
+    "sfxcollectd.host",
+    "sfxcollectd.runner",
+    "sfxcollectd.typesdb",
+    "sfxmonitor.runner",
+    "sfxmonitor.simple",
+    # Common dependencies of plugins
+    "requests",
+)
+
+PID_HEADER = struct.Struct(">I")
+
+# How often the server checks for exited children and whether the agent is
+# still alive
+POLL_INTERVAL_SECONDS = 1.0
+
+# How long the server waits for the request on a new connection.  Requests are
+# read in the server's only thread, so a connection that never sends one would
+# otherwise hold up every other fork and kill request.
+READ_REQUEST_TIMEOUT_SECONDS = 5.0
+
+
+def preload(module_names):
+    """
+    Imports the given modules, skipping any that fail to import
+    """
+    for name in module_names:
+        try:
+            importlib.import_module(name)
+        except Exception:  # pylint: disable=broad-except
+            logger.debug("Could not preload module %s", name, exc_info=True)
+
+
+def read_request(conn):
+    """
+    Reads the newline-terminated JSON request from the agent
+    """
+    data = b""
+    while not data.endswith(b"\n"):
+        chunk = conn.recv(4096)
+        if not chunk:
+            raise EOFError("Connection closed before request was received")
+        data += chunk
+    return ujson.loads(data.decode("utf-8"))
+
+
+def reap_children(children):
+    """
+    Cleans up children that have exited and removes them from the given set
+    of child pids
+    """
+    while True:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except OSError as e:
+            if e.errno == errno.ECHILD:
+                return
+            raise
+        if pid == 0:
+            return
+        children.discard(pid)
+
+
+def kill_child(pid, children):
+    """
+    Kills the child with the given pid if it is one of the server's children
+    that hasn't been reaped yet.  Children are only reaped by the server's
+    loop, which also calls this, so the pid still belongs to the child even if
+    it has already exited.
+    """
+    if pid not in children:
+        logger.warning("Not killing process %s since it is not a running child of the fork server", pid)
+        return
+    os.kill(pid, signal.SIGKILL)
+
+
+def exit_code_for(code):
+    """
+    Returns the exit code of a process that raised SystemExit with the given
+    code, the same way the interpreter does: None means success, ints are used
+    as is and anything else is printed to stderr and exits with 1.
+    """
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    sys.stderr.write("%s\n" % (code,))
+    return 1
+
+
+def run_child(conn, request):
+    """
+    Runs the requested module in the forked child.  This never returns.
+    """
+    exit_code = 0
+    try:
+        # Forked children would otherwise all generate the same random numbers
+        random.seed()
+        # The child logs through its own pipe handler
+        del logging.getLogger().handlers[:]
+        # The timeout makes the socket non-blocking, which would also apply
+        # to the runner's stdin and stdout
+        conn.settimeout(None)
+
+        conn.sendall(PID_HEADER.pack(os.getpid()))
+        os.dup2(conn.fileno(), sys.stdin.fileno())
+        os.dup2(conn.fileno(), sys.stdout.fileno())
+        conn.close()
+
+        # Python 2 requires the module name to be a str, not unicode
+        module = str(request["module"])
+        sys.argv = [module] + [str(arg) for arg in request.get("args", [])]
+        runpy.run_module(module, run_name="__main__", alter_sys=True)
+    except SystemExit as e:
+        exit_code = exit_code_for(e.code)
+    except BaseException:  # pylint: disable=broad-except
+        traceback.print_exc()
+        exit_code = 1
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        # Don't unwind back into the server's loop
+        os._exit(exit_code)  # pylint: disable=protected-access
+
+
+def serve(socket_path):
+    """
+    Accepts connections and forks a child for each of them until the agent
+    exits
+    """
+    agent_pid = os.getppid()
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    listener.listen(128)
+
+    # Tell the agent that it can connect now
+    sys.stdout.write("ready\n")
+    sys.stdout.flush()
+
+    children = set()
+    try:
+        while os.getppid() == agent_pid:
+            reap_children(children)
+
+            readable, _, _ = select.select([listener], [], [], POLL_INTERVAL_SECONDS)
+            if not readable:
+                continue
+
+            conn, _ = listener.accept()
+            conn.settimeout(READ_REQUEST_TIMEOUT_SECONDS)
+            try:
+                request = read_request(conn)
+            except Exception:  # pylint: disable=broad-except
+                logger.exception("Could not read fork request")
+                conn.close()
+                continue
+
+            if "kill" in request:
+                try:
+                    kill_child(request["kill"], children)
+                finally:
+                    conn.close()
+                continue
+
+            pid = os.fork()
+            if pid == 0:
+                listener.close()
+                run_child(conn, request)
+            children.add(pid)
+            conn.close()
+    finally:
+        listener.close()
+        os.unlink(socket_path)
+
+
+def main():
+    """
+    Preloads modules and serves fork requests on the socket given on the
+    command line
+    """
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO)
+
+    preload(PRELOAD_MODULES + tuple(sys.argv[2:]))
+    serve(sys.argv[1])
+
+
+if __name__ == "__main__":
+    main()
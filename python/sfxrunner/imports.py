@@ -1,11 +1,220 @@
+"""
+Helpers for importing the modules of plugins and monitors, and for importing
+the runner's own dependencies lazily
+"""
 import importlib
+import logging
+import os
 import sys
+import threading
+import time
+import types
 
+try:
+    import __builtin__ as builtins
+except ImportError:
+    import builtins  # pylint: disable=import-error
 
-def load_python_module(sys_paths, import_name):
+logger = logging.getLogger(__name__)
+
+# The number of the slowest imports that are logged when profiling imports
+PROFILE_TOP_IMPORTS = 15
+
+# The highest resolution timer available, like timeit.default_timer
+_timer = getattr(time, "perf_counter", time.time)  # pylint: disable=invalid-name
+
+# The default `level` of __import__, which is -1 (try relative, then absolute)
+# on Python 2
+_DEFAULT_IMPORT_LEVEL = -1 if sys.version_info[0] == 2 else 0
+
+
+class LazyModule(types.ModuleType):  # pylint: disable=too-few-public-methods
+    """
+    A stand-in for a module that is only imported the first time that one of
+    its attributes is used.  The runner uses it for the dependencies that it
+    doesn't need until it is configured, so that it is ready to talk to the
+    agent as soon as possible after it is started.
+    """
+
+    def __getattr__(self, attr):
+        # Only called for attributes that aren't found on the stand-in itself
+        module = self.__dict__.get("_module")
+        if module is None:
+            module = importlib.import_module(self.__name__)
+            self.__dict__["_module"] = module
+        return getattr(module, attr)
+
+
+def lazy_import(name):
+    """
+    Returns the module with the given absolute name if it has already been
+    imported, or a LazyModule that imports it on first use otherwise
+    """
+    return sys.modules.get(name) or LazyModule(name)
+
+
+def _absolute_name(name, globals_, level):
+    """
+    Returns the name of the module that an import statement in the module with
+    the given globals refers to.  Python 2 implicit relative imports are
+    assumed to be absolute.
+    """
+    if level <= 0 or not globals_:
+        return name
+    package = globals_.get("__package__")
+    if not package:
+        package = globals_.get("__name__", "")
+        if "__path__" not in globals_:
+            package = package.rpartition(".")[0]
+    base = package.rsplit(".", level - 1)[0]
+    return "%s.%s" % (base, name) if name else base
+
+
+def _missing_submodule(package, fromlist):
+    """
+    Returns the name of the first submodule named in `fromlist` that hasn't
+    been imported yet, or None if there is none
+    """
+    for item in fromlist or ():
+        name = "%s.%s" % (package, item)
+        if item != "*" and name not in sys.modules:
+            return name
+    return None
+
+
+class ImportProfiler(object):
+    """
+    Records how long each module takes to import while it is active, much like
+    `python -X importtime`.  The self time of a module doesn't include the time
+    spent importing other modules from it, while its cumulative time does.
+
+    It works by wrapping `__import__`, so only imports done by import
+    statements (and `import_module` below) on the thread that entered the
+    profiler are timed, and a submodule that is imported by `from package
+    import submodule` is recorded under the name of the submodule.
+    """
+
+    _lock = threading.Lock()
+    # The profiler that is active on each thread
+    _active = {}
+    # What `__import__` was before the first profiler was entered
+    _original_import = builtins.__import__
+
+    def __init__(self):
+        # A dict of module name to (self seconds, cumulative seconds)
+        self.timings = {}
+        # The time spent in nested imports by each import that is in progress
+        self._nested = []
+
+    def __enter__(self):
+        with ImportProfiler._lock:
+            if not ImportProfiler._active:
+                ImportProfiler._original_import = builtins.__import__
+                builtins.__import__ = ImportProfiler._profiled_import
+            ImportProfiler._active[threading.current_thread()] = self
+        return self
+
+    def __exit__(self, *_):
+        with ImportProfiler._lock:
+            del ImportProfiler._active[threading.current_thread()]
+            if not ImportProfiler._active:
+                builtins.__import__ = ImportProfiler._original_import
+
+    def import_module(self, name):
+        """
+        Imports the module with the given absolute name and times it along with
+        everything that it imports
+        """
+        self.timed_import(name)
+        return sys.modules[name]
+
+    def timed_import(
+        self, name, globals=None, locals=None, fromlist=(), level=_DEFAULT_IMPORT_LEVEL
+    ):  # pylint: disable=redefined-builtin
+        """
+        Does the same thing as `__import__` and records the time taken if any
+        modules were imported by it
+        """
+        original_import = ImportProfiler._original_import
+        module_name = _absolute_name(name, globals, level)
+        if module_name in sys.modules:
+            # `from package import submodule` goes through the package, which
+            # is already imported
+            module_name = _missing_submodule(module_name, fromlist)
+            if module_name is None:
+                return original_import(name, globals, locals, fromlist, level)
+        elif fromlist:
+            # Import the package on its own first so that the submodules in
+            # `fromlist` aren't counted as part of it
+            self.timed_import(name, globals, locals, (), level)
+            if module_name in sys.modules:
+                return self.timed_import(name, globals, locals, fromlist, level)
+            # A Python 2 implicit relative import, which is registered under
+            # a different name than the one it was assumed to have
+            return original_import(name, globals, locals, fromlist, level)
+
+        module_count = len(sys.modules)
+        self._nested.append(0.0)
+        start = _timer()
+        try:
+            return original_import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = _timer() - start
+            nested = self._nested.pop()
+            if len(sys.modules) != module_count:
+                if self._nested:
+                    self._nested[-1] += elapsed
+                self_time, cumulative = self.timings.get(module_name, (0.0, 0.0))
+                self.timings[module_name] = (self_time + elapsed - nested, cumulative + elapsed)
+
+    @staticmethod
+    def _profiled_import(
+        name, globals=None, locals=None, fromlist=(), level=_DEFAULT_IMPORT_LEVEL
+    ):  # pylint: disable=redefined-builtin
+        profiler = ImportProfiler._active.get(threading.current_thread())
+        if profiler is None:
+            return ImportProfiler._original_import(name, globals, locals, fromlist, level)
+        return profiler.timed_import(name, globals, locals, fromlist, level)
+
+    def log_report(self, import_name, top=PROFILE_TOP_IMPORTS):
+        """
+        Logs the imports that took the most time, in the same format as
+        `python -X importtime`
+        """
+        slowest = sorted(self.timings.items(), key=lambda item: item[1][1], reverse=True)[:top]
+        lines = [
+            "%10d | %10d | %s" % (self_time * 1e6, cumulative * 1e6, name) for name, (self_time, cumulative) in slowest
+        ]
+        logger.info(
+            "Imported %s in %.1fms, %d modules in total, slowest imports:\n%10s | %10s | %s\n%s",
+            import_name,
+            self.timings.get(import_name, (0.0, 0.0))[1] * 1000,
+            len(self.timings),
+            "self [us]",
+            "cumulative",
+            "module",
+            "\n".join(lines),
+        )
+
+
+def _import_module(import_name, profile):
+    if not profile:
+        return importlib.import_module(import_name)
+
+    with ImportProfiler() as profiler:
+        try:
+            return profiler.import_module(import_name)
+        finally:
+            profiler.log_report(import_name)
+
+
+def load_python_module(sys_paths, import_name, profile=False):
     """
     Imports a Python module by name.  This will only have effect the first time
     it is called and subsequent calls will do nothing.
+
+    If `profile` is True, the time taken to import each module is recorded
+    and the slowest imports are logged.
     """
     assert isinstance(sys_paths, (tuple, list)), "%s is not a list or tuple" % sys_paths
 
@@ -13,4 +222,95 @@ def load_python_module(sys_paths, import_name):
         if path not in sys.path:
             sys.path.insert(1, path)
 
-    return importlib.import_module(import_name)
+    return _import_module(import_name, profile)
+
+
+def _is_private_module(name, module, import_name, local_dirs):
+    if name == import_name or name.startswith(import_name + "."):
+        return True
+    path = getattr(module, "__file__", None)
+    return bool(path) and os.path.abspath(path).startswith(local_dirs)
+
+
+def _pop_private_modules(names, import_name, local_dirs):
+    popped = {}
+    for name in names:
+        module = sys.modules.get(name)
+        if module is not None and _is_private_module(name, module, import_name, local_dirs):
+            popped[name] = sys.modules.pop(name)
+    return popped
+
+
+def _import_lock_module():
+    try:
+        import _imp  # pylint: disable=import-error
+
+        return _imp
+    except ImportError:
+        import imp  # pylint: disable=deprecated-module
+
+        return imp
+
+
+def load_isolated_python_module(sys_paths, import_name, injected_modules, profile=False):
+    """
+    Imports a fresh copy of a Python module, even if it has already been
+    imported, so that multiple copies of the same module can be configured
+    independently in one interpreter.
+
+    `injected_modules` is a dict of modules (e.g. the collectd shim) that the
+    module will see while it is imported, without them being registered
+    globally.  The module itself and anything it imports from `sys_paths`
+    are private to this copy, while everything else (e.g. the standard
+    library and site-packages) is shared with the rest of the interpreter.
+    Modules that import any of the injected modules lazily, after being
+    imported themselves, cannot be isolated.
+
+    The global import lock is held for the whole import, since the private
+    and injected modules have to be swapped into `sys.modules` while it
+    runs, and modules shared with other copies are left where they are.  On
+    Python 2 this blocks every import in other threads until the swap is
+    undone.  On Python 3 only imports that have to find a module wait, so a
+    thread that looks up one of the plugin's own modules in the meantime can
+    still get the copy that is being imported.
+
+    @returns: a tuple of the module and a dict of all of the modules private
+    to this copy, which the caller must hold on to for as long as the module
+    is in use, since Python 2 clears the globals of a module once the module
+    object itself is no longer referenced.  `profile` is the same as for
+    `load_python_module`.
+    """
+    assert isinstance(sys_paths, (tuple, list)), "%s is not a list or tuple" % sys_paths
+
+    local_dirs = tuple(os.path.join(os.path.abspath(p), "") for p in sys_paths)
+
+    import_lock = _import_lock_module()
+    import_lock.acquire_lock()
+    try:
+        for path in reversed(sys_paths):
+            if path not in sys.path:
+                sys.path.insert(1, path)
+
+        # Modules from the plugin that are already registered (e.g. because a
+        # running copy imported them lazily) are moved aside so that this copy
+        # gets its own, and are put back once it has been imported.
+        displaced = _pop_private_modules(list(sys.modules), import_name, local_dirs)
+        shared = set(sys.modules)
+
+        saved = dict((name, sys.modules.get(name)) for name in injected_modules)
+        sys.modules.update(injected_modules)
+        try:
+            module = _import_module(import_name, profile)
+        finally:
+            new_names = set(sys.modules) - shared - set(injected_modules)
+            private_modules = _pop_private_modules(new_names, import_name, local_dirs)
+            for name, saved_module in saved.items():
+                if saved_module is None:
+                    sys.modules.pop(name, None)
+                else:
+                    sys.modules[name] = saved_module
+            sys.modules.update(displaced)
+    finally:
+        import_lock.release_lock()
+
+    return module, private_modules
@@ -5,40 +5,339 @@ from __future__ import absolute_import
 
 import logging
 import sys
+import time
 import traceback
+from threading import Event, Lock, Thread
 
 from .messages import MSG_TYPE_LOG
+from .scheduler.clock import monotonic
+
+try:
+    from Queue import Empty, Full, Queue
+except ImportError:
+    from queue import Empty, Full, Queue  # pylint: disable=import-error
 
 logger = logging.getLogger()
 
+# The number of log records that can be waiting to be sent to the agent before
+# new ones are dropped
+DEFAULT_LOG_BUFFER_SIZE = 1000
+# The most log records that are sent to the agent in a single frame
+MAX_LOG_BATCH_SIZE = 100
+# How long flushing and closing the log handler wait for the pending records
+# to be sent
+LOG_FLUSH_TIMEOUT_SECONDS = 5.0
+
+# Identical records from the same logger within this many seconds of the first
+# one are collapsed into a single record with the number of repeats
+DEFAULT_DEDUP_WINDOW_SECONDS = 60.0
+# The number of records per second that each logger can send on average, and
+# how many it can send in a burst
+DEFAULT_RATE_LIMIT = 20.0
+DEFAULT_RATE_BURST = 200
+# How often repeated and rate limited records are reported
+LOG_SUMMARY_INTERVAL_SECONDS = 1.0
 
-class PipeLogHandler(logging.Handler):
+
+class TokenBucket(object):  # pylint: disable=too-few-public-methods
+    """
+    Allows `rate` events per second on average, with bursts of up to `burst`
+    events
+    """
+
+    __slots__ = ["rate", "burst", "tokens", "updated"]
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = now
+
+    def take(self, now):
+        """
+        Returns whether an event is allowed at `now`, using up a token if so
+        """
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class _RecentRecord(object):  # pylint: disable=too-few-public-methods
+    __slots__ = ["msg", "since", "repeats"]
+
+    def __init__(self, msg, since):
+        self.msg = msg
+        self.since = since
+        self.repeats = 0
+
+
+def _summary_msg(msg, message, **extra):
+    summary = dict(msg, message=message, created=time.time())
+    summary.update(extra)
+    return summary
+
+
+class PipeLogHandler(logging.Handler):  # pylint: disable=too-many-instance-attributes
     """
     Python log handler that converts log messages to a json object and sends
-    them back to the agent through the given writeable pipe
+    them back to the agent through the given writeable pipe.
+
+    Logging never blocks on the pipe.  Records are put on a bounded queue and
+    sent by a background thread, which sends all of the records that piled up
+    while it was writing together in a single batch frame.  If the queue is
+    full, new records are dropped and counted, and a warning with the number
+    of dropped records is sent once there is room again.
+
+    So that a plugin that logs the same error every interval doesn't flood the
+    agent, a record that is identical to one from the same logger in the last
+    `dedup_window_seconds` is only counted, and the count is sent as a single
+    record once the window is over.  Each logger can also only send
+    `rate_limit` records per second on average, with bursts of `rate_burst`,
+    and the number of records that were dropped because of that is reported
+    the same way.
     """
 
-    def __init__(self, writer):
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        writer,
+        buffer_size=DEFAULT_LOG_BUFFER_SIZE,
+        dedup_window_seconds=DEFAULT_DEDUP_WINDOW_SECONDS,
+        rate_limit=DEFAULT_RATE_LIMIT,
+        rate_burst=DEFAULT_RATE_BURST,
+    ):
         """
         `pipe` should be a PipeMessageWriter that is already opened
         """
         self.writer = writer
+        self.queue = Queue(buffer_size)
+        # The number of records that have been dropped since the last warning
+        # about them, and in total.  This doesn't use the handler's own lock
+        # since logging.shutdown holds it while flushing.
+        self.dropped_lock = Lock()
+        self.dropped = 0
+        self.dropped_total = 0
+
+        self.dedup_window_seconds = dedup_window_seconds
+        self.rate_limit = rate_limit
+        self.rate_burst = rate_burst
+        # The state below is only accessed while holding `limit_lock`.
+        # Records that were sent in the last window, keyed by their logger,
+        # level and message
+        self.recent = {}
+        # Token buckets keyed by logger name
+        self.buckets = {}
+        # The number of records that were rate limited since they were last
+        # reported, keyed by logger name, and in total
+        self.rate_limited = {}
+        self.rate_limited_total = 0
+        self.limit_lock = Lock()
 
         super(PipeLogHandler, self).__init__()
 
+        self.thread = Thread(target=self._send_records, name="log-writer")
+        self.thread.daemon = True
+        self.thread.start()
+
     def emit(self, record):
-        self.writer.send_msg(
-            MSG_TYPE_LOG,
-            {
-                "message": record.getMessage(),
-                "logger": record.name,
-                "source_path": record.pathname,
-                "lineno": record.lineno,
-                "created": record.created,
-                "level": record.levelname,
-            },
+        msg = {
+            "message": record.getMessage(),
+            "logger": record.name,
+            "source_path": record.pathname,
+            "lineno": record.lineno,
+            "created": record.created,
+            "level": record.levelname,
+        }
+        for allowed in self._allow(msg):
+            try:
+                self.queue.put_nowait(allowed)
+            except Full:
+                with self.dropped_lock:
+                    self.dropped += 1
+                    self.dropped_total += 1
+
+    def _allow(self, msg):
+        """
+        Returns the messages to send for the given one, which is empty if it
+        is a repeat or over the rate limit of its logger
+        """
+        now = monotonic()
+        key = (msg["logger"], msg["level"], msg["message"])
+        with self.limit_lock:
+            recent = self.recent.get(key)
+            if recent is not None and now < recent.since + self.dedup_window_seconds:
+                recent.repeats += 1
+                return []
+
+            name = msg["logger"]
+            bucket = self.buckets.get(name)
+            if bucket is None:
+                bucket = self.buckets[name] = TokenBucket(self.rate_limit, self.rate_burst, now)
+            if not bucket.take(now):
+                self.rate_limited[name] = self.rate_limited.get(name, 0) + 1
+                self.rate_limited_total += 1
+                return []
+
+            self.recent[key] = _RecentRecord(msg, now)
+            # The repeats of the last window go out before the new record
+            if recent is not None and recent.repeats:
+                return [self._repeats_msg(recent, now), msg]
+            return [msg]
+
+    def _repeats_msg(self, recent, now):
+        lines = recent.msg["message"].strip().splitlines() or [""]
+        line = lines[0]
+        # The last line of a traceback is the exception itself, which is kept
+        # after the line that introduced the traceback, if there is one
+        for i, text in enumerate(lines):
+            if text.startswith("Traceback"):
+                line = lines[-1] if i == 0 else "%s %s" % (line, lines[-1])
+                break
+        return _summary_msg(
+            recent.msg,
+            "%s [repeated %d more times in %ds]"
+            % (line, recent.repeats, min(now - recent.since, self.dedup_window_seconds)),
+            repeated=recent.repeats,
         )
 
+    def _summaries(self, expire_all=False):
+        """
+        Returns the records that report the repeats of the records whose dedup
+        windows are over, and the number of records that were rate limited
+        since the last call
+        """
+        now = monotonic()
+        out = []
+        with self.limit_lock:
+            for key, recent in list(self.recent.items()):
+                if expire_all or now >= recent.since + self.dedup_window_seconds:
+                    del self.recent[key]
+                    if recent.repeats:
+                        out.append(self._repeats_msg(recent, now))
+
+            for name, count in self.rate_limited.items():
+                out.append(
+                    _summary_msg(
+                        self._warning_msg(),
+                        "Dropped %d log messages from logger %s because it was logging more than %g per second"
+                        % (count, name, self.rate_limit),
+                    )
+                )
+            self.rate_limited.clear()
+
+            # Don't let idle loggers accumulate buckets
+            if not expire_all:
+                for name, bucket in list(self.buckets.items()):
+                    if bucket.tokens + (now - bucket.updated) * bucket.rate >= bucket.burst:
+                        del self.buckets[name]
+        return out
+
+    @staticmethod
+    def _warning_msg():
+        return {"logger": logger.name, "source_path": __file__, "lineno": 0, "level": "WARNING"}
+
+    def _send_records(self):
+        next_summary = monotonic() + LOG_SUMMARY_INTERVAL_SECONDS
+        while True:
+            # Items are log messages, events to set once the messages before
+            # them are sent, or None to stop
+            try:
+                items = [self.queue.get(timeout=max(0, next_summary - monotonic()))]
+            except Empty:
+                items = []
+            while items and len(items) < MAX_LOG_BATCH_SIZE:
+                try:
+                    items.append(self.queue.get_nowait())
+                except Empty:
+                    break
+
+            msgs = [item for item in items if isinstance(item, dict)]
+            stopping = None in items
+            if stopping or monotonic() >= next_summary:
+                msgs.extend(self._summaries(expire_all=stopping))
+                next_summary = monotonic() + LOG_SUMMARY_INTERVAL_SECONDS
+            self._send(msgs)
+
+            for item in items:
+                if item is None:
+                    return
+                if not isinstance(item, dict):
+                    item.set()
+
+    def _send(self, msgs):
+        with self.dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+        if dropped:
+            msgs.append(
+                _summary_msg(
+                    self._warning_msg(),
+                    "Dropped %d log messages because the agent was not reading them fast enough" % dropped,
+                )
+            )
+        if not msgs:
+            return
+
+        try:
+            self.writer.send_batch(MSG_TYPE_LOG, msgs)
+        except Exception:  # pylint: disable=broad-except
+            # There is nowhere else to log this
+            traceback.print_exc(file=sys.stderr)
+
+    def flush(self):
+        """
+        Waits for the records that have been logged so far to be sent to the
+        agent
+        """
+        if not self.thread.is_alive():
+            return
+        sent = Event()
+        try:
+            self.queue.put(sent, timeout=LOG_FLUSH_TIMEOUT_SECONDS)
+        except Full:
+            return
+        sent.wait(LOG_FLUSH_TIMEOUT_SECONDS)
+
+    def close(self):
+        """
+        Sends the pending records and stops the background thread
+        """
+        if self.thread.is_alive():
+            try:
+                self.queue.put(None, timeout=LOG_FLUSH_TIMEOUT_SECONDS)
+            except Full:
+                pass
+            self.thread.join(LOG_FLUSH_TIMEOUT_SECONDS)
+        super(PipeLogHandler, self).close()
+
+
+# The Python log levels that correspond to the agent's log levels
+AGENT_LOG_LEVELS = {
+    "panic": logging.CRITICAL,
+    "fatal": logging.CRITICAL,
+    "error": logging.ERROR,
+    "warning": logging.WARNING,
+    "info": logging.INFO,
+    "debug": logging.DEBUG,
+    "trace": logging.DEBUG,
+}
+
+
+def set_log_level(level):
+    """
+    Sets the level of the root logger to match the given log level of the
+    agent, so that records that the agent would drop are never constructed.
+    Does nothing if `level` is empty, which it is for older agents.
+    """
+    if not level:
+        return
+    py_level = AGENT_LOG_LEVELS.get(level.lower())
+    if py_level is None:
+        logger.warning("Unknown log level '%s' from agent, keeping the current level", level)
+        return
+    logging.getLogger().setLevel(py_level)
+
 
 def format_exception():
     """
@@ -2,6 +2,14 @@
 Logic for communicating with FIFO pipes between Python and the agent.  The
 protocol is very simple: messages are sent in frames that are prefixed with a 4
 byte integer indicating their length.
+
+Frames of type MSG_TYPE_BATCH are a special case: their payload is simply a
+concatenation of other complete frames, which lets many small messages be sent
+to the agent with a single write.
+
+Frames of type MSG_TYPE_INSTANCE are used by runners that host multiple monitor
+instances in one process.  Their payload is the 4 byte id of the instance,
+followed by a complete frame to or from that instance.
 """
 from __future__ import absolute_import
 
@@ -21,8 +29,36 @@ MSG_TYPE_CONFIGURE = 1
 MSG_TYPE_CONFIGURE_RESULT = 2
 MSG_TYPE_SHUTDOWN = 3
 MSG_TYPE_LOG = 4
+MSG_TYPE_BATCH = 5
+# Counters about the scheduled callbacks, see sfxrunner.scheduler.stats
+MSG_TYPE_CALLBACK_STATS = 6
+# Timing histograms of the scheduled callbacks
+MSG_TYPE_CALLBACK_TIMINGS = 7
+MSG_TYPE_INSTANCE = 8
+# Sent by the agent to change the level of the logs that are sent back to it
+MSG_TYPE_SET_LOG_LEVEL = 9
+
+# The number of bytes of pending frames that will cause a batch to be flushed
+# immediately instead of waiting for the next flush interval.
+DEFAULT_BATCH_MAX_BYTES = 64 * 1024
+
+# `instance_id` is only set for messages that were wrapped in an instance frame
+Message = namedtuple("Message", "type size payload instance_id")
+
+# Every frame starts with the message type and the payload size
+FRAME_HEADER = struct.Struct(">ii")
+# The instance id and header of the frame wrapped in an instance frame
+INSTANCE_HEADER = struct.Struct(">Iii")
 
-Message = namedtuple("Message", "type size payload")
+
+def configure_result(err):
+    """
+    Returns the payload of a configure result message for the given configure
+    error, or None if configuring succeeded.  It also tells the agent which
+    optional messages the runner understands, since the agent might be
+    talking to an older runner that doesn't.
+    """
+    return {"error": repr(err) if err else None, "acceptsLogLevel": True}
 
 
 def setup_io_pipes():
@@ -78,44 +114,246 @@ class PipeMessageReader(_PipeMessageBase):
     A message-oriented reader from a fifo pipe.
     """
 
+    def __init__(self, *args):
+        super(PipeMessageReader, self).__init__(*args)
+
+        # Frames are read into this buffer, which is reused for every message
+        # and only grows when a larger message comes in.
+        self.buf = bytearray(4096)
+
     def open(self):
         self.file = io.open(self.fd, "rb", buffering=0)
 
+    def _read_exactly(self, size):
+        """
+        Fills the first `size` bytes of the buffer from the pipe and returns a
+        memoryview of them.  Reads from a raw pipe can return less than what
+        was asked for, so this keeps reading until it has everything.
+        """
+        if len(self.buf) < size:
+            self.buf = bytearray(size)
+
+        view = memoryview(self.buf)[:size]
+        received = 0
+        while received < size:
+            count = self.file.readinto(view[received:])
+            if not count:
+                raise EOFError("Pipe closed after receiving %d of %d bytes" % (received, size))
+            received += count
+        return view
+
     def recv_msg(self):
         """
-        Block until we receive a complete message from the pipe
+        Block until we receive a complete message from the pipe.  Raises
+        EOFError if the pipe gets closed.
         """
-        msg_type = struct.unpack(">i", self.file.read(4))[0]
-        size = struct.unpack(">i", self.file.read(4))[0]
-        msg = self.file.read(size)
+        self._read_exactly(FRAME_HEADER.size)
+        msg_type, size = FRAME_HEADER.unpack_from(self.buf)
 
-        logger.debug("Received control message: %s", msg)
-        return Message(type=msg_type, size=size, payload=ujson.loads(msg))
+        instance_id = None
+        if msg_type == MSG_TYPE_INSTANCE:
+            self._read_exactly(INSTANCE_HEADER.size)
+            instance_id, msg_type, size = INSTANCE_HEADER.unpack_from(self.buf)
+
+        # Messages like shutdown don't need to have a payload
+        payload = ujson.loads(self._read_exactly(size).tobytes()) if size else None
+
+        logger.debug("Received control message: %s", payload)
+        return Message(type=msg_type, size=size, payload=payload, instance_id=instance_id)
+
+    def iter_messages(self):
+        """
+        Yields messages as they are received until the pipe is closed
+        """
+        while True:
+            try:
+                yield self.recv_msg()
+            except EOFError:
+                return
 
 
-class PipeMessageWriter(_PipeMessageBase):
+class PipeMessageWriter(_PipeMessageBase):  # pylint: disable=too-many-instance-attributes
     """
     A message-oriented writer to a fifo pipe.  It sends length-prefixed
     messages, which should be efficient enough since messages generally won't
     be that big, so precalculating the length isn't that big of a deal.  The
     send_msg method is thread-safe.
+
+    Certain message types can optionally be batched by calling
+    `enable_batching`, in which case they are accumulated and sent as a single
+    MSG_TYPE_BATCH frame.
     """
 
     def __init__(self, *args):
         super(PipeMessageWriter, self).__init__(*args)
         self.lock = threading.Lock()
 
+        # Batching is disabled until enable_batching is called.  The pending
+        # frames are only accessed while holding `lock`.
+        self.batch_types = frozenset()
+        self.batch_max_bytes = DEFAULT_BATCH_MAX_BYTES
+        self.batch_frames = []
+        self.batch_size = 0
+
+        self.flush_stop_event = threading.Event()
+        self.flush_thread = None
+
     def open(self):
         self.file = io.open(self.fd, "wb", buffering=0)
 
+    def close(self):
+        self.flush_stop_event.set()
+        self.flush()
+        super(PipeMessageWriter, self).close()
+
+    def enable_batching(self, msg_types, flush_interval_seconds, max_bytes=None):
+        """
+        Makes messages of any of the given `msg_types` be held back and sent
+        together in a single batch frame either every `flush_interval_seconds`
+        or as soon as the pending frames reach `max_bytes`, whichever comes
+        first.  Messages of other types are still sent immediately.
+        """
+        with self.lock:
+            self.batch_types = frozenset(msg_types)
+            self.batch_max_bytes = max_bytes or DEFAULT_BATCH_MAX_BYTES
+
+        if self.flush_thread is None:
+            self.flush_thread = threading.Thread(target=self._flush_on_interval, args=(flush_interval_seconds,))
+            self.flush_thread.daemon = True
+            self.flush_thread.start()
+
+    def _flush_on_interval(self, interval_in_seconds):
+        while not self.flush_stop_event.wait(interval_in_seconds):
+            self.flush()
+
+    def flush(self):
+        """
+        Sends any pending batched messages immediately
+        """
+        with self.lock:
+            self._flush_batch()
+
+    def _flush_batch(self):
+        """
+        Assumes caller holds the lock!
+        """
+        if not self.batch_frames or self.closed:
+            return
+
+        self._write_frame(MSG_TYPE_BATCH, b"".join(self.batch_frames))
+
+        del self.batch_frames[:]
+        self.batch_size = 0
+
     def send_msg(self, msg_type, msg_obj):
         """
         Sends a message with the with the size prefixed to determine the
         message boundary on the receiving side.
         """
-        msg_bytes = ujson.dumps(msg_obj).encode("utf-8")
+        self.send_bytes(msg_type, ujson.dumps(msg_obj).encode("utf-8"))
 
+    def send_batch(self, msg_type, msg_objs):
+        """
+        Sends several JSON messages of the same type together in a single
+        batch frame, whether or not batching is enabled for the type
+        """
+        self.send_bytes_batch(msg_type, [ujson.dumps(msg_obj).encode("utf-8") for msg_obj in msg_objs])
+
+    def send_bytes_batch(self, msg_type, payloads):
+        """
+        Sends several messages of the same type whose payloads have already
+        been encoded together in a single batch frame
+        """
+        frames = b"".join(FRAME_HEADER.pack(msg_type, len(payload)) + payload for payload in payloads)
+        with self.lock:
+            # Anything that was batched before these messages should arrive at
+            # the agent before them.
+            self._flush_batch()
+
+            self._write_frame(MSG_TYPE_BATCH, frames)
+
+    def send_bytes(self, msg_type, msg_bytes):
+        """
+        Sends a message whose payload has already been encoded, e.g. by one of
+        the codecs in `sfxrunner.codec`.
+        """
         with self.lock:
-            self.file.write(struct.pack(">i", msg_type))
-            self.file.write(struct.pack(">i", len(msg_bytes)))
-            self.file.write(msg_bytes)
+            if msg_type in self.batch_types:
+                self.batch_frames.append(FRAME_HEADER.pack(msg_type, len(msg_bytes)))
+                self.batch_frames.append(msg_bytes)
+                self.batch_size += FRAME_HEADER.size + len(msg_bytes)
+
+                if self.batch_size >= self.batch_max_bytes:
+                    self._flush_batch()
+                return
+
+            # Anything that was batched before this message should arrive at
+            # the agent before it.
+            self._flush_batch()
+
+            self._write_frame(msg_type, msg_bytes)
+
+    def _write_frame(self, msg_type, msg_bytes):
+        """
+        Assumes caller holds the lock!
+
+        Writes the header and payload together so that each frame goes out
+        with a single syscall, which also makes frames up to PIPE_BUF in size
+        atomic.
+        """
+        frame = FRAME_HEADER.pack(msg_type, len(msg_bytes)) + msg_bytes
+
+        # Writes larger than PIPE_BUF can be partial if interrupted
+        written = self.file.write(frame)
+        while written < len(frame):
+            written += self.file.write(frame[written:])
+
+
+class InstanceMessageWriter(object):
+    """
+    Wraps the messages of a single monitor instance in instance frames before
+    sending them through a shared PipeMessageWriter.  It has the same
+    interface as PipeMessageWriter, except that batching is left to the
+    shared writer.
+    """
+
+    def __init__(self, writer, instance_id):
+        self.writer = writer
+        self.instance_id = instance_id
+
+    def enable_batching(self, msg_types, flush_interval_seconds, max_bytes=None):
+        """
+        Batching can only be enabled for the shared writer as a whole, so this
+        does nothing.
+        """
+
+    def flush(self):
+        """
+        Sends any pending batched messages of the shared writer
+        """
+        self.writer.flush()
+
+    def send_msg(self, msg_type, msg_obj):
+        """
+        Sends a JSON message from the instance
+        """
+        self.send_bytes(msg_type, ujson.dumps(msg_obj).encode("utf-8"))
+
+    def send_batch(self, msg_type, msg_objs):
+        """
+        Sends several JSON messages of the same type from the instance in a
+        single batch frame
+        """
+        self.writer.send_bytes_batch(
+            MSG_TYPE_INSTANCE, [self._wrap(msg_type, ujson.dumps(msg_obj).encode("utf-8")) for msg_obj in msg_objs]
+        )
+
+    def _wrap(self, msg_type, msg_bytes):
+        return INSTANCE_HEADER.pack(self.instance_id, msg_type, len(msg_bytes)) + msg_bytes
+
+    def send_bytes(self, msg_type, msg_bytes):
+        """
+        Sends a message from the instance whose payload has already been
+        encoded
+        """
+        self.writer.send_bytes(MSG_TYPE_INSTANCE, self._wrap(msg_type, msg_bytes))
@@ -0,0 +1,207 @@
+"""
+A scheduler that runs coroutine funcs on an asyncio event loop.  This requires
+Python 3.5+.
+"""
+from __future__ import absolute_import
+
+import asyncio
+import logging
+from threading import Lock, Thread, current_thread
+
+from .clock import first_run_time, spread_phase
+from .stats import (
+    CALLBACK_STATS,
+    DEFAULT_MAX_BACKOFF_SECONDS,
+    OVERRUN_RUN_LATE,
+    func_name,
+    log_failure,
+    schedule_next_run,
+)
+
+logger = logging.getLogger()
+
+
+def _is_coroutine_function(func):
+    while hasattr(func, "func"):
+        # Unwrap functools.partial
+        func = func.func
+    return asyncio.iscoroutinefunction(func)
+
+
+class ScheduledCoroutine(object):  # pylint: disable=too-few-public-methods,too-many-instance-attributes
+    """
+    A func scheduled on an AsyncIntervalScheduler, along with the timer for its
+    next run or the task of its current run
+    """
+
+    __slots__ = ["func", "key", "interval", "is_coroutine", "timer", "task", "cancelled", "failures"]
+
+    def __init__(self, func, key, interval):
+        self.func = func
+        self.key = key
+        self.interval = interval
+        self.is_coroutine = _is_coroutine_function(func)
+        self.timer = None
+        self.task = None
+        self.cancelled = False
+        # The number of times in a row that the func has failed
+        self.failures = 0
+
+
+class AsyncIntervalScheduler(object):  # pylint: disable=too-many-instance-attributes
+    """
+    Runs coroutine funcs on an interval on a single event loop, without a
+    thread per func.  The schedule is kept on the loop's monotonic clock, and
+    each run is scheduled an interval after the time the previous run was
+    scheduled for, so it doesn't drift.  Like the other schedulers, a func
+    never runs in parallel with itself.
+
+    It has the same interface as SimpleScheduler and IntervalScheduler and its
+    methods can be called from any thread.  If it isn't given a `loop`, it
+    starts its own in a dedicated thread the first time a func is scheduled.
+    Funcs that aren't coroutine functions are run in the loop's default
+    executor so that they don't block the loop.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        overrun_policy=OVERRUN_RUN_LATE,
+        stats=None,
+        loop=None,
+        align_to_wall_clock=False,
+        spread_key=None,
+        max_backoff=DEFAULT_MAX_BACKOFF_SECONDS,
+    ):
+        self.overrun_policy = overrun_policy
+        self.stats = stats or CALLBACK_STATS
+        self.align_to_wall_clock = align_to_wall_clock
+        self.spread_key = spread_key
+        self.max_backoff = max_backoff
+        self.loop = loop
+        self.thread = None
+        self.lock = Lock()
+        self.scheduled = set()
+        self.stopped = False
+
+    def _ensure_loop(self):
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.thread = Thread(target=self._run_loop, name="async-scheduler")
+                self.thread.daemon = True
+                self.thread.start()
+            return self.loop
+
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def run_on_interval(self, interval_in_seconds, func, immediately=True, name=None):
+        """
+        @param immediately: whether to run the func immediately when registered
+        or wait until `interval_in_seconds` for the first run
+        @param name: identifies the func in the counters reported to the agent
+
+        @returns: a function that cancels any further runs of `func` when
+        called
+        """
+        loop = self._ensure_loop()
+        handle = ScheduledCoroutine(func, self.stats.register(name or func_name(func)), interval_in_seconds)
+        loop.call_soon_threadsafe(self._start, handle, immediately)
+
+        def cancel():
+            loop.call_soon_threadsafe(self._cancel, handle)
+
+        return cancel
+
+    def _start(self, handle, immediately):
+        if self.stopped or handle.cancelled:
+            return
+        self.scheduled.add(handle)
+        phase = spread_phase(self.spread_key, handle.key, handle.interval)
+        self._schedule(
+            handle, first_run_time(handle.interval, immediately, self.align_to_wall_clock, self.loop.time(), phase)
+        )
+
+    def _schedule(self, handle, when):
+        handle.timer = self.loop.call_at(when, self._run, handle, when)
+
+    def _run(self, handle, scheduled):
+        handle.timer = None
+        logger.debug("Running func %s", handle.func)
+
+        started = self.loop.time()
+        if handle.is_coroutine:
+            handle.task = asyncio.ensure_future(handle.func(), loop=self.loop)
+        else:
+            handle.task = self.loop.run_in_executor(None, handle.func)
+        handle.task.add_done_callback(lambda task: self._run_done(handle, scheduled, started, task))
+
+    def _run_done(self, handle, scheduled, started, task):
+        handle.task = None
+        if task.cancelled():
+            return
+        exc = task.exception()
+        if exc is not None:
+            # Swallow the exceptions after logging them
+            handle.failures = log_failure(handle.key, handle.failures, (type(exc), exc, exc.__traceback__))
+        else:
+            handle.failures = 0
+
+        # CPU time isn't recorded since it would include every other coroutine
+        # that ran on the loop in the meantime
+        next_when = schedule_next_run(
+            self.overrun_policy,
+            self.stats,
+            handle.key,
+            scheduled,
+            handle.interval,
+            (started, None),
+            self.loop.time(),
+            failures=handle.failures,
+            max_backoff=self.max_backoff,
+        )
+        if not handle.cancelled and not self.stopped:
+            self._schedule(handle, next_when)
+
+    def _cancel(self, handle):
+        handle.cancelled = True
+        if handle.timer is not None:
+            handle.timer.cancel()
+            handle.timer = None
+        self.scheduled.discard(handle)
+
+    def _stop(self):
+        self.stopped = True
+        tasks = [handle.task for handle in self.scheduled if handle.task is not None]
+        for handle in list(self.scheduled):
+            self._cancel(handle)
+        for task in tasks:
+            task.cancel()
+
+        if self.thread is None:
+            return
+        # The loop is ours so it is stopped once the cancelled tasks are done
+        if tasks:
+            asyncio.gather(*tasks, return_exceptions=True).add_done_callback(lambda _: self.loop.stop())
+        else:
+            self.loop.stop()
+
+    def stop(self):
+        """
+        Stops all scheduled funcs, cancelling any that are running, and stops
+        the event loop if the scheduler started it.
+        """
+        with self.lock:
+            loop = self.loop
+        if loop is None or loop.is_closed():
+            return
+
+        loop.call_soon_threadsafe(self._stop)
+
+        if self.thread is not None and self.thread is not current_thread():
+            # Give the funcs 5 seconds to shut down before returning
+            self.thread.join(5)
+            if self.thread.is_alive():
+                raise RuntimeError("Thread %s did not stop in time" % self.thread.ident)
+            loop.close()
@@ -0,0 +1,120 @@
+"""
+The clock that the schedulers keep their schedules on.  Schedules use a
+monotonic clock so that they aren't thrown off when the wall clock is stepped
+by NTP or jumps when a VM is resumed.
+"""
+from __future__ import absolute_import
+
+import sys
+import time
+
+from sfxrunner.imports import lazy_import
+
+# These are only needed to spread out schedules, so they aren't imported until
+# a scheduler is configured
+hashlib = lazy_import("hashlib")  # pylint: disable=invalid-name
+socket = lazy_import("socket")  # pylint: disable=invalid-name
+
+
+def _make_clock_gettime_monotonic():
+    """
+    Returns a monotonic clock that calls clock_gettime directly, for Python 2
+    on Linux, which has no time.monotonic
+    """
+    # ctypes is slow to import, and Python 3 doesn't need it at all
+    import ctypes
+    import ctypes.util
+
+    class _Timespec(ctypes.Structure):  # pylint: disable=too-few-public-methods
+        _fields_ = [("tv_sec", ctypes.c_long), ("tv_nsec", ctypes.c_long)]
+
+    # CLOCK_MONOTONIC from <time.h>
+    clock_id = 1
+    libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    clock_gettime = libc.clock_gettime
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(_Timespec)]
+
+    def _monotonic():
+        spec = _Timespec()
+        if clock_gettime(clock_id, ctypes.byref(spec)) != 0:
+            raise OSError(ctypes.get_errno(), "clock_gettime failed")
+        return spec.tv_sec + spec.tv_nsec * 1e-9
+
+    _monotonic()
+    return _monotonic
+
+
+def _find_monotonic():
+    if hasattr(time, "monotonic"):
+        return time.monotonic  # pylint: disable=no-member
+    if sys.platform.startswith("linux"):
+        try:
+            return _make_clock_gettime_monotonic()
+        except (OSError, AttributeError):
+            pass
+    # Fall back to the wall clock, which is what the schedulers always used
+    return time.time
+
+
+# Returns the current time in seconds on a clock that only ever moves forward
+# at a steady rate.  It is only useful for measuring durations and scheduling.
+monotonic = _find_monotonic()  # pylint: disable=invalid-name
+
+
+def seconds_until_aligned(interval, wall_time=None):
+    """
+    Returns the number of seconds until the wall clock is next at a multiple of
+    `interval` since the epoch, or zero if it is at one right now
+    """
+    if wall_time is None:
+        wall_time = time.time()
+    return (interval - wall_time % interval) % interval
+
+
+def spread_phase(spread_key, name, interval):
+    """
+    Returns a deterministic offset in [0, interval) for the func with the given
+    name in the scheduler with the given spread key, or zero if the scheduler
+    has no spread key.  Different funcs get offsets that are spread evenly
+    across the interval, but a func gets the same offset every time it is
+    scheduled.
+    """
+    if not spread_key:
+        return 0.0
+    digest = hashlib.sha1(("%s/%s" % (spread_key, name)).encode("utf-8")).hexdigest()
+    return int(digest[:8], 16) / 4294967296.0 * interval
+
+
+def monitor_spread_key(config):
+    """
+    Returns the spread key for the schedulers of the monitor with the given
+    config if it has `spreadStartTimes` enabled, or None otherwise.  The key
+    includes the host name so that the same monitor on different hosts gets a
+    different phase.
+    """
+    if not config.get("spreadStartTimes"):
+        return None
+    return "%s/%s" % (socket.gethostname(), config.get("MonitorID"))
+
+
+def first_run_time(  # pylint: disable=too-many-arguments
+    interval, immediately=True, align_to_wall_clock=False, now=None, phase=0.0
+):
+    """
+    Returns when a func that was just scheduled should first run on the
+    monotonic clock (or on the clock that `now` comes from, if given).  If
+    `align_to_wall_clock` is True, the first run is at the next multiple of
+    `interval` on the wall clock, no matter `immediately`, so that funcs with
+    the same interval run at the same time on every host with a synced clock.
+    After that, each run is an interval after the last one on the monotonic
+    clock, so the runs stay aligned unless the wall clock is stepped.
+
+    `phase` (see spread_phase) delays the first run, or with
+    `align_to_wall_clock` shifts the boundaries that the func is aligned to,
+    so that funcs that would otherwise all run at once are spread out.
+    """
+    if now is None:
+        now = monotonic()
+    if align_to_wall_clock:
+        return now + seconds_until_aligned(interval, time.time() - phase)
+    return now + (0 if immediately else interval) + phase
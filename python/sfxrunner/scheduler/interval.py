@@ -4,11 +4,43 @@ Logic for scheduling reads across a shared threadpool
 from __future__ import absolute_import
 
 import heapq
+import itertools
 import logging
-import sys
-import time
 from threading import Event, Lock, Thread
 
+from .clock import first_run_time, monotonic, spread_phase
+from .stats import (
+    CALLBACK_STATS,
+    DEFAULT_MAX_BACKOFF_SECONDS,
+    OVERRUN_RUN_LATE,
+    call_scheduled,
+    func_name,
+    run_started,
+    schedule_next_run,
+)
+
+
+class ScheduledFunc(object):  # pylint: disable=too-few-public-methods
+    """
+    Handle to a function scheduled on an IntervalScheduler.  Cancelling a
+    function only marks its handle and the scheduler drops it when it next
+    comes off of the heap, so cancelling is O(1) no matter how many functions
+    are scheduled.
+    """
+
+    __slots__ = ["func", "key", "interval", "cancelled", "queued", "failures"]
+
+    def __init__(self, func, key, interval):
+        self.func = func
+        self.key = key
+        self.interval = interval
+        self.cancelled = False
+        # Whether the handle is currently on the heap, as opposed to being
+        # held by a gather thread awaiting execution
+        self.queued = False
+        # The number of times in a row that the function has failed
+        self.failures = 0
+
 
 class IntervalScheduler(object):  # pylint: disable=too-many-instance-attributes
     """
@@ -19,25 +51,43 @@ class IntervalScheduler(object):  # pylint: disable=too-many-instance-attributes
     interval.
     """
 
-    def __init__(self, max_thread_count=5):
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        max_thread_count=5,
+        overrun_policy=OVERRUN_RUN_LATE,
+        stats=None,
+        align_to_wall_clock=False,
+        spread_key=None,
+        max_backoff=DEFAULT_MAX_BACKOFF_SECONDS,
+    ):
         self.max_thread_count = max_thread_count
+        self.overrun_policy = overrun_policy
+        self.stats = stats or CALLBACK_STATS
+        self.align_to_wall_clock = align_to_wall_clock
+        self.spread_key = spread_key
+        self.max_backoff = max_backoff
         self.threads = []
 
+        # Entries are (when, seq, ScheduledFunc) tuples.  The sequence number
+        # breaks ties so that the handles themselves never get compared.
         self.heap = []
         self.heap_lock = Lock()
+        self.seq = itertools.count()
 
-        self.stop_event = Event()
+        # The number of cancelled handles that are still on the heap.  The
+        # heap is compacted when they make up most of it.
+        self.cancelled_count = 0
 
-        # This is used to facilitate cancelling gatherings.
-        self.func_blacklist = []
+        self.stop_event = Event()
 
         # Event that can be triggered when a new item is scheduled for the
         # first time that needs to run before the next scheduled item in the
         # heap.
         self.new_earlier_event = Event()
-        self.next_scheduled = sys.maxint  # pylint: disable=no-member
+        self.next_scheduled = float("inf")
 
     def _add_thread(self):
+        self.threads = [thr for thr in self.threads if thr.is_alive()]
         if len(self.threads) >= self.max_thread_count:
             return
         thr = Thread(target=self._gather_metrics_thread)
@@ -54,15 +104,25 @@ class IntervalScheduler(object):  # pylint: disable=too-many-instance-attributes
         # immediately
         self.new_earlier_event.set()
 
-    def run_on_interval(self, interval_in_seconds, func, immediately=True):
+    def run_on_interval(self, interval_in_seconds, func, immediately=True, name=None):
         """
         @param immediately: whether to run the func immediately when registered
         or wait until `interval_in_seconds` for the first run
+        @param name: identifies the func in the counters reported to the agent
+
+        @returns: a function that cancels any further runs of `func` when
+        called
         """
-        when = time.time() + (0 if immediately else interval_in_seconds)
+        handle = ScheduledFunc(func, self.stats.register(name or func_name(func)), interval_in_seconds)
+        when = first_run_time(
+            interval_in_seconds,
+            immediately,
+            self.align_to_wall_clock,
+            phase=spread_phase(self.spread_key, handle.key, interval_in_seconds),
+        )
 
         with self.heap_lock:
-            is_earliest = self._schedule_gathering(when, func, interval_in_seconds)
+            is_earliest = self._schedule_gathering(when, handle)
 
             # This tests for an edge case where a new interval is supposed to
             # begin before any scheduled gatherings.  We have to awaken at
@@ -71,48 +131,69 @@ class IntervalScheduler(object):  # pylint: disable=too-many-instance-attributes
             if is_earliest:
                 self.new_earlier_event.set()
 
-            if len(self.heap) < self.max_thread_count:
+            if len(self.heap) - self.cancelled_count < self.max_thread_count:
                 self._add_thread()
 
         def cancel():
-            if cancel.was_called:
+            self._cancel(handle)
+
+        return cancel
+
+    def _cancel(self, handle):
+        with self.heap_lock:
+            if handle.cancelled:
                 return
+            # If the handle isn't on the heap, then it is currently held by a
+            # gather thread awaiting execution, which will see the flag and
+            # neither run nor reschedule it.
+            handle.cancelled = True
 
-            with self.heap_lock:
-                # The func should only be in either the heap once, or in a
-                # single gather thread awaiting execution.
-                for i, (_, heap_func, _) in enumerate(self.heap):
-                    if heap_func == func:
-                        del self.heap[i]
-                        heapq.heapify(self.heap)
-                        cancel.was_called = True
-                        return
-
-                # If the func wasn't in the heap, then it must be currently
-                # scheduled gather thread awaiting execution.  This will
-                # tell the gather thread to not run it again, nor
-                # reschedule it, which will effectively stop the gathering.
-                self.func_blacklist.append(func)
-            logging.error("Could not find gather event on heap to cancel!")
-
-        cancel.was_called = False
+            if handle.queued:
+                self.cancelled_count += 1
+                if self.cancelled_count > len(self.heap) // 2:
+                    self._compact_heap()
 
-        return cancel
+    def _compact_heap(self):
+        """
+        Assumes caller holds heap lock!
+        """
+        self.heap = [entry for entry in self.heap if not entry[2].cancelled]
+        heapq.heapify(self.heap)
+        self.cancelled_count = 0
 
-    def _schedule_gathering(self, when, func, interval_in_seconds):
+    def _schedule_gathering(self, when, handle):
         """
         Assumes caller holds heap lock!
 
         @returns: bool specifying whether the scheduled gather is supposed to
         occur earlier than the next scheduled gathering
         """
-        heapq.heappush(self.heap, (when, func, interval_in_seconds))
-        logging.debug("Inserted %s into heap: %s", (when, func, interval_in_seconds), self.heap)
+        if handle.cancelled:
+            return False
+
+        handle.queued = True
+        heapq.heappush(self.heap, (when, next(self.seq), handle))
+        logging.debug("Inserted %s into heap", (when, handle.func, handle.interval))
         if when < self.next_scheduled:
             self.next_scheduled = when
             return True
         return False
 
+    def _pop_gathering(self):
+        """
+        Assumes caller holds heap lock!
+
+        @returns: the earliest (when, handle) on the heap that hasn't been
+        cancelled.  Raises IndexError if there are none.
+        """
+        while True:
+            when, _, handle = heapq.heappop(self.heap)
+            handle.queued = False
+            if handle.cancelled:
+                self.cancelled_count -= 1
+                continue
+            return when, handle
+
     def _gather_metrics_thread(self):
         """
         This is the main function of the separate worker threads.
@@ -123,7 +204,7 @@ class IntervalScheduler(object):  # pylint: disable=too-many-instance-attributes
 
             with self.heap_lock:
                 try:
-                    when, func, interval = heapq.heappop(self.heap)
+                    when, handle = self._pop_gathering()
                     self.next_scheduled = when
                 except IndexError:
                     # There is nothing to do so shutdown this thread.  Another
@@ -140,18 +221,27 @@ class IntervalScheduler(object):  # pylint: disable=too-many-instance-attributes
             # gathering and start over.
             if not self._wait_until_gather(when):
                 with self.heap_lock:
-                    self._schedule_gathering(when, func, interval)
+                    self._schedule_gathering(when, handle)
                     continue
 
+            if handle.cancelled:
+                continue
+
+            started = run_started()
+            handle.failures = call_scheduled(handle.func, handle.key, handle.failures)
+
+            next_when = schedule_next_run(
+                self.overrun_policy,
+                self.stats,
+                handle.key,
+                when,
+                handle.interval,
+                started,
+                failures=handle.failures,
+                max_backoff=self.max_backoff,
+            )
             with self.heap_lock:
-                if func in self.func_blacklist:
-                    self.func_blacklist.remove(func)
-                    continue
-
-            func()
-
-            with self.heap_lock:
-                self._schedule_gathering(interval + when, func, interval)
+                self._schedule_gathering(next_when, handle)
 
     def _wait_until_gather(self, when):
         """
@@ -165,7 +255,7 @@ class IntervalScheduler(object):  # pylint: disable=too-many-instance-attributes
         should happen and thus this thread should give up it's currently
         scheduled gathering.
         """
-        secs_until_gather = when - time.time()
+        secs_until_gather = when - monotonic()
 
         while secs_until_gather > 0:
             self.new_earlier_event.wait(secs_until_gather)
@@ -184,5 +274,5 @@ class IntervalScheduler(object):  # pylint: disable=too-many-instance-attributes
                     self.new_earlier_event.clear()
                     return False
 
-            secs_until_gather = when - time.time()
+            secs_until_gather = when - monotonic()
         return True
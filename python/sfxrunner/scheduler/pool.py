@@ -0,0 +1,182 @@
+"""
+A scheduler that multiplexes scheduled funcs onto a fixed number of threads
+"""
+from __future__ import absolute_import
+
+import heapq
+import itertools
+import logging
+from threading import Condition, Event, Thread
+
+from .clock import first_run_time, monotonic, spread_phase
+from .simple import SimpleScheduler
+from .stats import (
+    CALLBACK_STATS,
+    DEFAULT_MAX_BACKOFF_SECONDS,
+    OVERRUN_RUN_LATE,
+    call_scheduled,
+    func_name,
+    run_started,
+    schedule_next_run,
+    validate_overrun_policy,
+)
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue  # pylint: disable=import-error
+
+logger = logging.getLogger()
+
+
+class PoolScheduler(object):  # pylint: disable=too-many-instance-attributes
+    """
+    Runs scheduled funcs on a fixed-size pool of worker threads, with a single
+    timer thread that hands each func to the pool when it is due.  This keeps
+    the number of threads constant for plugins that schedule a lot of funcs,
+    most of which are idle most of the time.
+
+    Like SimpleScheduler, a func never runs in parallel with itself; its next
+    run is scheduled only once the current one has finished.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        worker_count,
+        overrun_policy=OVERRUN_RUN_LATE,
+        stats=None,
+        align_to_wall_clock=False,
+        spread_key=None,
+        max_backoff=DEFAULT_MAX_BACKOFF_SECONDS,
+    ):
+        assert worker_count > 0, "PoolScheduler needs at least one worker"
+
+        self.worker_count = worker_count
+        self.overrun_policy = overrun_policy
+        self.stats = stats or CALLBACK_STATS
+        self.align_to_wall_clock = align_to_wall_clock
+        self.spread_key = spread_key
+        self.max_backoff = max_backoff
+        self.threads = []
+        self.shutdown_event = Event()
+
+        # Entries are (when, seq, interval, func, key, failures) tuples, where
+        # key is the func's CallbackKey and failures is the number of times in
+        # a row that it has failed.
+        # The sequence number breaks ties so that funcs are never compared.
+        self.heap = []
+        self.heap_cond = Condition()
+        self.seq = itertools.count()
+
+        self.work_queue = Queue()
+
+    def _start(self):
+        timer = Thread(target=self._timer_thread)
+        timer.daemon = True
+        self.threads.append(timer)
+        timer.start()
+
+        for _ in range(self.worker_count):
+            worker = Thread(target=self._worker_thread)
+            worker.daemon = True
+            self.threads.append(worker)
+            worker.start()
+
+    def run_on_interval(self, interval_in_seconds, func, immediately=True, name=None):
+        """
+        Calls func on a given interval.  Funcs scheduled via this method may
+        run in parallel with others if their intervals align, up to the number
+        of workers.  `name` identifies the func in the counters reported to the
+        agent.
+        """
+        if not self.threads:
+            self._start()
+
+        key = self.stats.register(name or func_name(func))
+        next_run = first_run_time(
+            interval_in_seconds,
+            immediately,
+            self.align_to_wall_clock,
+            phase=spread_phase(self.spread_key, key, interval_in_seconds),
+        )
+        self._schedule(next_run, interval_in_seconds, func, key, 0)
+
+    def _schedule(self, when, interval_in_seconds, func, key, failures):  # pylint: disable=too-many-arguments
+        with self.heap_cond:
+            heapq.heappush(self.heap, (when, next(self.seq), interval_in_seconds, func, key, failures))
+            # Only the timer thread waits on the condition
+            self.heap_cond.notify()
+
+    def _timer_thread(self):
+        with self.heap_cond:
+            while not self.shutdown_event.is_set():
+                if not self.heap:
+                    self.heap_cond.wait()
+                    continue
+
+                secs_until_next = self.heap[0][0] - monotonic()
+                if secs_until_next > 0:
+                    self.heap_cond.wait(secs_until_next)
+                    continue
+
+                when, _, interval_in_seconds, func, key, failures = heapq.heappop(self.heap)
+                self.work_queue.put((when, interval_in_seconds, func, key, failures))
+
+    def _worker_thread(self):
+        while True:
+            item = self.work_queue.get()
+            if item is None or self.shutdown_event.is_set():
+                return
+
+            when, interval_in_seconds, func, key, failures = item
+
+            logger.debug("Running func %s", func)
+            started = run_started()
+            failures = call_scheduled(func, key, failures)
+
+            next_run = schedule_next_run(
+                self.overrun_policy,
+                self.stats,
+                key,
+                when,
+                interval_in_seconds,
+                started,
+                failures=failures,
+                max_backoff=self.max_backoff,
+            )
+            self._schedule(next_run, interval_in_seconds, func, key, failures)
+
+    def stop(self):
+        """
+        Stops all existing threads and prevents any new ones from ever running.
+        """
+        self.shutdown_event.set()
+        with self.heap_cond:
+            self.heap_cond.notify()
+        for _ in range(self.worker_count):
+            self.work_queue.put(None)
+
+        # Give the threads 5 seconds to shut down before returning
+        wait_until = monotonic() + 5
+        for thr in self.threads:
+            thr.join(max(0, wait_until - monotonic()))
+            if thr.is_alive():
+                raise RuntimeError("Thread %s did not stop in time" % thr.ident)
+
+
+def new_scheduler(  # pylint: disable=too-many-arguments
+    worker_count=None, overrun_policy=None, stats=None, align_to_wall_clock=False, spread_key=None, max_backoff=None
+):
+    """
+    Returns a PoolScheduler with `worker_count` workers, or a SimpleScheduler
+    that runs each func on its own thread if `worker_count` is not positive.
+    Raises ValueError if `overrun_policy` is not one of the known policies.
+    The runs are recorded in `stats` if given, or in the global CALLBACK_STATS.
+    Funcs that keep failing back off up to `max_backoff` seconds between runs,
+    or DEFAULT_MAX_BACKOFF_SECONDS if it isn't set.
+    """
+    overrun_policy = validate_overrun_policy(overrun_policy)
+    max_backoff = max_backoff or DEFAULT_MAX_BACKOFF_SECONDS
+    if worker_count and worker_count > 0:
+        return PoolScheduler(worker_count, overrun_policy, stats, bool(align_to_wall_clock), spread_key, max_backoff)
+    return SimpleScheduler(overrun_policy, stats, bool(align_to_wall_clock), spread_key, max_backoff)
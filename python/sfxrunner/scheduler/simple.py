@@ -1,9 +1,17 @@
 import logging
-import time
 from functools import partial as p
 from threading import Event, Thread
 
-from sfxrunner.logs import log_exc_traceback_as_error
+from .clock import first_run_time, monotonic, spread_phase
+from .stats import (
+    CALLBACK_STATS,
+    DEFAULT_MAX_BACKOFF_SECONDS,
+    OVERRUN_RUN_LATE,
+    call_scheduled,
+    func_name,
+    run_started,
+    schedule_next_run,
+)
 
 logger = logging.getLogger()
 
@@ -15,22 +23,48 @@ class SimpleScheduler(object):
     be run at about the same time.
     """
 
-    def __init__(self):
+    def __init__(  # pylint: disable=too-many-arguments
+        self,
+        overrun_policy=OVERRUN_RUN_LATE,
+        stats=None,
+        align_to_wall_clock=False,
+        spread_key=None,
+        max_backoff=DEFAULT_MAX_BACKOFF_SECONDS,
+    ):
         self.threads = []
         self.shutdown_event = Event()
+        self.overrun_policy = overrun_policy
+        self.stats = stats or CALLBACK_STATS
+        # Whether funcs first run at a multiple of their interval on the wall
+        # clock (see clock.first_run_time)
+        self.align_to_wall_clock = align_to_wall_clock
+        # If set, the first runs of funcs are spread across their interval
+        # based on this key (see clock.spread_phase)
+        self.spread_key = spread_key
+        # The most seconds that a func that keeps failing waits between runs
+        # (see stats.backoff_seconds)
+        self.max_backoff = max_backoff
 
-    def run_on_interval(self, interval_in_seconds, func, immediately=True):
+    def run_on_interval(self, interval_in_seconds, func, immediately=True, name=None):
         """
         Calls func on a given interval.  Each func scheduled via this method
-        may run in parallel with others if their intervals align.
+        may run in parallel with others if their intervals align.  `name`
+        identifies the func in the counters reported to the agent.
         """
-        thread = Thread(target=p(self._call_on_interval, interval_in_seconds, func, immediately))
+        key = self.stats.register(name or func_name(func))
+        thread = Thread(target=p(self._call_on_interval, interval_in_seconds, func, immediately, key))
         thread.daemon = True
         self.threads.append(thread)
         thread.start()
 
-    def _call_on_interval(self, interval_in_seconds, func, immediately):
-        next_run = time.time() + 0 if immediately else interval_in_seconds
+    def _call_on_interval(self, interval_in_seconds, func, immediately, key):
+        next_run = first_run_time(
+            interval_in_seconds,
+            immediately,
+            self.align_to_wall_clock,
+            phase=spread_phase(self.spread_key, key, interval_in_seconds),
+        )
+        failures = 0
 
         while True:
             # There is some inherent imprecision with this since there is no
@@ -41,20 +75,26 @@ class SimpleScheduler(object):
             # needed and then do a busy spin until it reaches the desired time,
             # but even that is subject to some imprecision and would cause
             # significantly higher CPU usage.
-            self.shutdown_event.wait(max(0, next_run - time.time()))
+            self.shutdown_event.wait(max(0, next_run - monotonic()))
             if self.shutdown_event.is_set():
                 return
 
             logger.debug("Running func %s", func)
-            try:
-                func()
-            except Exception:  # pylint: disable=broad-except
-                log_exc_traceback_as_error()
-                # Swallow the exceptions after logging them.  We could
-                # implement some kind of binary backoff logic like Collectd
-                # uses.
+            started = run_started()
+            # Exceptions are swallowed after logging them and the func backs
+            # off for as long as it keeps failing, like collectd does
+            failures = call_scheduled(func, key, failures)
 
-            next_run += interval_in_seconds
+            next_run = schedule_next_run(
+                self.overrun_policy,
+                self.stats,
+                key,
+                next_run,
+                interval_in_seconds,
+                started,
+                failures=failures,
+                max_backoff=self.max_backoff,
+            )
 
     def stop(self):
         """
@@ -63,8 +103,8 @@ class SimpleScheduler(object):
         self.shutdown_event.set()
 
         # Give the threads 5 seconds to shut down before returning
-        wait_until = time.time() + 5
+        wait_until = monotonic() + 5
         for thr in self.threads:
-            thr.join(max(0, wait_until - time.time()))
+            thr.join(max(0, wait_until - monotonic()))
             if thr.is_alive():
                 raise RuntimeError("Thread %s did not stop in time" % thr.ident)
@@ -0,0 +1,389 @@
+"""
+Handling of scheduled funcs that run longer than their interval, along with
+counters and timing histograms about each scheduled func that are reported
+back to the agent
+"""
+from __future__ import absolute_import
+
+import logging
+import sys
+import time
+import traceback
+from bisect import bisect_left
+from threading import Event, Lock, Thread
+
+from sfxrunner.messages import MSG_TYPE_CALLBACK_STATS, MSG_TYPE_CALLBACK_TIMINGS
+
+from .clock import monotonic
+
+logger = logging.getLogger()
+
+# Every run that was missed while the func was overrunning is made up, back to
+# back, until the func has caught up with its schedule.
+OVERRUN_RUN_LATE = "runLate"
+# Runs that were missed are dropped and the func next runs at the first
+# scheduled time that is still in the future.
+OVERRUN_SKIP = "skip"
+# Runs that were missed are collapsed into a single run that happens right
+# away, and the schedule continues on from that run.  This is what collectd
+# itself does.
+OVERRUN_COALESCE = "coalesce"
+
+OVERRUN_POLICIES = (OVERRUN_RUN_LATE, OVERRUN_SKIP, OVERRUN_COALESCE)
+
+# The most that a func that keeps failing will be delayed between runs.  This
+# is much lower than collectd's default MaxReadInterval of a day so that a
+# func starts reporting again soon after whatever it reads from recovers.
+DEFAULT_MAX_BACKOFF_SECONDS = 300
+
+
+def validate_overrun_policy(policy):
+    """
+    Returns the given policy, or the default if it is empty.  Raises
+    ValueError for unknown policies.
+    """
+    if not policy:
+        return OVERRUN_RUN_LATE
+    if policy not in OVERRUN_POLICIES:
+        raise ValueError("Unknown overrun policy '%s', must be one of %s" % (policy, ", ".join(OVERRUN_POLICIES)))
+    return policy
+
+
+def next_run_time(policy, scheduled, interval, now):
+    """
+    Determines when a func should next run, given that it was scheduled to run
+    at `scheduled` and its run finished at `now`.
+
+    @returns: a tuple of the next run time and the number of runs that were
+    dropped because the func overran
+    """
+    next_run = scheduled + interval
+    if next_run >= now:
+        return next_run, 0
+
+    missed = int((now - scheduled) // interval)
+    if policy == OVERRUN_SKIP:
+        return scheduled + (missed + 1) * interval, missed
+    if policy == OVERRUN_COALESCE:
+        return now, missed - 1
+    return next_run, 0
+
+
+def backoff_seconds(interval, failures, max_backoff=DEFAULT_MAX_BACKOFF_SECONDS):
+    """
+    Returns how long to wait before running a func again that has failed
+    `failures` times in a row.  Like collectd does for read callbacks, the
+    wait doubles with each failure, up to `max_backoff` seconds, and is only
+    ever the plain interval once the func succeeds again.
+    """
+    if failures <= 0:
+        return interval
+    # Limit the exponent so that a func that fails for a long time doesn't
+    # overflow
+    return min(interval * 2 ** min(failures, 32), max(max_backoff, interval))
+
+
+def log_failure(name, failures, exc_info):
+    """
+    Logs an exception raised by the named func and returns the number of times
+    that it has failed in a row, including this one.  Only the first failure
+    in a row gets a full traceback so that a func that fails every run, e.g.
+    because a database is down, doesn't flood the agent's logs.  The later
+    failures are logged without the count so that the log handler can
+    collapse them while the func keeps failing with the same error.
+    """
+    if failures == 0:
+        logger.error(
+            "Error running scheduled func %s:\n%s", name, "".join(traceback.format_exception(*exc_info)).rstrip()
+        )
+    else:
+        logger.error(
+            "Scheduled func %s failed again: %s",
+            name,
+            "".join(traceback.format_exception_only(exc_info[0], exc_info[1])).strip(),
+        )
+    return failures + 1
+
+
+def call_scheduled(func, name, failures):
+    """
+    Calls a scheduled func, logging and swallowing any exception that it
+    raises.  `failures` is the number of times in a row that it has failed
+    before.
+
+    @returns: the number of times in a row that the func has failed, which is
+    zero if this run succeeded
+    """
+    try:
+        func()
+    except Exception:  # pylint: disable=broad-except
+        return log_failure(name, failures, sys.exc_info())
+    return 0
+
+
+# The upper bounds, in seconds, of the buckets of the timing histograms
+TIMING_BUCKET_BOUNDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+def _linux_thread_time():
+    import resource
+
+    # RUSAGE_THREAD is only exposed by the resource module in Python 3
+    usage = resource.getrusage(getattr(resource, "RUSAGE_THREAD", 1))
+    return usage.ru_utime + usage.ru_stime
+
+
+if hasattr(time, "thread_time"):
+    thread_time = time.thread_time  # pylint: disable=invalid-name,no-member
+elif sys.platform.startswith("linux"):
+    thread_time = _linux_thread_time  # pylint: disable=invalid-name
+else:
+    # CPU time is not recorded
+    thread_time = None  # pylint: disable=invalid-name
+
+
+def run_started():
+    """
+    Returns the monotonic and CPU time of the current thread at the start of a
+    run, to be passed to schedule_next_run when the run is done
+    """
+    return monotonic(), thread_time() if thread_time else None
+
+
+class Histogram(object):
+    """
+    A histogram of durations with the buckets in TIMING_BUCKET_BOUNDS, plus one
+    for durations that are larger than all of them
+    """
+
+    __slots__ = ["buckets", "total", "count"]
+
+    def __init__(self):
+        self.buckets = [0] * (len(TIMING_BUCKET_BOUNDS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        """
+        Adds a single duration to the histogram
+        """
+        self.buckets[bisect_left(TIMING_BUCKET_BOUNDS, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def to_dict(self):
+        """
+        Returns the histogram with cumulative bucket counts, excluding the
+        last bucket since it always equals the total count
+        """
+        cumulative = []
+        running = 0
+        for bucket_count in self.buckets[:-1]:
+            running += bucket_count
+            cumulative.append(running)
+        return {"sum": self.total, "count": self.count, "buckets": cumulative}
+
+
+def func_name(func):
+    """
+    Returns a name for a scheduled func that doesn't have one explicitly given
+    """
+    while hasattr(func, "func"):
+        # Unwrap functools.partial
+        func = func.func
+    name = getattr(func, "__name__", None)
+    if not name:
+        return repr(func)
+    module = getattr(func, "__module__", None)
+    return "%s.%s" % (module, name) if module else name
+
+
+class CallbackKey(object):  # pylint: disable=too-few-public-methods
+    """
+    Identifies a single scheduled func in CallbackStats.  Funcs that have the
+    same name are told apart by the order they were registered in, which is
+    their index.  It formats as the name, followed by the index for all but
+    the first func with that name, so that it can be used in log messages.
+    """
+
+    __slots__ = ["name", "index"]
+
+    def __init__(self, name, index):
+        self.name = name
+        self.index = index
+
+    def __str__(self):
+        return "%s#%d" % (self.name, self.index) if self.index else self.name
+
+
+class CallbackStats(object):
+    """
+    Thread-safe counters and timing histograms about the runs of each
+    scheduled func, keyed by the CallbackKey that the func was registered with
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.counters = {}
+        # Values are (wall, cpu) histogram tuples
+        self.timings = {}
+        # The number of funcs registered with each name
+        self.registered = {}
+
+    def register(self, name):
+        """
+        Returns a new CallbackKey for a func with the given name, which the
+        func's runs are recorded under
+        """
+        with self.lock:
+            index = self.registered.get(name, 0)
+            self.registered[name] = index + 1
+        return CallbackKey(name, index)
+
+    def record_run(  # pylint: disable=too-many-arguments
+        self, key, overran, skipped_runs, wall_time=None, cpu_time=None, failed=False, backoff=0
+    ):
+        """
+        Records a single run of the func with the given CallbackKey, along with
+        how long it took in seconds, if known.  `backoff` is how many seconds
+        the func waits before its next run because it keeps failing, or zero if
+        it succeeded.
+        """
+        with self.lock:
+            counters = self.counters.get(key)
+            if counters is None:
+                counters = self.counters[key] = {
+                    "name": key.name,
+                    "index": key.index,
+                    "runs": 0,
+                    "overruns": 0,
+                    "skippedRuns": 0,
+                    "failures": 0,
+                    "backoffSeconds": 0,
+                }
+                self.timings[key] = (Histogram(), Histogram())
+            counters["runs"] += 1
+            if overran:
+                counters["overruns"] += 1
+                counters["skippedRuns"] += skipped_runs
+            if failed:
+                counters["failures"] += 1
+            counters["backoffSeconds"] = backoff
+
+            wall, cpu = self.timings[key]
+            if wall_time is not None:
+                wall.observe(wall_time)
+            if cpu_time is not None:
+                cpu.observe(cpu_time)
+
+    def snapshot(self):
+        """
+        Returns a copy of the counters of every func that has run so far
+        """
+        with self.lock:
+            return [dict(c) for c in self.counters.values()]
+
+    def timings_snapshot(self):
+        """
+        Returns the timing histograms of every func that has run so far.  The
+        CPU histogram is None if CPU time isn't available on this platform.
+        """
+        with self.lock:
+            return [
+                {
+                    "name": key.name,
+                    "index": key.index,
+                    "wall": wall.to_dict(),
+                    "cpu": cpu.to_dict() if thread_time else None,
+                }
+                for key, (wall, cpu) in self.timings.items()
+            ]
+
+
+# The schedulers record their runs here unless they are given another
+# instance.  This is only used by runners with a single monitor, since each
+# instance in a shared host (see sfxcollectd.host) gets its own CallbackStats.
+CALLBACK_STATS = CallbackStats()
+
+
+def schedule_next_run(  # pylint: disable=too-many-arguments,too-many-locals
+    policy, stats, key, scheduled, interval, started=None, now=None, failures=0, max_backoff=DEFAULT_MAX_BACKOFF_SECONDS
+):
+    """
+    Records the run of the func with the given CallbackKey, which was
+    scheduled to run at `scheduled` and just finished, and returns when it should run next according to the overrun
+    policy.  `started` is the return value of run_started from right before the
+    func was called.  `now` is the current time on the clock that `scheduled`
+    and `started` are on, if it isn't the monotonic clock.
+
+    If the func has failed `failures` times in a row, it next runs after the
+    backoff from backoff_seconds instead, counted from when this run finished.
+    """
+    if now is None:
+        now = monotonic()
+    next_run, skipped_runs = next_run_time(policy, scheduled, interval, now)
+    overran = scheduled + interval < now
+    if overran:
+        logger.debug("Func %s overran its interval of %s seconds", key, interval)
+
+    backoff = 0
+    if failures > 0:
+        backoff = backoff_seconds(interval, failures, max_backoff)
+        next_run = max(next_run, now + backoff)
+        logger.debug("Func %s has failed %d times in a row, next run in %s seconds", key, failures, backoff)
+
+    wall_time = cpu_time = None
+    if started:
+        wall_started, cpu_started = started
+        wall_time = now - wall_started
+        if cpu_started is not None:
+            cpu_time = thread_time() - cpu_started
+
+    stats.record_run(key, overran, skipped_runs, wall_time, cpu_time, failures > 0, backoff)
+    return next_run
+
+
+class StatsReporter(object):
+    """
+    Periodically sends the callback counters and timings to the agent
+    """
+
+    def __init__(self, output_writer, interval_in_seconds, stats=None):
+        self.output_writer = output_writer
+        self.interval_in_seconds = interval_in_seconds
+        self.stats = stats or CALLBACK_STATS
+        self.stop_event = Event()
+        self.thread = None
+
+    def start(self):
+        """
+        Starts sending counters in a background thread
+        """
+        self.thread = Thread(target=self._report_on_interval)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _report_on_interval(self):
+        while not self.stop_event.wait(self.interval_in_seconds):
+            self.send()
+
+    def send(self):
+        """
+        Sends the current counters and timings to the agent if any funcs have
+        run
+        """
+        callbacks = self.stats.snapshot()
+        if callbacks:
+            self.output_writer.send_msg(MSG_TYPE_CALLBACK_STATS, {"callbacks": callbacks})
+            self.output_writer.send_msg(
+                MSG_TYPE_CALLBACK_TIMINGS, {"bounds": TIMING_BUCKET_BOUNDS, "callbacks": self.stats.timings_snapshot()}
+            )
+
+    def stop(self):
+        """
+        Stops the background thread and sends the final counters and timings
+        """
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+        self.send()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+#
+# Compares how long it takes for a Python subprocess runner to be ready to be
+# configured when it is spawned as a new interpreter vs. when it is forked
+# from the fork server (python/sfxrunner/forkserver.py).  A runner is
+# considered ready once the agent gets the first frame from it, which is the
+# startup log message.
+#
+# Usage: bench-python-runner-startup.py [-n count] [--python binary] [--module sfxcollectd]
+#
+import argparse
+import json
+import os
+import resource
+import shutil
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+PYTHON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "python")
+FRAME_HEADER = struct.Struct(">ii")
+
+
+def read_exactly(read, size):
+    data = b""
+    while len(data) < size:
+        chunk = read(size - len(data))
+        if not chunk:
+            raise EOFError()
+        data += chunk
+    return data
+
+
+def read_frame(read):
+    _, size = FRAME_HEADER.unpack(read_exactly(read, FRAME_HEADER.size))
+    return read_exactly(read, size)
+
+
+def children_cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+def bench_spawn(python, module, env):
+    start = time.time()
+    proc = subprocess.Popen(
+        [python, "-u", "-m", module], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, env=env
+    )
+    read_frame(proc.stdout.read)
+    elapsed = time.time() - start
+    proc.stdin.close()
+    proc.wait()
+    return elapsed
+
+
+def bench_fork(socket_path, module):
+    start = time.time()
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    conn.connect(socket_path)
+    conn.sendall(json.dumps({"module": module, "args": []}).encode("utf-8") + b"\n")
+    read_exactly(conn.recv, 4)
+    read_frame(conn.recv)
+    elapsed = time.time() - start
+    conn.close()
+    return elapsed
+
+
+def summarize(name, times, cpu_seconds=None):
+    times = sorted(times)
+    cpu = "n/a" if cpu_seconds is None else "%.1fms" % (cpu_seconds / len(times) * 1000)
+    print(
+        "%-6s n=%d median=%.1fms p90=%.1fms cpu/runner=%s"
+        % (name, len(times), times[len(times) // 2] * 1000, times[int(len(times) * 0.9)] * 1000, cpu)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", type=int, default=20)
+    parser.add_argument("--python", default=sys.executable)
+    parser.add_argument("--module", default="sfxcollectd")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [env.get("PYTHONPATH"), PYTHON_DIR]))
+
+    cpu_before = children_cpu_seconds()
+    times = [bench_spawn(args.python, args.module, env) for _ in range(args.n)]
+    summarize("spawn", times, children_cpu_seconds() - cpu_before)
+
+    tmpdir = tempfile.mkdtemp()
+    socket_path = os.path.join(tmpdir, "forkserver.sock")
+    server = subprocess.Popen(
+        [args.python, "-u", "-m", "sfxrunner.forkserver", socket_path],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        env=env,
+    )
+    try:
+        server.stdout.readline()
+        # Forked runners are not children of this process so their CPU time
+        # can't be measured here
+        times = [bench_fork(socket_path, args.module) for _ in range(args.n)]
+        summarize("fork", times)
+    finally:
+        server.kill()
+        server.wait()
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 #!/bin/python
 
+import compileall
 import contextlib
 import os
 import shutil
@@ -50,3 +51,10 @@ url:     {u}""".format(p=plugin_name, v=version, r=repo, u=url))
         def rmtree_error_handler(*args):
             print("unable to remove element {0}".format(elem))
         shutil.rmtree(os.path.join(plugin_dir, elem), onerror=rmtree_error_handler)
+
+    # Precompile the plugin so that the Python runners don't have to compile
+    # it every time that they start on a read-only filesystem, where they
+    # can't write the .pyc files themselves.  Some plugins ship scripts that
+    # aren't valid on this Python version, which are left as source.
+    if not compileall.compile_dir(plugin_dir, quiet=1):
+        print("unable to compile all of {0}".format(plugin_name))
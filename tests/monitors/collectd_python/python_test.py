@@ -5,9 +5,12 @@ import os
 import re
 import signal
 import string
+import tempfile
 import time
 from functools import partial as p
+from textwrap import dedent
 
+import psutil
 import pytest
 import redis
 from signalfx.generated_protocol_buffers import signal_fx_protocol_buffers_pb2 as sf_pbuf
@@ -73,3 +76,69 @@ def test_python_runner_with_redis():
                 ),
                 timeout_seconds=3,
             ), "metric type was wrong"
+
+
+READ_COUNT = 100
+
+MANY_READS_PLUGIN = dedent(
+    f"""
+    import collectd
+
+
+    def read(instance):
+        collectd.Values(plugin="many_reads", plugin_instance=instance, type="gauge", values=[1]).dispatch()
+
+
+    def config(conf):
+        for i in range({READ_COUNT}):
+            collectd.register_read(read, data=str(i), name="read-%d" % i)
+
+
+    collectd.register_config(config)
+    """
+)
+
+
+# Without workers each read callback gets its own thread, with them all of the
+# callbacks share the pool and a single timer thread.  The runner's own main,
+# log, stats and batch flushing threads are on top of that.
+@pytest.mark.parametrize("worker_count,max_threads", [(0, None), (4, 4 + 6)])
+def test_python_runner_scheduler_threads(worker_count, max_threads):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        with open(os.path.join(tmpdir, "many_reads.py"), "w") as fd:
+            fd.write(MANY_READS_PLUGIN)
+
+        config = dedent(
+            f"""
+                monitors:
+                  - type: collectd/python
+                    moduleName: many_reads
+                    modulePaths:
+                     - {tmpdir}
+                    intervalSeconds: 1
+                    schedulerWorkerCount: {worker_count}
+                    pluginConfig: {{}}
+                """
+        )
+
+        with Agent.run(config) as agent:
+            for i in range(READ_COUNT):
+                assert wait_for(
+                    p(
+                        has_datapoint,
+                        agent.fake_services,
+                        dimensions={"plugin": "many_reads", "plugin_instance": str(i)},
+                    )
+                ), f"Didn't get datapoints from read callback {i}"
+
+            assert wait_for(p(regex_search_matches_output, agent.get_output, PID_RE.search))
+            runner = psutil.Process(int(PID_RE.search(agent.output).groups()[0]))
+
+            threads = runner.num_threads()
+            resident_kilobytes = runner.memory_info().rss // 1024
+            print(f"Runner with {worker_count} workers has {threads} threads and {resident_kilobytes}KiB resident")
+
+            if max_threads is None:
+                assert threads > READ_COUNT
+            else:
+                assert threads <= max_threads
@@ -0,0 +1,80 @@
+"""
+Compares sending many small messages through a PipeMessageWriter with each
+message in its own frame and with the messages batched together into batch
+frames.  Reports the messages sent per second, and the writes and CPU time per
+message, of each.  Everything that went through the pipe is unpacked
+afterwards, including the frames in batch frames, to check that no message
+was lost.
+"""
+from __future__ import division
+
+import os
+import tempfile
+import time
+
+from benchutil import CountingFile, cpu_seconds, report, start_pipe_reader
+from sfxrunner.messages import FRAME_HEADER, MSG_TYPE_BATCH, PipeMessageWriter
+
+MESSAGE_COUNT = 10 ** 5
+MSG_TYPE = 100
+PAYLOAD = b'{"metric":"my.gauge","value":1,"dimensions":{"plugin":"test"}}'
+
+
+def count_messages(data):
+    count = 0
+    offset = 0
+    while offset < len(data):
+        msg_type, size = FRAME_HEADER.unpack_from(data, offset)
+        offset += FRAME_HEADER.size
+        payload = data[offset : offset + size]
+        offset += size
+        if msg_type == MSG_TYPE_BATCH:
+            count += count_messages(payload)
+        elif msg_type == MSG_TYPE and payload == PAYLOAD:
+            count += 1
+        else:
+            raise ValueError("Unexpected message of type %d: %r" % (msg_type, payload[:100]))
+    return count
+
+
+def run(batched, output_path):
+    read_fd, write_fd = os.pipe()
+    reader = start_pipe_reader(read_fd, output_path)
+
+    writer = PipeMessageWriter(write_fd)
+    writer.open()
+    writer.file = counting_file = CountingFile(writer.file)
+    if batched:
+        writer.enable_batching([MSG_TYPE], 1.0)
+
+    start = time.time()
+    start_cpu = cpu_seconds()
+    for _ in range(MESSAGE_COUNT):
+        writer.send_bytes(MSG_TYPE, PAYLOAD)
+    writer.close()
+    cpu = cpu_seconds() - start_cpu
+    reader.wait()
+    elapsed = time.time() - start
+
+    with open(output_path, "rb") as output:
+        received = count_messages(output.read())
+    return {
+        "messagesPerSecond": MESSAGE_COUNT / elapsed,
+        "writesPerMessage": counting_file.writes / MESSAGE_COUNT,
+        "cpuMicrosecondsPerMessage": cpu / MESSAGE_COUNT * 1e6,
+        "received": received,
+    }
+
+
+def main():
+    output_dir = tempfile.mkdtemp()
+    output_path = os.path.join(output_dir, "pipe")
+    try:
+        report({"messageCount": MESSAGE_COUNT, "unbatched": run(False, output_path), "batched": run(True, output_path)})
+    finally:
+        os.remove(output_path)
+        os.rmdir(output_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""
+Helpers shared by the benchmark scripts in this dir.  perf_test.py runs the
+scripts with the agent's bundled Python, so they and this module have to work
+on Python 2.7.  Each script prints its results as JSON on its last line of
+output.
+"""
+from __future__ import print_function
+
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+
+def best_time(func, rounds):
+    """
+    Returns the shortest time in seconds that calling `func` took over the
+    given number of rounds
+    """
+    best = None
+    for _ in range(rounds):
+        start = time.time()
+        func()
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def cpu_seconds():
+    """
+    Returns the CPU time that this process has used so far
+    """
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+class CountingFile(object):
+    """
+    Wraps the unbuffered file of a PipeMessageWriter to count its writes, each
+    of which is a write syscall
+    """
+
+    def __init__(self, wrapped):
+        self.wrapped = wrapped
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        return self.wrapped.write(data)
+
+    def close(self):
+        self.wrapped.close()
+
+
+def start_pipe_reader(read_fd, output_path=os.devnull):
+    """
+    Starts a process that copies everything from the read end of a pipe to
+    the given file.  The pipe is drained by another process so that the CPU
+    time of this one only includes writing to it.
+    """
+    with open(output_path, "wb") as output:
+        reader = subprocess.Popen(["cat"], stdin=read_fd, stdout=output, close_fds=True)
+    os.close(read_fd)
+    return reader
+
+
+def report(results):
+    """
+    Prints the results of a benchmark for perf_test.py
+    """
+    json.dump(results, sys.stdout)
+    print()
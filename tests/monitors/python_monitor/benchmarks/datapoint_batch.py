@@ -0,0 +1,85 @@
+"""
+Compares how long it takes `sfxmonitor.output.Output` to send a large number of
+datapoints as a list of Datapoint namedtuples and as a DatapointBatch, with
+both the JSON and the binary codec.  Building the datapoints is included in the
+time since that is part of what the batch makes cheaper.  Reports the
+datapoints sent per second of each.
+"""
+from __future__ import division
+
+import threading
+
+import ujson
+from benchutil import best_time, report
+from sfxmonitor.datapoint import TYPE_GAUGE, DatapointBatch, gauge
+from sfxmonitor.output import Output
+from sfxrunner.codec import CODEC_BINARY, CODEC_JSON
+
+DATAPOINT_COUNT = 50000
+DIMENSION_SET_COUNT = 100
+ROUNDS = 5
+
+
+class DiscardingWriter(object):
+    """
+    Takes the place of the pipe to the agent.  Messages are still encoded the
+    same way that PipeMessageWriter would, but only their size is kept.
+    """
+
+    def __init__(self):
+        self.sent_bytes = 0
+
+    def send_msg(self, msg_type, msg_obj):  # pylint: disable=unused-argument
+        self.sent_bytes += len(ujson.dumps(msg_obj))
+
+    def send_bytes(self, msg_type, msg_bytes):  # pylint: disable=unused-argument
+        self.sent_bytes += len(msg_bytes)
+
+
+DIMENSION_SETS = [{"plugin": "bench", "host": "host-%d" % i} for i in range(DIMENSION_SET_COUNT)]
+
+
+def send_list(output):
+    output.send_datapoints(
+        [gauge("bench.gauge", i, DIMENSION_SETS[i % DIMENSION_SET_COUNT]) for i in range(DATAPOINT_COUNT)]
+    )
+
+
+def send_batch(output):
+    batch = DatapointBatch()
+    dimensions_ids = [batch.intern_dimensions(dims) for dims in DIMENSION_SETS]
+    for i in range(DATAPOINT_COUNT):
+        batch.add(TYPE_GAUGE, "bench.gauge", i, dimensions_ids[i % DIMENSION_SET_COUNT])
+    output.send_datapoints(batch)
+
+
+def new_output(codec):
+    """
+    Creates the Output in another thread, like the runner does when it
+    configures a monitor, since datapoints can't be sent from that thread.
+    """
+    ready = threading.Event()
+    ready.set()
+    outputs = []
+    thread = threading.Thread(target=lambda: outputs.append(Output(DiscardingWriter(), ready, codec)))
+    thread.start()
+    thread.join()
+    return outputs[0]
+
+
+def datapoints_per_second(send, codec):
+    return DATAPOINT_COUNT / best_time(lambda: send(new_output(codec)), ROUNDS)
+
+
+def main():
+    results = {"datapointCount": DATAPOINT_COUNT}
+    for codec in (CODEC_JSON, CODEC_BINARY):
+        results[codec] = {
+            "list": datapoints_per_second(send_list, codec),
+            "batch": datapoints_per_second(send_batch, codec),
+        }
+    report(results)
+
+
+if __name__ == "__main__":
+    main()
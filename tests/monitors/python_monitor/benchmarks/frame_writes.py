@@ -0,0 +1,69 @@
+"""
+Compares sending small messages through a PipeMessageWriter with each frame
+written as three writes of the message type, the size and the payload, which
+is how frames used to be written, and with the whole frame in a single write.
+Reports the messages sent per second, and the writes and CPU time per
+message, of each.
+"""
+from __future__ import division
+
+import os
+import struct
+import time
+
+from benchutil import CountingFile, cpu_seconds, report, start_pipe_reader
+from sfxrunner.messages import PipeMessageWriter
+
+MESSAGE_COUNT = 2 * 10 ** 5
+MSG_TYPE = 100
+PAYLOAD = b'{"metric":"my.gauge","value":1,"dimensions":{"plugin":"test"}}'
+
+
+class ThreeWritePipeMessageWriter(PipeMessageWriter):
+    """
+    Writes frames the way that PipeMessageWriter did before each frame was
+    sent with a single write
+    """
+
+    def _write_frame(self, msg_type, msg_bytes):
+        self.file.write(struct.pack(">i", msg_type))
+        self.file.write(struct.pack(">i", len(msg_bytes)))
+        self.file.write(msg_bytes)
+
+
+def run(writer_class):
+    read_fd, write_fd = os.pipe()
+    reader = start_pipe_reader(read_fd)
+
+    writer = writer_class(write_fd)
+    writer.open()
+    writer.file = counting_file = CountingFile(writer.file)
+
+    start = time.time()
+    start_cpu = cpu_seconds()
+    for _ in range(MESSAGE_COUNT):
+        writer.send_bytes(MSG_TYPE, PAYLOAD)
+    writer.close()
+    cpu = cpu_seconds() - start_cpu
+    reader.wait()
+    elapsed = time.time() - start
+
+    return {
+        "messagesPerSecond": MESSAGE_COUNT / elapsed,
+        "writesPerMessage": counting_file.writes / MESSAGE_COUNT,
+        "cpuMicrosecondsPerMessage": cpu / MESSAGE_COUNT * 1e6,
+    }
+
+
+def main():
+    report(
+        {
+            "messageCount": MESSAGE_COUNT,
+            "threeWrites": run(ThreeWritePipeMessageWriter),
+            "singleWrite": run(PipeMessageWriter),
+        }
+    )
+
+
+if __name__ == "__main__":
+    main()
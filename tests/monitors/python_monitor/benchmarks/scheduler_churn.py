@@ -0,0 +1,47 @@
+"""
+Measures how long it takes to schedule funcs on an IntervalScheduler and then
+cancel all of them, for increasing numbers of funcs.  The time per func should
+stay about the same as the number of funcs grows, since cancelling doesn't
+have to search the scheduled funcs.  Reports the microseconds per scheduled
+and cancelled func for each count.
+"""
+from __future__ import division
+
+import time
+
+from benchutil import report
+from sfxrunner.scheduler.interval import IntervalScheduler
+from sfxrunner.scheduler.stats import CallbackStats
+
+FUNC_COUNTS = (1000, 10000)
+ROUNDS = 3
+
+
+def noop():
+    pass
+
+
+def churn(func_count):
+    # The funcs are scheduled far enough out that none of them run during the
+    # benchmark
+    scheduler = IntervalScheduler(stats=CallbackStats())
+    try:
+        start = time.time()
+        cancels = [scheduler.run_on_interval(3600, noop, immediately=False) for _ in range(func_count)]
+        for cancel in cancels:
+            cancel()
+        return time.time() - start
+    finally:
+        scheduler.stop()
+
+
+def main():
+    results = {}
+    for func_count in FUNC_COUNTS:
+        best = min(churn(func_count) for _ in range(ROUNDS))
+        results[str(func_count)] = {"microsecondsPerFunc": best / func_count * 1e6}
+    report(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Compares the threads and memory used by a runner process when a plugin
+schedules many read callbacks on a SimpleScheduler, which starts a thread per
+callback, and on the fixed-size worker pool of `new_scheduler`.  Each scheduler
+is measured in a separate process so that they don't affect each other's
+memory.  Reports the thread count and resident memory growth of each.
+
+It only works on Linux since it reads the resident memory from /proc.
+"""
+from __future__ import division
+
+import json
+import subprocess
+import sys
+import threading
+import time
+
+from benchutil import report
+from sfxrunner.scheduler.pool import new_scheduler
+from sfxrunner.scheduler.stats import CallbackStats
+
+CALLBACK_COUNT = 500
+WORKER_COUNT = 4
+
+
+def resident_kilobytes():
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    raise ValueError("No VmRSS in /proc/self/status")
+
+
+def measure(worker_count):
+    runs = []
+
+    def read():
+        runs.append(1)
+
+    before = resident_kilobytes()
+    scheduler = new_scheduler(worker_count, stats=CallbackStats())
+    for i in range(CALLBACK_COUNT):
+        scheduler.run_on_interval(0.5, read, name="read-%d" % i)
+    # Let every callback run at least once
+    time.sleep(1.0)
+    result = {
+        "threads": threading.active_count(),
+        "residentKilobytesAdded": resident_kilobytes() - before,
+        "runs": len(runs),
+    }
+    scheduler.stop()
+    return result
+
+
+def main():
+    if len(sys.argv) > 1:
+        report(measure(int(sys.argv[1])))
+        return
+
+    results = {"callbackCount": CALLBACK_COUNT}
+    for key, worker_count in (("simple", 0), ("pool", WORKER_COUNT)):
+        output = subprocess.check_output([sys.executable, __file__, str(worker_count)])
+        results[key] = json.loads(output.decode("utf-8"))
+    report(results)
+
+
+if __name__ == "__main__":
+    main()
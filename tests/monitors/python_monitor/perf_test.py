@@ -0,0 +1,76 @@
+"""
+Benchmarks of the Python runner internals.  They run the scripts in the
+benchmarks dir with the agent's bundled Python, which is Python 2.7, and check
+that the optimized code paths are actually faster, or use fewer resources,
+than the ones they replace.
+"""
+import json
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from tests.paths import BUNDLE_DIR
+
+pytestmark = [pytest.mark.perf_test]
+
+BENCHMARKS_DIR = Path(__file__).parent / "benchmarks"
+
+
+def run_benchmark(script_name):
+    output = subprocess.check_output([str(BUNDLE_DIR / "bin" / "python"), str(BENCHMARKS_DIR / script_name)])
+    results = json.loads(output.decode("utf-8").strip().splitlines()[-1])
+    print(f"{script_name}: {json.dumps(results, indent=2, sort_keys=True)}")
+    return results
+
+
+def test_pipe_writer_single_write_frames():
+    results = run_benchmark("frame_writes.py")
+
+    three_writes = results["threeWrites"]
+    single_write = results["singleWrite"]
+    assert three_writes["writesPerMessage"] == 3
+    assert single_write["writesPerMessage"] == 1
+    assert single_write["messagesPerSecond"] > three_writes["messagesPerSecond"]
+    assert single_write["cpuMicrosecondsPerMessage"] < three_writes["cpuMicrosecondsPerMessage"]
+
+
+def test_pipe_writer_batching():
+    results = run_benchmark("batch_frames.py")
+
+    unbatched = results["unbatched"]
+    batched = results["batched"]
+    for mode in ("unbatched", "batched"):
+        assert results[mode]["received"] == results["messageCount"], f"Lost {mode} messages"
+    assert unbatched["writesPerMessage"] == 1
+    assert batched["writesPerMessage"] < unbatched["writesPerMessage"]
+    assert batched["cpuMicrosecondsPerMessage"] < unbatched["cpuMicrosecondsPerMessage"]
+    assert batched["messagesPerSecond"] > unbatched["messagesPerSecond"]
+
+
+def test_datapoint_batch_output():
+    results = run_benchmark("datapoint_batch.py")
+
+    for codec in ("json", "binary"):
+        assert results[codec]["batch"] > results[codec]["list"], f"DatapointBatch is slower with the {codec} codec"
+
+
+def test_interval_scheduler_cancel_scaling():
+    results = run_benchmark("scheduler_churn.py")
+
+    # Scheduling and cancelling each func should take about the same time no
+    # matter how many funcs there are.  A linear search per cancel would make
+    # it take 10 times as long with 10 times the funcs.
+    per_func = results["1000"]["microsecondsPerFunc"]
+    assert results["10000"]["microsecondsPerFunc"] < per_func * 3
+
+
+def test_pool_scheduler_threads_and_memory():
+    results = run_benchmark("scheduler_threads.py")
+
+    callback_count = results["callbackCount"]
+    assert results["simple"]["threads"] > callback_count
+    # The workers plus the timer and main threads
+    assert results["pool"]["threads"] <= 4 + 2
+    assert results["pool"]["runs"] >= callback_count, "Not every callback ran on the pool"
+    assert results["pool"]["residentKilobytesAdded"] < results["simple"]["residentKilobytesAdded"]
@@ -6,6 +6,7 @@ from textwrap import dedent
 
 import psutil
 import pytest
+from signalfx.generated_protocol_buffers import signal_fx_protocol_buffers_pb2 as sf_pbuf
 
 from tests.helpers.agent import Agent
 from tests.helpers.assertions import has_datapoint
@@ -91,3 +92,100 @@ def test_python_monitor_respects_python_path():
             assert wait_for(
                 p(has_datapoint, agent.fake_services, metric_name="my.gauge", dimensions={"a": "test"}, count=5)
             ), "Didn't get datapoints"
+
+
+def test_python_monitor_spreads_start_times():
+    interval = 10
+    config = dedent(
+        f"""
+            monitors:
+              - type: python-monitor
+                scriptFilePath: {script_path("spread.py")}
+                intervalSeconds: {interval}
+                spreadStartTimes: true
+            """
+    )
+
+    def first_run_offsets(fake_services):
+        offsets = {}
+        for dp in fake_services.datapoints:
+            if dp.metric == "first.run.offset":
+                offsets[[d.value for d in dp.dimensions if d.key == "callback"][0]] = dp.value.doubleValue
+        return offsets
+
+    with Agent.run(config) as agent:
+        assert wait_for(
+            lambda: len(first_run_offsets(agent.fake_services)) == 500, timeout_seconds=interval * 3
+        ), "Didn't get the first run of every callback"
+
+        offsets = list(first_run_offsets(agent.fake_services).values())
+
+    # The first runs should be spread evenly across the interval instead of
+    # all happening right away
+    buckets = [0] * 10
+    for offset in offsets:
+        buckets[min(int(offset / interval * len(buckets)), len(buckets) - 1)] += 1
+    print("First run offsets per tenth of the interval: %s" % buckets)
+
+    assert min(offsets) < interval * 0.1
+    assert max(offsets) > interval * 0.9
+    assert all(25 <= count <= 75 for count in buckets), f"Uneven distribution of first runs: {buckets}"
+
+
+def received_indexes(fake_services, metric_name):
+    return {
+        [d.value for d in dp.dimensions if d.key == "index"][0]
+        for dp in fake_services.datapoints
+        if dp.metric == metric_name
+    }
+
+
+# With the large max size, the datapoints only get to the agent if the batch is
+# flushed on the interval.  With the small one, most of them are sent in batches
+# that are flushed because they are full.
+@pytest.mark.parametrize("batch_max_bytes", [10 * 1024 * 1024, 256])
+def test_python_monitor_batches_datapoints(batch_max_bytes):
+    config = dedent(
+        f"""
+            monitors:
+              - type: python-monitor
+                scriptFilePath: {script_path("batching.py")}
+                intervalSeconds: 3600
+                batchFlushIntervalSeconds: 1
+                batchMaxBytes: {batch_max_bytes}
+                a: test
+            """
+    )
+
+    with Agent.run(config) as agent:
+        assert wait_for(
+            lambda: len(received_indexes(agent.fake_services, "batched.gauge")) == 200
+        ), "Didn't get every batched datapoint"
+        assert has_datapoint(agent.fake_services, metric_name="batched.gauge", dimensions={"a": "test"})
+
+
+def test_python_monitor_sends_datapoint_batches():
+    config = dedent(
+        f"""
+            monitors:
+              - type: python-monitor
+                scriptFilePath: {script_path("datapoint_batch.py")}
+                intervalSeconds: 1
+                a: test
+            """
+    )
+
+    with Agent.run(config) as agent:
+        assert wait_for(
+            lambda: len(received_indexes(agent.fake_services, "batch.gauge")) == 200
+        ), "Didn't get every datapoint in the batch"
+        assert wait_for(
+            p(
+                has_datapoint,
+                agent.fake_services,
+                metric_name="batch.counter",
+                dimensions={"a": "test"},
+                value=200,
+                metric_type=sf_pbuf.CUMULATIVE_COUNTER,
+            )
+        ), "Didn't get the cumulative counter in the batch"
@@ -0,0 +1,6 @@
+DATAPOINT_COUNT = 200
+
+
+def run(config, output):
+    for i in range(DATAPOINT_COUNT):
+        output.send_gauge("batched.gauge", i, {"index": str(i), "a": config["a"]})
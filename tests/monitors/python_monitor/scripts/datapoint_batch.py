@@ -0,0 +1,11 @@
+from sfxmonitor.datapoint import DatapointBatch
+
+DATAPOINT_COUNT = 200
+
+
+def run(config, output):
+    batch = DatapointBatch()
+    for i in range(DATAPOINT_COUNT):
+        batch.add_gauge("batch.gauge", i, {"index": str(i), "a": config["a"]})
+    batch.add_cumulative("batch.counter", DATAPOINT_COUNT, {"a": config["a"]})
+    output.send_datapoints(batch)
@@ -0,0 +1,32 @@
+from sfxrunner.scheduler.clock import monitor_spread_key, monotonic
+from sfxrunner.scheduler.pool import new_scheduler
+
+CALLBACK_COUNT = 500
+
+
+class Monitor(object):
+    def __init__(self, output):
+        self.output = output
+        self.scheduler = None
+
+    def configure(self, config):
+        self.scheduler = new_scheduler(8, spread_key=monitor_spread_key(config))
+        started = monotonic()
+
+        def make_callback(index):
+            sent = []
+
+            def callback():
+                # Only the offset of the first run from when it was scheduled
+                # is of interest
+                if not sent:
+                    sent.append(True)
+                    self.output.send_gauge("first.run.offset", monotonic() - started, {"callback": str(index)})
+
+            return callback
+
+        for i in range(CALLBACK_COUNT):
+            self.scheduler.run_on_interval(config["intervalSeconds"], make_callback(i), name="callback-%d" % i)
+
+    def shutdown(self):
+        self.scheduler.stop()